@@ -0,0 +1,95 @@
+class AdaptiveController:
+    """Picks JPEG quality, resolution scale and frame rate from client feedback.
+
+    Every `interval` seconds the worst report received from any client is
+    compared with the latency target. When over target (and not already
+    recovering) the cheapest knob is turned down first: quality, then
+    resolution, then frame rate. When comfortably under target they are
+    restored in the opposite order, but only after a few quiet intervals so
+    the settings do not oscillate around the link capacity. Resolution is
+    never raised beyond what the largest client display can show.
+    """
+
+    def __init__(self, target_latency_ms=150, max_fps=30, min_fps=5,
+                 min_quality=20, max_quality=90, min_scale=0.25, interval=0.5, hold=2):
+        self.target_latency_ms = target_latency_ms
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.min_scale = min_scale
+        self.interval = interval
+        self.hold = hold
+
+        self.quality = max_quality
+        self.scale = 1.0
+        self.fps = max_fps
+
+        self._reports = {}
+        self._last_adjust = None
+        self._last_latency_ms = None
+        self._quiet = 0
+
+    def report(self, client, feedback):
+        self._reports[client] = feedback
+
+    def forget(self, client):
+        self._reports.pop(client, None)
+
+    def _max_scale(self, source_size):
+        widths = [f.display_width for f in self._reports.values() if f.display_width]
+        heights = [f.display_height for f in self._reports.values() if f.display_height]
+        if source_size is None or not widths or not heights:
+            return 1.0
+        width, height = source_size
+        return max(self.min_scale, min(1.0, max(widths) / width, max(heights) / height))
+
+    def adjust(self, now, source_size=None):
+        """Re-evaluate the settings; returns True if anything changed."""
+        if self._last_adjust is not None and now - self._last_adjust < self.interval:
+            return False
+        self._last_adjust = now
+        if not self._reports:
+            return False
+
+        max_scale = self._max_scale(source_size)
+        reports = list(self._reports.values())
+        self._reports.clear()
+        latency_ms = max(f.latency_us for f in reports) / 1000
+        decode_ms = max(f.decode_us for f in reports) / 1000
+        queue_depth = max(f.queue_depth for f in reports)
+
+        previous = (self.quality, self.scale, self.fps)
+        self.scale = min(self.scale, max_scale)
+
+        decode_bound = decode_ms > 1000 / self.fps or queue_depth > 1
+        # While a backlog is draining latency stays high for a while even
+        # after the bitrate is cut; don't keep cutting while it is falling.
+        recovering = self._last_latency_ms is not None and latency_ms < self._last_latency_ms * 0.9
+        self._last_latency_ms = latency_ms
+
+        if decode_bound or (latency_ms > self.target_latency_ms and not recovering):
+            self._quiet = 0
+            if decode_bound and self.scale > self.min_scale:
+                # Decode cost follows pixel count, so resolution helps most
+                self.scale = max(self.min_scale, self.scale * 0.75)
+            elif self.quality > self.min_quality:
+                self.quality = max(self.min_quality, self.quality - 10)
+            elif self.scale > self.min_scale:
+                self.scale = max(self.min_scale, self.scale * 0.75)
+            elif self.fps > self.min_fps:
+                self.fps = max(self.min_fps, self.fps * 0.75)
+        elif latency_ms > self.target_latency_ms / 2:
+            self._quiet = 0
+        elif self._quiet < self.hold:
+            self._quiet += 1
+        else:
+            self._quiet = 0
+            if self.fps < self.max_fps:
+                self.fps = min(self.max_fps, self.fps / 0.75)
+            elif self.scale < max_scale:
+                self.scale = min(max_scale, self.scale / 0.75)
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + 5)
+
+        return (self.quality, self.scale, self.fps) != previous
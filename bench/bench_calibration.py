@@ -0,0 +1,152 @@
+"""Benchmark chessboard capture and calibration on synthetic views.
+
+A camera with known intrinsics and distortion looks at a 9x6 board from
+views along a slow, jittery hand-held trajectory, like half a minute of
+calibration capture.
+
+    detection    findChessboardCorners at full resolution against
+                 calibration_capture.detect_chessboard (downscaled search,
+                 full-resolution cornerSubPix) on rendered frames
+    calibration  calibrateCamera time and focal-length error against the
+                 number of views, for the first N views as captured and
+                 for the KeyframeSelector set
+
+    python bench/bench_calibration.py --views 900 --width 1280
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from calibration_capture import (
+    DETECT_FLAGS, KeyframeSelector, board_points, calibrate, detect_chessboard
+)
+
+PATTERN = (9, 6)
+DIST = np.array([-0.25, 0.08, 0.0005, -0.0005, 0.0])
+
+
+def camera(width, height):
+    return np.array([[0.9 * width, 0, width / 2], [0, 0.9 * width, height / 2], [0, 0, 1]])
+
+
+def trajectory(count, seed=1):
+    """(rvec, tvec) of a board waved slowly in front of the camera."""
+    rng = np.random.default_rng(seed)
+    centre = board_points(PATTERN)[:, :2].mean(axis=0)
+    poses = []
+    for i in range(count):
+        phase = i / count * 2 * np.pi
+        angles = np.radians([25 * np.sin(3 * phase), 25 * np.sin(2 * phase + 1), 15 * np.sin(phase)])
+        angles += rng.normal(0, np.radians(0.5), 3)
+        rotation, _ = cv2.Rodrigues(angles)
+        position = np.array([3 * np.sin(phase), 2 * np.sin(2 * phase), 16 + 4 * np.sin(phase / 2)])
+        position += rng.normal(0, 0.05, 3)
+        tvec = position - rotation @ np.array([centre[0], centre[1], 0])
+        poses.append((angles, tvec))
+    return poses
+
+
+def project(poses, camera_matrix, noise=0.2, seed=2):
+    rng = np.random.default_rng(seed)
+    objp = board_points(PATTERN)
+    views = []
+    for rvec, tvec in poses:
+        points, _ = cv2.projectPoints(objp, rvec, tvec, camera_matrix, DIST)
+        views.append((points + rng.normal(0, noise, points.shape)).astype(np.float32))
+    return views
+
+
+def render(rvec, tvec, camera_matrix, size, square=40):
+    """Image of the board seen from a pose (pinhole, without distortion)."""
+    cols, rows = PATTERN
+    margin = square
+    texture = np.full(((rows + 1) * square + 2 * margin, (cols + 1) * square + 2 * margin), 255, np.uint8)
+    for r in range(rows + 1):
+        for c in range(cols + 1):
+            if (r + c) % 2 == 0:
+                y, x = margin + r * square, margin + c * square
+                texture[y:y + square, x:x + square] = 0
+    # texture pixel -> board units; pixel centres are at integer coordinates,
+    # so inner corner (0, 0) lies half a pixel before margin + square
+    offset = (margin + square - 0.5) / square
+    to_board = np.array([[1 / square, 0, -offset], [0, 1 / square, -offset], [0, 0, 1]])
+    rotation, _ = cv2.Rodrigues(rvec)
+    homography = camera_matrix @ np.column_stack([rotation[:, 0], rotation[:, 1], tvec])
+    return cv2.warpPerspective(texture, homography @ to_board, size, borderValue=160)
+
+
+def bench_detection(size, frames):
+    camera_matrix = camera(*size)
+    poses = trajectory(frames)
+    images = [render(rvec, tvec, camera_matrix, size) for rvec, tvec in poses]
+    truth = [cv2.projectPoints(board_points(PATTERN), r, t, camera_matrix, None)[0] for r, t in poses]
+
+    def full(gray):
+        found, corners = cv2.findChessboardCorners(gray, PATTERN, DETECT_FLAGS)
+        if not found:
+            return None
+        return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1),
+                                (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001))
+
+    print(f"Detection on {frames} rendered {size[0]}x{size[1]} frames:")
+    for name, detect in (('full resolution', full),
+                         ('downscaled 640', lambda g: detect_chessboard(g, PATTERN, 640)),
+                         ('downscaled 480', lambda g: detect_chessboard(g, PATTERN, 480))):
+        times, errors = [], []
+        for gray, expected in zip(images, truth):
+            start = time.perf_counter()
+            corners = detect(gray)
+            times.append(time.perf_counter() - start)
+            if corners is not None:
+                errors.append(np.abs(corners.reshape(-1, 2) - expected.reshape(-1, 2)).max())
+        print(f"  {name:16s} {np.median(times) * 1000:7.1f} ms/frame  found {len(errors):3d}/{frames}"
+              f"  max corner error {np.median(errors) if errors else float('nan'):.3f} px (median)")
+
+
+def bench_calibration(size, views_count, counts, max_keyframes):
+    camera_matrix = camera(*size)
+    views = project(trajectory(views_count), camera_matrix)
+
+    selector = KeyframeSelector(max_keyframes=max_keyframes)
+    start = time.perf_counter()
+    for corners in views:
+        selector.offer(corners, PATTERN, size)
+    select_ms = (time.perf_counter() - start) * 1000
+    print(f"\nKeyframeSelector kept {len(selector)} of {views_count} views "
+          f"({select_ms / views_count:.3f} ms per view)")
+
+    print("\nCalibration time against views used:")
+    print(f"  {'views':>6} {'seconds':>9} {'rms px':>8} {'fx error':>9}")
+    for count in counts:
+        if count > views_count:
+            break
+        rms, found_matrix, _, seconds = calibrate(views[:count], PATTERN, size)
+        error = abs(found_matrix[0, 0] - camera_matrix[0, 0]) / camera_matrix[0, 0]
+        print(f"  {count:6d} {seconds:9.2f} {rms:8.3f} {error:9.2%}   first {count} as captured")
+    rms, found_matrix, _, seconds = calibrate(selector.keyframes, PATTERN, size)
+    error = abs(found_matrix[0, 0] - camera_matrix[0, 0]) / camera_matrix[0, 0]
+    print(f"  {len(selector):6d} {seconds:9.2f} {rms:8.3f} {error:9.2%}   keyframes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chessboard detection and calibration")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--views', type=int, default=900, help="captured views (30 s at 30 fps)")
+    parser.add_argument('--detect-frames', type=int, default=20)
+    parser.add_argument('--max-keyframes', type=int, default=40)
+    parser.add_argument('--counts', default='10,20,40,80,160,320,900')
+    args = parser.parse_args()
+
+    size = (args.width, args.width * 3 // 4)
+    bench_detection(size, args.detect_frames)
+    bench_calibration(size, args.views, [int(c) for c in args.counts.split(',')], args.max_keyframes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Compare the tile-delta stream with full JPEG frames: bandwidth and decode time.
+
+Scenes are built from the bundled saved_frame.jpg (scaled by --scales) at
+--fps, with a keyframe every --keyframe-interval seconds of stream time:
+
+    static    the image with +-2 levels of sensor noise
+    object    as static, with a 80x120 block crossing the frame
+    people    as static, with four such blocks
+    lighting  brightness drifting by 1 level per frame, which changes every
+              tile and makes the encoder fall back to keyframes
+
+For each scene both encodings are produced from the same frames, then
+decoded the way FrameReceiver does it: at full size and for a --display
+sized window (reduced JPEG decode).
+
+    python bench/bench_delta.py --frames 150 --scales 1,2
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from decoding import decode_frame
+from protocol import CODEC_JPEG, FrameInfo
+from tile_codec import TileDecoder, TileEncoder
+
+SCENES = ('static', 'object', 'people', 'lighting')
+
+
+def scene_frames(base, scene, count, seed=0):
+    rng = np.random.default_rng(seed)
+    height, width = base.shape[:2]
+    noise = [rng.integers(-2, 3, base.shape, dtype=np.int16) for _ in range(4)]
+    blocks = {'object': 1, 'people': 4}.get(scene, 0)
+    for i in range(count):
+        frame = np.clip(base.astype(np.int16) + noise[i % len(noise)], 0, 255).astype(np.uint8)
+        if scene == 'lighting':
+            frame = cv2.add(frame, np.full_like(frame, i % 64))
+        for b in range(blocks):
+            x = (b * width // 4 + i * 7) % (width - 80)
+            y = height // 3 + (b % 2) * height // 4
+            cv2.rectangle(frame, (x, y), (x + 80, y + 120), (40 + 50 * b, 90, 200), -1)
+        yield frame
+
+
+def encode_full(frames, quality):
+    payloads, elapsed = [], 0.0
+    for seq, frame in enumerate(frames):
+        start = time.perf_counter()
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        elapsed += time.perf_counter() - start
+        height, width = frame.shape[:2]
+        payloads.append((encoded.tobytes(), FrameInfo(seq, 0, width, height, CODEC_JPEG, 0)))
+    return payloads, elapsed
+
+
+def encode_tiles(frames, quality, keyframe_every, tile_size):
+    encoder = TileEncoder(tile_size, keyframe_interval=float('inf'), quality=quality)
+    payloads, elapsed = [], 0.0
+    for seq, frame in enumerate(frames):
+        if seq % keyframe_every == 0:
+            encoder.request_keyframe()
+        start = time.perf_counter()
+        payload, codec, flags = encoder.encode(frame, seq)
+        elapsed += time.perf_counter() - start
+        height, width = frame.shape[:2]
+        payloads.append((payload, FrameInfo(seq, 0, width, height, codec, flags)))
+    return payloads, elapsed, encoder
+
+
+def decode_all(payloads, target_size):
+    decoder = TileDecoder()
+    start = time.perf_counter()
+    for payload, info in payloads:
+        if TileDecoder.wants(info):
+            decoder.decode(payload, info, target_size)
+        else:
+            decode_frame(payload, target_size)
+    return (time.perf_counter() - start) / len(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare tile-delta frames with full JPEG frames")
+    parser.add_argument('--image', default=os.path.join(ROOT, 'saved_frame.jpg'))
+    parser.add_argument('--scales', default='1,2')
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--keyframe-interval', type=float, default=2.0, help="seconds of stream time")
+    parser.add_argument('--tile-size', type=int, default=64)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--display', default='640x480', help="window size for the reduced decode")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        sys.exit(f"Cannot read {args.image}")
+    display = tuple(int(v) for v in args.display.split('x'))
+    keyframe_every = max(1, round(args.keyframe_interval * args.fps))
+
+    print(f"{args.frames} frames at {args.fps:.0f} fps, keyframe every {keyframe_every} frames,"
+          f" {args.tile_size}px tiles, quality {args.quality}; per frame averages")
+    print(f"  {'size':>9} {'scene':8s} {'mode':5s} {'KB':>7} {'Mbit/s':>7} {'enc ms':>7}"
+          f" {'dec ms':>7} {'dec@' + args.display:>12} {'tiles':>6} {'keys':>5}")
+    for scale in (float(s) for s in args.scales.split(',')):
+        base = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        size = f"{base.shape[1]}x{base.shape[0]}"
+        for scene in SCENES:
+            frames = list(scene_frames(base, scene, args.frames))
+            full, full_encode = encode_full(frames, args.quality)
+            tiles, tiles_encode, encoder = encode_tiles(frames, args.quality, keyframe_every, args.tile_size)
+            runs = (('jpeg', full, full_encode, '', ''),
+                    ('tiles', tiles, tiles_encode, f"{encoder.tiles_sent / max(encoder.deltas, 1):6.1f}",
+                     f"{encoder.keyframes:5d}"))
+            for mode, payloads, encode_time, tile_count, keys in runs:
+                size_bytes = np.mean([len(p) for p, _ in payloads])
+                print(f"  {size:>9} {scene:8s} {mode:5s} {size_bytes / 1024:7.1f}"
+                      f" {size_bytes * 8 * args.fps / 1e6:7.2f} {encode_time / len(payloads) * 1000:7.2f}"
+                      f" {decode_all(payloads, None) * 1000:7.2f} {decode_all(payloads, display) * 1000:12.2f}"
+                      f" {tile_count:>6} {keys:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Compare the old `data += recv()` framing loop with FrameReader.
+
+Frames are pushed through a local socketpair by a sender thread, so the
+numbers include real recv() chunking but no network latency.
+
+    python bench/bench_frame_reader.py
+"""
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_reader import FrameReader
+
+SIZES = [100 * 1024, 250 * 1024, 500 * 1024, 1024 * 1024, 2 * 1024 * 1024]
+FRAMES = 50
+
+
+def send_frames(sock, payload, count):
+    header = struct.pack('I', len(payload))
+    for _ in range(count):
+        sock.sendall(header)
+        sock.sendall(payload)
+    sock.shutdown(socket.SHUT_WR)
+
+
+def legacy_loop(sock):
+    """The framing loop from the original receive_video()."""
+    frames = 0
+    while True:
+        length_data = sock.recv(4)
+        if len(length_data) < 4:
+            return frames
+        length = struct.unpack('I', length_data)[0]
+        data = b""
+        while len(data) < length:
+            data += sock.recv(length - len(data))
+        frames += 1
+
+
+def frame_reader_loop(sock):
+    reader = FrameReader(sock)
+    frames = 0
+    while reader.read_frame() is not None:
+        frames += 1
+    return frames
+
+
+def run(receive, size):
+    payload = os.urandom(size)
+    rx, tx = socket.socketpair()
+    sender = threading.Thread(target=send_frames, args=(tx, payload, FRAMES))
+    start = time.perf_counter()
+    sender.start()
+    frames = receive(rx)
+    elapsed = time.perf_counter() - start
+    sender.join()
+    rx.close()
+    tx.close()
+    assert frames == FRAMES, frames
+    return elapsed / FRAMES
+
+
+def main():
+    print(f"{'frame size':>12} {'legacy ms':>10} {'reader ms':>10} {'speedup':>8}")
+    for size in SIZES:
+        legacy = run(legacy_loop, size)
+        reader = run(frame_reader_loop, size)
+        print(f"{size // 1024:>9} KB {legacy * 1000:>10.3f} {reader * 1000:>10.3f} {legacy / reader:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
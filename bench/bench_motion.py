@@ -0,0 +1,117 @@
+"""Benchmark ROI motion detection against the number of ROIs.
+
+A synthetic scene (noisy static background with a bright square moving
+across it) is analyzed with
+
+    per-roi    a loop over the ROIs, each with its own full-resolution crop,
+               grayscale conversion and running background
+    detector   motion.MotionDetector: one downscaled grayscale background and
+               an integral image scoring every ROI at once
+
+and the time per frame is reported with the frame rate it can sustain. The
+events of the detector are checked against the ROIs the square passes.
+
+    python bench/bench_motion.py --width 1280 --rois 10,50,200,1000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from motion import MotionDetector
+
+
+def scene(size, frames, seed=0):
+    """Frames of a static scene with a 60x60 square crossing it."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (31, 31), 0)
+    for i in range(frames):
+        frame = background.copy()
+        noise = rng.integers(-4, 5, (height, width, 1), dtype=np.int16)
+        frame = np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        x = int(i / frames * (width - 60))
+        y = height // 2 - 30
+        frame[y:y + 60, x:x + 60] = 255
+        yield frame, (x, y, 60, 60)
+
+
+def grid_rois(count, size):
+    """count ROIs tiled over the frame."""
+    columns = int(np.ceil(np.sqrt(count * size[0] / size[1])))
+    rows = int(np.ceil(count / columns))
+    w, h = size[0] // columns, size[1] // rows
+    return np.array([((i % columns) * w, (i // columns) * h, w, h) for i in range(count)])
+
+
+class PerRoi:
+    """The straightforward way: every ROI analyzed on its own."""
+
+    def __init__(self, rects, learning_rate=0.05, pixel_threshold=25):
+        self.rects = rects
+        self.learning_rate = learning_rate
+        self.pixel_threshold = pixel_threshold
+        self.backgrounds = [None] * len(rects)
+
+    def process(self, frame):
+        scores = np.zeros(len(self.rects))
+        for i, (x, y, w, h) in enumerate(self.rects.tolist()):
+            crop = cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY).astype(np.float32)
+            if self.backgrounds[i] is None:
+                self.backgrounds[i] = crop
+                continue
+            scores[i] = np.mean(cv2.absdiff(crop, self.backgrounds[i]) > self.pixel_threshold)
+            cv2.accumulateWeighted(crop, self.backgrounds[i], self.learning_rate)
+        return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ROI motion detection")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--rois', default='10,50,200,1000')
+    parser.add_argument('--analysis-width', type=int, default=160)
+    args = parser.parse_args()
+
+    size = (args.width, args.width * 3 // 4)
+    frames = list(scene(size, args.frames))
+    warm_up = MotionDetector(analysis_width=args.analysis_width)
+    for frame, _ in frames[:5]:
+        warm_up.process(frame)
+    print(f"{args.frames} frames of {size[0]}x{size[1]}, ms per frame (frames per second):")
+    print(f"  {'rois':>5} {'per-roi':>16} {'detector':>16}  events")
+    for count in (int(c) for c in args.rois.split(',')):
+        rects = grid_rois(count, size)
+        per_roi = PerRoi(rects)
+        detector = MotionDetector(analysis_width=args.analysis_width)
+        detector.set_rois(rects)
+
+        started = time.perf_counter()
+        for frame, _ in frames:
+            per_roi.process(frame)
+        naive = (time.perf_counter() - started) / len(frames) * 1000
+
+        events = []
+        started = time.perf_counter()
+        for frame, _ in frames:
+            events += detector.process(frame)
+        fast = (time.perf_counter() - started) / len(frames) * 1000
+
+        # every ROI the square crossed should have started (and usually ended)
+        squares = [square for _, square in frames[1:]]
+        crossed = {i for i, (x, y, w, h) in enumerate(rects.tolist())
+                   if any(x < bx + bw and bx < x + w and y < by + bh and by < y + h
+                          for bx, by, bw, bh in squares)}
+        fired = {event.roi_id for event in events if event.started}
+        check = "ok" if fired <= crossed and len(fired) >= 0.9 * len(crossed) else f"{len(fired)}/{len(crossed)}"
+        print(f"  {count:5d} {naive:8.2f} ({1000 / naive:5.0f}) {fast:8.2f} ({1000 / fast:5.0f})"
+              f"  {len(events)} {check}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Benchmark the client's hot path stage by stage and end to end.
+
+Stages, timed separately for every frame size and JPEG quality:
+
+    framing   FrameReader over a local socketpair
+    decode    cv2.imdecode(IMREAD_COLOR)
+    convert   cv2.cvtColor(BGR2RGB)
+    qimage    QImage + QPixmap.fromImage
+    scale     QPixmap.scaled to the 1280x960 video label
+    display   display.py's path instead of convert+qimage+scale: one BGRA
+              cvtColor into a reused buffer, QImage.scaled, QPixmap.fromImage
+
+The chain run streams frames from a ReplayServer at each frame rate and runs
+all stages per frame on one thread, measuring latency from the capture
+timestamp in the v2 header to the scaled pixmap.
+
+Qt runs on the offscreen platform, so no display is needed. Results are
+written as JSON; pass --compare with an earlier file to see the change.
+
+    python bench/bench_pipeline.py --output before.json
+    python bench/bench_pipeline.py --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication
+
+from display import frame_to_qimage, scaled_pixmap
+from frame_reader import FrameReader
+from protocol import LEGACY_HEADER, monotonic_us
+from replay import ReplayServer, Schedule, SyntheticSource
+from stream_stats import StreamStats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, 'saved_frame.jpg')
+LABEL_SIZE = QSize(1280, 960)
+
+SIZES = [(640, 480), (1280, 960), (1920, 1440), (2560, 1920)]
+QUALITIES = [50, 80, 95]
+RATES = ['15', '30', '60', 'max']
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(samples_s):
+    samples = np.array(samples_s) * 1000
+    return {
+        'fps': round(1000 / samples.mean(), 1),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+    }
+
+
+def encode_sample(size, quality):
+    image = cv2.resize(cv2.imread(SAMPLE), size, interpolation=cv2.INTER_LINEAR)
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
+
+
+def time_framing(payload, frames):
+    rx, tx = socket.socketpair()
+    header = LEGACY_HEADER.pack(len(payload))
+
+    def send():
+        for _ in range(frames):
+            tx.sendall(header)
+            tx.sendall(payload)
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    reader = FrameReader(rx)
+    samples = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        reader.read_frame()
+        samples.append(time.perf_counter() - start)
+    sender.join()
+    rx.close()
+    tx.close()
+    return samples
+
+
+def time_stage(function, argument, frames):
+    samples = []
+    result = None
+    for _ in range(frames):
+        start = time.perf_counter()
+        result = function(argument)
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def to_pixmap(frame_rgb):
+    h, w, ch = frame_rgb.shape
+    qimage = QImage(frame_rgb.data, w, h, ch * w, QImage.Format_RGB888)
+    return QPixmap.fromImage(qimage)
+
+
+def run_stages(sizes, qualities, frames):
+    results = []
+    for size in sizes:
+        for quality in qualities:
+            payload = encode_sample(size, quality)
+            data = np.frombuffer(payload, dtype=np.uint8)
+            stages = {'framing': summarize(time_framing(payload, frames))}
+
+            samples, frame = time_stage(lambda d: cv2.imdecode(d, cv2.IMREAD_COLOR), data, frames)
+            stages['decode'] = summarize(samples)
+            samples, frame_rgb = time_stage(lambda f: cv2.cvtColor(f, cv2.COLOR_BGR2RGB), frame, frames)
+            stages['convert'] = summarize(samples)
+            samples, pixmap = time_stage(to_pixmap, frame_rgb, frames)
+            stages['qimage'] = summarize(samples)
+            samples, _ = time_stage(lambda p: p.scaled(LABEL_SIZE, Qt.KeepAspectRatio), pixmap, frames)
+            stages['scale'] = summarize(samples)
+            buffer = frame_to_qimage(frame)[1]
+            samples, _ = time_stage(lambda f: scaled_pixmap(frame_to_qimage(f, buffer)[0], LABEL_SIZE), frame, frames)
+            stages['display'] = summarize(samples)
+
+            result = {'size': f"{size[0]}x{size[1]}", 'quality': quality, 'bytes': len(payload),
+                      'stages': stages, 'peak_rss_mb': peak_rss_mb()}
+            results.append(result)
+            print(f"{result['size']:>9} q{quality:<3} {len(payload) // 1024:6d} KB  " + "  ".join(
+                f"{name} {stage['p50_ms']:7.3f}" for name, stage in stages.items()))
+    return results
+
+
+def run_chain(sizes, rates, duration, quality=80):
+    results = []
+    for size in sizes:
+        source = SyntheticSource(SAMPLE, [size], quality)
+        for rate in rates:
+            server = ReplayServer(source, Schedule.parse(rate), '127.0.0.1', 0)
+            server.start()
+            sock = socket.create_connection(('127.0.0.1', server.port))
+            reader = FrameReader(sock, negotiate=True)
+            stats = None
+            latencies = []
+            started = time.monotonic()
+            while time.monotonic() - started < duration:
+                payload = reader.read_frame()
+                if payload is None:
+                    break
+                frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+                # Only the time matters; the scaled pixmap itself is thrown away
+                to_pixmap(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).scaled(LABEL_SIZE, Qt.KeepAspectRatio)
+                if stats is None:
+                    stats = StreamStats(reader.clock_offset)
+                stats.update(reader.info, monotonic_us())
+                latencies.append(stats.latency_us / 1000)
+            elapsed = time.monotonic() - started
+            sock.close()
+            server.stop()
+
+            latencies = np.array(latencies)
+            result = {
+                'size': f"{size[0]}x{size[1]}", 'rate': rate,
+                'fps': round(len(latencies) / elapsed, 1),
+                'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+                'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+                'drop_rate': round(stats.drop_rate, 4),
+                'peak_rss_mb': peak_rss_mb(),
+            }
+            results.append(result)
+            print(f"{result['size']:>9} rate {rate:>4}: {result['fps']:6.1f} fps  "
+                  f"p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+                  f"drops {result['drop_rate']:.1%}  rss {result['peak_rss_mb']} MB")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """Print the p50 change of every stage and chain case present in both runs."""
+    print(f"\nChange from {old.get('commit')} to {new.get('commit')} (p50, negative is faster):")
+    old_stages = {(r['size'], r['quality']): r['stages'] for r in old.get('stages', [])}
+    for result in new['stages']:
+        before = old_stages.get((result['size'], result['quality']))
+        if not before:
+            continue
+        changes = []
+        for name, stage in result['stages'].items():
+            if name in before and before[name]['p50_ms']:
+                changes.append(f"{name} {(stage['p50_ms'] / before[name]['p50_ms'] - 1):+6.1%}")
+        print(f"{result['size']:>9} q{result['quality']:<3} " + "  ".join(changes))
+    old_chain = {(r['size'], r['rate']): r for r in old.get('chain', [])}
+    for result in new['chain']:
+        before = old_chain.get((result['size'], result['rate']))
+        if before and before['p50_ms']:
+            print(f"{result['size']:>9} rate {result['rate']:>4}: latency "
+                  f"{(result['p50_ms'] / before['p50_ms'] - 1):+6.1%}  fps {result['fps'] - before['fps']:+.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark receive -> decode -> convert -> display")
+    parser.add_argument('--frames', type=int, default=100, help="iterations per stage measurement")
+    parser.add_argument('--duration', type=float, default=3, help="seconds per chain run")
+    parser.add_argument('--quick', action='store_true', help="two sizes, one quality, two rates")
+    parser.add_argument('--output', help="JSON results file (default: pipeline-<commit>.json)")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    sizes, qualities, rates = SIZES, QUALITIES, RATES
+    if args.quick:
+        sizes, qualities, rates = SIZES[:2], [80], ['30', 'max']
+
+    commit = git_commit()
+    print("Stages (p50 ms):")
+    stages = run_stages(sizes, qualities, args.frames)
+    print("\nChain:")
+    chain = run_chain(sizes, rates, args.duration)
+
+    results = {
+        'commit': commit,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'stages': stages,
+        'chain': chain,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    output = args.output or f"pipeline-{commit or 'unknown'}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    del app
+
+
+if __name__ == '__main__':
+    main()
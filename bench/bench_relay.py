@@ -0,0 +1,105 @@
+"""Benchmark the fan-out relay against viewers connecting to the camera directly.
+
+A replay.py server plays the camera (a synthetic JPEG at --rate fps) in its
+own process. For each viewer count the viewers (replay.LoadClient threads in
+this process) either connect to it directly or to a relay.py process in
+front of it. CPU time of the camera and relay processes is read from /proc
+over the measuring window, so viewer threads do not count.
+
+    python bench/bench_relay.py --viewers 1,10,50,100 --duration 5
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from replay import run_load
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def start(args):
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def measure(port, viewers, duration, processes):
+    before = {name: cpu_seconds(p.pid) for name, p in processes.items()}
+    started = time.monotonic()
+    results = run_load('127.0.0.1', port, viewers, duration)
+    elapsed = time.monotonic() - started
+    cpu = {name: (cpu_seconds(p.pid) - before[name]) / elapsed for name, p in processes.items()}
+    fps = np.median([r['fps'] for r in results])
+    latency = np.median([r['latency_p50_ms'] for r in results])
+    errors = sum(1 for r in results if r['error'])
+    return cpu, fps, latency, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark relay.py against direct viewers")
+    parser.add_argument('--image', default='saved_frame.jpg')
+    parser.add_argument('--size', default='1280x960')
+    parser.add_argument('--rate', default='30')
+    parser.add_argument('--viewers', default='1,10,50,100')
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    camera_port = free_port()
+    camera = start(['replay.py', '--synthetic', args.image, '--sizes', args.size, '--rate', args.rate,
+                    '--host', '127.0.0.1', '--port', str(camera_port)])
+    relay_port = free_port()
+    relay = start(['relay.py', '--upstream', f"127.0.0.1:{camera_port}",
+                   '--host', '127.0.0.1', '--port', str(relay_port)])
+    try:
+        wait_for_port(camera_port)
+        wait_for_port(relay_port)
+        time.sleep(1.0)
+
+        print(f"{args.size} JPEG at {args.rate} fps, {args.duration:.0f} s per run; CPU in % of one core")
+        print(f"  {'viewers':>7} {'path':6s} {'camera':>7} {'relay':>7} {'relay/viewer':>13}"
+              f" {'fps':>6} {'p50 ms':>7}")
+        for count in (int(c) for c in args.viewers.split(',')):
+            cpu, fps, latency, errors = measure(camera_port, count, args.duration, {'camera': camera})
+            print(f"  {count:7d} {'direct':6s} {cpu['camera'] * 100:7.1f} {'':>7} {'':>13}"
+                  f" {fps:6.1f} {latency:7.2f}" + (f"  {errors} errors" if errors else ''))
+            cpu, fps, latency, errors = measure(relay_port, count, args.duration,
+                                                {'camera': camera, 'relay': relay})
+            print(f"  {count:7d} {'relay':6s} {cpu['camera'] * 100:7.1f} {cpu['relay'] * 100:7.1f}"
+                  f" {cpu['relay'] * 100 / count:13.2f} {fps:6.1f} {latency:7.2f}"
+                  + (f"  {errors} errors" if errors else ''))
+    finally:
+        for process in (relay, camera):
+            process.terminate()
+            process.wait(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark the cost of one mouse move while dragging a new ROI.
+
+    opencv   what pp.py did before: copy the image, cv2.rectangle every ROI
+             and the rubber band, QImage + QPixmap.fromImage, setPixmap
+    canvas   roi_canvas.RoiCanvas: the move marks the rubber band's area
+             dirty and the label repaints only that area
+
+and the cost of a click hit-test, scanning every ROI against
+RoiStore.hit_test.
+
+Both columns include the painting: the opencv path repaints synchronously
+and the canvas path lets processEvents run the pending partial update. Qt
+runs on the offscreen platform.
+
+    python bench/bench_roi_drag.py --sizes 959x926,1920x1080,4000x3000 --rois 0,50,500
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QEvent, QPoint, QRect, Qt
+from PyQt5.QtGui import QImage, QMouseEvent, QPixmap
+from PyQt5.QtWidgets import QApplication, QLabel
+
+from roi_canvas import RoiCanvas
+from roi_store import RoiStore
+
+
+def random_rects(count, size, seed=1):
+    rng = np.random.default_rng(seed)
+    rects = []
+    for _ in range(count):
+        x, y = rng.integers(0, size[0] - 60), rng.integers(0, size[1] - 60)
+        rects.append(QRect(int(x), int(y), int(rng.integers(10, 60)), int(rng.integers(10, 60))))
+    return rects
+
+
+def drag_path(moves):
+    return [QPoint(100 + i % 200, 100 + i % 150) for i in range(moves)]
+
+
+def bench_opencv(image, rects, moves):
+    label = QLabel()
+    label.setFixedSize(image.shape[1], image.shape[0])
+    label.show()
+    start_point = QPoint(100, 100)
+    times = []
+    for end_point in drag_path(moves):
+        started = time.perf_counter()
+        image_copy = image.copy()
+        for rect in rects:
+            cv2.rectangle(image_copy, (rect.x(), rect.y()),
+                          (rect.x() + rect.width(), rect.y() + rect.height()), (0, 0, 255), 2)
+        cv2.rectangle(image_copy, (start_point.x(), start_point.y()),
+                      (end_point.x(), end_point.y()), (0, 255, 0), 2)
+        height, width, channel = image_copy.shape
+        qimage = QImage(image_copy.data, width, height, channel * width, QImage.Format_RGB888)
+        label.setPixmap(QPixmap.fromImage(qimage))
+        label.repaint()
+        times.append(time.perf_counter() - started)
+    label.close()
+    return times
+
+
+def mouse(kind, pos):
+    button = Qt.NoButton if kind == QEvent.MouseMove else Qt.LeftButton
+    return QMouseEvent(kind, pos, button, Qt.LeftButton, Qt.NoModifier)
+
+
+def bench_canvas(image, rects, moves):
+    canvas = RoiCanvas()
+    canvas.setFixedSize(image.shape[1], image.shape[0])
+    canvas.show()
+    canvas.store.add_many([(r.x(), r.y(), r.width(), r.height()) for r in rects])
+    canvas.set_image(image)
+    canvas.repaint()
+    canvas.mousePressEvent(mouse(QEvent.MouseButtonPress, QPoint(100, 100)))
+    times = []
+    for pos in drag_path(moves):
+        started = time.perf_counter()
+        canvas.mouseMoveEvent(mouse(QEvent.MouseMove, pos))
+        # processEvents flushes the pending partial update, as the event loop would
+        QApplication.processEvents()
+        times.append(time.perf_counter() - started)
+    canvas.close()
+    return times
+
+
+def bench_hit_test(counts, size, queries=2000):
+    rng = np.random.default_rng(3)
+    points = np.column_stack([rng.integers(0, size[0], queries), rng.integers(0, size[1], queries)]).tolist()
+    print(f"\nClick hit-test on {size[0]}x{size[1]}, us per click:")
+    print(f"{'rois':>6} {'linear':>8} {'index':>8}")
+    for count in counts:
+        store = RoiStore()
+        store.add_many([(r.x(), r.y(), r.width(), r.height()) for r in random_rects(count, size)])
+        rois = store.rois
+        started = time.perf_counter()
+        for x, y in points:
+            # what a list of QRect allows: test every ROI, keep the last hit
+            for i in range(len(rois) - 1, -1, -1):
+                if rois['x'][i] <= x <= rois['x'][i] + rois['w'][i] and rois['y'][i] <= y <= rois['y'][i] + rois['h'][i]:
+                    break
+        linear = (time.perf_counter() - started) / queries * 1e6
+        store.hit_test(0, 0)  # builds the index
+        started = time.perf_counter()
+        for x, y in points:
+            store.hit_test(x, y)
+        indexed = (time.perf_counter() - started) / queries * 1e6
+        print(f"{count:6d} {linear:8.1f} {indexed:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ROI drag repaint cost")
+    parser.add_argument('--sizes', default='959x926,1920x1080,4000x3000')
+    parser.add_argument('--rois', default='0,50,500')
+    parser.add_argument('--moves', type=int, default=100)
+    parser.add_argument('--hit-rois', default='100,1000,10000')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    print(f"{'image':>10} {'rois':>5} {'opencv ms':>10} {'canvas ms':>10}")
+    for size in args.sizes.split(','):
+        width, height = (int(v) for v in size.split('x'))
+        image = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+        for count in (int(c) for c in args.rois.split(',')):
+            rects = random_rects(count, (width, height))
+            before = np.median(bench_opencv(image, rects, args.moves)) * 1000
+            after = np.median(bench_canvas(image, rects, args.moves)) * 1000
+            print(f"{size:>10} {count:5d} {before:10.2f} {after:10.3f}")
+    bench_hit_test([int(c) for c in args.hit_rois.split(',')], (1920, 1080), args.moves * 10)
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
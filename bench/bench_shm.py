@@ -0,0 +1,125 @@
+"""Benchmark the shared-memory transport against TCP + JPEG on one host.
+
+The producer (server.py, or shm_transport.py for the shared-memory ring)
+runs in its own process and plays a synthetic camera: saved_frame.jpg
+scaled to each --scales factor at --fps. The viewer is the receiver the
+windows use, opened with receiver.open_stream() in this process. Reported
+are the producer's CPU (from /proc), the viewer's CPU (this process), the
+frame rate seen by the viewer and the latency from capture until the frame
+is ready for display, per frame.
+
+    python bench/bench_shm.py --scales 1,2,3 --fps 30 --duration 5
+    python bench/bench_shm.py --display 640x480
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from bench_relay import cpu_seconds, free_port, wait_for_port
+from protocol import monotonic_us
+from receiver import open_stream
+from shm_transport import SHM_PREFIX
+
+
+class LatencyProbe:
+    """Analyzer hook: records the capture-to-ready latency of every frame."""
+
+    def __init__(self):
+        self.receiver = None
+        self.samples = []
+
+    def submit(self, frame):
+        info, stats = self.receiver.info, self.receiver.stats
+        if info is not None and stats is not None:
+            self.samples.append(monotonic_us() - (info.timestamp - stats.clock_offset))
+
+
+def connect(address, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return open_stream(address, lambda: None)
+        except (OSError, ValueError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def measure(producer, address, display_size, duration):
+    receiver = connect(address)
+    probe = LatencyProbe()
+    probe.receiver = receiver
+    receiver.analyzer = probe
+    receiver.display_size = display_size
+    receiver.start()
+    time.sleep(1.0)
+
+    probe.samples = []
+    started = time.monotonic()
+    producer_cpu = cpu_seconds(producer.pid)
+    viewer_cpu = time.process_time()
+    time.sleep(duration)
+    elapsed = time.monotonic() - started
+    producer_cpu = (cpu_seconds(producer.pid) - producer_cpu) / elapsed
+    viewer_cpu = (time.process_time() - viewer_cpu) / elapsed
+    samples = np.array(probe.samples) / 1000
+
+    receiver.stop()
+    receiver.join(timeout=2.0)
+    receiver.close()
+    return {
+        'producer': producer_cpu * 100,
+        'viewer': viewer_cpu * 100,
+        'fps': len(samples) / elapsed,
+        'p50': np.percentile(samples, 50) if len(samples) else float('nan'),
+        'p99': np.percentile(samples, 99) if len(samples) else float('nan'),
+    }
+
+
+def start(args):
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shared memory against TCP + JPEG")
+    parser.add_argument('--image', default='saved_frame.jpg')
+    parser.add_argument('--scales', default='1,2,3', help="resize factors applied to --image")
+    parser.add_argument('--fps', default='30')
+    parser.add_argument('--display', default=None, help="viewer display size as WxH (default: full frame)")
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+    display_size = tuple(int(v) for v in args.display.split('x')) if args.display else None
+
+    print(f"{args.image} at {args.fps} fps, display {args.display or 'full size'},"
+          f" {args.duration:.0f} s per run; CPU in % of one core")
+    print(f"  {'scale':>5} {'transport':10s} {'producer':>9} {'viewer':>7} {'fps':>6} {'p50 ms':>7} {'p99 ms':>7}")
+    for scale in args.scales.split(','):
+        port = free_port()
+        name = f"bench-shm-{os.getpid()}"
+        runs = (
+            ('tcp+jpeg', ['server.py', '--port', str(port), '--host', '127.0.0.1'], f"127.0.0.1:{port}"),
+            ('shm', ['shm_transport.py', '--name', name], SHM_PREFIX + name),
+        )
+        for transport, command, address in runs:
+            producer = start(command + ['--image', args.image, '--scale', scale, '--fps', args.fps])
+            try:
+                if transport != 'shm':
+                    wait_for_port(port)
+                result = measure(producer, address, display_size, args.duration)
+            finally:
+                producer.terminate()
+                producer.wait(timeout=5)
+            print(f"  {scale:>5} {transport:10s} {result['producer']:9.1f} {result['viewer']:7.1f}"
+                  f" {result['fps']:6.1f} {result['p50']:7.2f} {result['p99']:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Measure cold start time and memory of a window with the map on and off.
+
+Every run starts a fresh Python process, which builds the window and shows
+it on the offscreen platform:
+
+    eager   QtWebEngine imported and the map view created in the window's
+            constructor, as before map_panel.MapPanel
+    lazy    the map view created on first show (the default)
+    off     MAP_ENABLED = False
+
+Reported are the time from process start until the window has been shown,
+the time until the map page has loaded (or the panel gave up), and the peak
+RSS of the process plus the current RSS of its child processes
+(QtWebEngineProcess), after settling for a moment.
+
+    python bench/bench_startup.py --window pp --repeat 3
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_status(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def children_rss(pid):
+    total = 0.0
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    total += read_status(child, 'VmRSS') + children_rss(child)
+    except OSError:
+        pass
+    return total
+
+
+def process_age():
+    """Seconds since this process was started, interpreter start-up included."""
+    with open('/proc/self/stat') as f:
+        start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+    with open('/proc/uptime') as f:
+        uptime = float(f.read().split()[0])
+    return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+
+
+def child(mode, window_module, settle):
+    started = time.perf_counter() - process_age()
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from PyQt5.QtCore import Qt, QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    result = {'mode': mode}
+    QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    app = QApplication([sys.argv[0]])
+    module = importlib.import_module(window_module)
+    module.MAP_ENABLED = mode != 'off'
+    window = module.VideoStreamWindow()
+    if mode == 'eager':
+        window.map_view.create_view()
+    window.show()
+    app.processEvents()
+    result['shown'] = time.perf_counter() - started
+
+    def map_ready(*_):
+        if 'map' not in result:
+            result['map'] = time.perf_counter() - started
+
+    def check():
+        view = window.map_view.view
+        if view is not None:
+            view.loadFinished.connect(map_ready)
+        elif window.map_view.enabled and not window.map_view._started:
+            QTimer.singleShot(10, check)
+        else:
+            map_ready()
+
+    check()
+    QTimer.singleShot(int(settle * 1000), app.quit)
+    app.exec_()
+    if window.map_view.view is None and mode != 'off':
+        result['error'] = 'QtWebEngine unavailable'
+    result['rss_mb'] = read_status('self', 'VmHWM')
+    result['children_mb'] = children_rss(os.getpid())
+    window.close()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure window start time and memory with and without the map")
+    parser.add_argument('--window', default='pp', choices=['pp', 'client'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--settle', type=float, default=3.0, help="seconds to run the event loop")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.window, args.settle)
+        return
+
+    print(f"{args.window}.py, median of {args.repeat} fresh processes:")
+    print(f"  {'mode':6s} {'shown s':>8} {'map s':>8} {'rss MB':>8} {'children MB':>12}")
+    for mode in ('eager', 'lazy', 'off'):
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', mode, '--window', args.window, '--settle', str(args.settle)],
+                capture_output=True, text=True,
+            ).stdout.strip().splitlines()
+            if not output:
+                break
+            runs.append(json.loads(output[-1]))
+        if not runs:
+            print(f"  {mode:6s} failed to start")
+            continue
+
+        def median(key):
+            values = sorted(run[key] for run in runs if key in run)
+            return values[len(values) // 2] if values else float('nan')
+
+        note = f"  ({runs[0]['error']})" if 'error' in runs[0] else ''
+        print(f"  {mode:6s} {median('shown'):8.2f} {median('map'):8.2f} {median('rss_mb'):8.0f}"
+              f" {median('children_mb'):12.0f}{note}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark the UDP transport under datagram loss, unicast and multicast.
+
+server.py runs in its own process with --udp, playing saved_frame.jpg at
+--fps. Unicast runs pass the datagrams through a LossShim that drops
+--losses of them, singly and in runs of --burst, on their way to one
+viewer; the multicast run has --viewers viewers joined to one group on
+loopback. Viewers are the receivers the windows use. Reported per viewer
+are the frames delivered per second, the share of frames that never
+completed, the latency from capture until the frame is ready for display
+and the longest gap between two delivered frames, which is what the
+viewer sees as a freeze.
+
+netem is not needed: all loss comes from the shim, so the numbers are
+reproducible with --seed.
+
+    python bench/bench_udp.py --losses 0,0.01,0.05 --burst 4 --duration 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from bench_relay import free_port
+from protocol import monotonic_us
+from receiver import FrameReceiver
+from udp_transport import LossShim, UdpFrameReader
+
+GROUP = '239.255.0.42'
+
+
+class DeliveryProbe:
+    """Analyzer hook: records when each frame was ready and its latency."""
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.times = []
+        self.latencies = []
+
+    def submit(self, frame):
+        info = self.receiver.info
+        self.times.append(time.monotonic())
+        if info is not None:
+            # Sender and viewers share this host's clock, so no offset is needed
+            self.latencies.append(monotonic_us() - info.timestamp)
+
+    def reset(self):
+        self.times, self.latencies = [], []
+
+
+def viewer(reader):
+    receiver = FrameReceiver(reader.sock, lambda: None, reader=reader)
+    receiver.feedback_interval = 0
+    receiver.analyzer = DeliveryProbe(receiver)
+    receiver.start()
+    return receiver
+
+
+def run(server_args, readers, duration, warmup=1.0):
+    producer = subprocess.Popen([sys.executable, 'server.py', '--host', '127.0.0.1', '--port', str(free_port())]
+                                + server_args, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    receivers = [viewer(reader) for reader in readers]
+    try:
+        time.sleep(warmup)
+        counters = [(r.reader.frames_completed, r.reader.frames_incomplete) for r in receivers]
+        for receiver in receivers:
+            receiver.analyzer.reset()
+        started = time.monotonic()
+        time.sleep(duration)
+        elapsed = time.monotonic() - started
+    finally:
+        producer.terminate()
+        producer.wait(timeout=5)
+        for receiver in receivers:
+            receiver.stop()
+            receiver.join(timeout=2.0)
+            receiver.close()
+
+    results = []
+    for receiver, (completed, incomplete) in zip(receivers, counters):
+        probe = receiver.analyzer
+        completed = receiver.reader.frames_completed - completed
+        incomplete = receiver.reader.frames_incomplete - incomplete
+        latencies = np.array(probe.latencies) / 1000
+        # Time from the end of warm-up to the first frame, between frames, and after the last one
+        gaps = np.diff([started] + probe.times + [started + elapsed])
+        results.append({
+            'fps': len(probe.times) / elapsed,
+            'incomplete': incomplete / max(completed + incomplete, 1) * 100,
+            'p50': np.percentile(latencies, 50) if len(latencies) else float('nan'),
+            'p99': np.percentile(latencies, 99) if len(latencies) else float('nan'),
+            'freeze': gaps.max() * 1000,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the UDP transport under datagram loss")
+    parser.add_argument('--image', default='saved_frame.jpg')
+    parser.add_argument('--scale', default='1')
+    parser.add_argument('--fps', default='30')
+    parser.add_argument('--losses', default='0,0.01,0.05', help="fractions of datagrams dropped")
+    parser.add_argument('--burst', type=int, default=4, help="run length for the bursty rows")
+    parser.add_argument('--viewers', type=int, default=3, help="viewers joined to the multicast group")
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    source = ['--image', args.image, '--scale', args.scale, '--fps', args.fps]
+
+    print(f"{args.image} x{args.scale} at {args.fps} fps over loopback, {args.duration:.0f} s per run")
+    print(f"  {'mode':10s} {'loss':>6} {'burst':>5} {'fps':>6} {'incompl%':>8}"
+          f" {'p50 ms':>7} {'p99 ms':>7} {'freeze ms':>9}")
+
+    def report(mode, loss, burst, result):
+        print(f"  {mode:10s} {loss:6.1%} {burst:5d} {result['fps']:6.1f} {result['incomplete']:8.1f}"
+              f" {result['p50']:7.2f} {result['p99']:7.2f} {result['freeze']:9.0f}")
+
+    for loss in (float(v) for v in args.losses.split(',')):
+        for burst in sorted({1, args.burst}) if loss else (1,):
+            viewer_port, shim_port = free_port(), free_port()
+            reader = UdpFrameReader.open('127.0.0.1', viewer_port)
+            shim = LossShim(shim_port, ('127.0.0.1', viewer_port), loss, burst, seed=args.seed)
+            try:
+                result, = run(source + ['--udp', f"127.0.0.1:{shim_port}"], [reader], args.duration)
+            finally:
+                shim.stop()
+            report('unicast', loss, burst, result)
+
+    port = free_port()
+    readers = [UdpFrameReader.open(GROUP, port, '127.0.0.1') for _ in range(args.viewers)]
+    results = run(source + ['--udp', f"{GROUP}:{port}", '--udp-interface', '127.0.0.1'], readers, args.duration)
+    for i, result in enumerate(results):
+        report(f"multicast{i + 1}", 0.0, 1, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Check that the adaptive controller keeps latency under target on a slow link.
+
+A StreamServer with a synthetic full-HD source sends through a local proxy
+that throttles the server -> client direction to --bandwidth bytes/s. The
+simulated client reports its latency back over the v2 control channel, just
+like FrameReceiver does. JPEG sizes are modelled from quality and scale so
+the run measures the control loop, not the encoder.
+
+Exits with status 1 if the median latency over the last --settle seconds is
+above the target.
+
+    python bench/sim_adaptive.py --bandwidth 3e6 --target 150
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive import AdaptiveController
+from frame_reader import FrameReader
+from protocol import Feedback, pack_feedback
+from server import Pacer, StreamServer
+from stream_stats import StreamStats
+
+FRAME = types.SimpleNamespace(shape=(1080, 1920, 3))
+
+
+class SyntheticSource:
+    def __init__(self, fps):
+        self.pacer = Pacer(fps)
+
+    def read(self):
+        self.pacer.wait()
+        return FRAME
+
+    def close(self):
+        pass
+
+
+class ModelledServer(StreamServer):
+    """Sends zero-filled payloads sized like JPEGs at the chosen settings."""
+
+    def encode(self, frame, quality, scale=1.0):
+        height, width = frame.shape[:2]
+        width, height = int(width * scale), int(height * scale)
+        bits_per_pixel = 0.15 + 2.0 * (quality / 100) ** 2
+        return bytes(int(width * height * bits_per_pixel / 8)), width, height
+
+
+class ThrottledLink:
+    """TCP proxy that limits the downstream direction to `bandwidth` bytes/s."""
+
+    def __init__(self, upstream_port, bandwidth, chunk=16 * 1024):
+        self.upstream_port = upstream_port
+        self.bandwidth = bandwidth
+        self.chunk = chunk
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                downstream, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.socket()
+            upstream.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 256 * 1024)
+            upstream.connect(('127.0.0.1', self.upstream_port))
+            threading.Thread(target=self._pipe, args=(upstream, downstream, True), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(downstream, upstream, False), daemon=True).start()
+
+    def _pipe(self, src, dst, throttled):
+        next_send = time.monotonic()
+        try:
+            while True:
+                data = src.recv(self.chunk)
+                if not data:
+                    break
+                if throttled:
+                    now = time.monotonic()
+                    if next_send > now:
+                        time.sleep(next_send - now)
+                    next_send = max(next_send, now) + len(data) / self.bandwidth
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            dst.close()
+
+    def close(self):
+        self.listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bandwidth', type=float, default=3e6, help="link rate in bytes/s")
+    parser.add_argument('--target', type=float, default=150, help="latency target in ms")
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--settle', type=float, default=5, help="seconds at the end that must be on target")
+    args = parser.parse_args()
+
+    controller = AdaptiveController(args.target, max_fps=args.fps)
+    server = ModelledServer(SyntheticSource(args.fps), '127.0.0.1', 0, controller=controller)
+    server.start()
+    link = ThrottledLink(server.port, args.bandwidth)
+
+    sock = socket.create_connection(('127.0.0.1', link.port))
+    reader = FrameReader(sock, negotiate=True)
+    stats = None
+    samples = []
+    start = time.monotonic()
+    last_feedback = last_print = 0.0
+
+    while time.monotonic() - start < args.duration:
+        if reader.read_frame() is None:
+            break
+        if stats is None:
+            stats = StreamStats(reader.clock_offset)
+        stats.update(reader.info)
+        now = time.monotonic()
+        samples.append((now - start, stats.latency_us / 1000))
+
+        if now - last_feedback >= 0.5:
+            last_feedback = now
+            sock.sendall(pack_feedback(Feedback(2000, stats.latency_us, 0, 1280, 960)))
+        if now - last_print >= 1.0:
+            last_print = now
+            print(f"t={now - start:5.1f}s latency={stats.latency_us / 1000:7.1f} ms "
+                  f"quality={controller.quality:3d} scale={controller.scale:.2f} fps={controller.fps:4.1f}")
+
+    sock.close()
+    link.close()
+    server.stop()
+
+    tail = [latency for t, latency in samples if t >= args.duration - args.settle]
+    if not tail:
+        print("No frames received")
+        sys.exit(1)
+    median = statistics.median(tail)
+    converged = median <= args.target
+    print(f"Median latency over the last {args.settle:.0f}s: {median:.1f} ms "
+          f"(target {args.target:.0f} ms) -> {'converged' if converged else 'NOT converged'}")
+    sys.exit(0 if converged else 1)
+
+
+if __name__ == '__main__':
+    main()
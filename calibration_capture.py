@@ -0,0 +1,193 @@
+"""Chessboard capture for camera calibration.
+
+Finding the board at full resolution on every frame is slow, and keeping
+every detection gives calibrateCamera hundreds of near-identical views.
+Here the board is found on a downscaled copy and refined with cornerSubPix
+at full resolution, detection runs on its own thread so a preview is not
+held up by it, and KeyframeSelector keeps a bounded set of views that are
+spread over position, size and tilt.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+DETECT_FLAGS = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
+def board_points(pattern_size, square_size=1.0):
+    """Object points (0,0,0), (1,0,0), ... of the inner corners."""
+    points = np.zeros((pattern_size[0] * pattern_size[1], 3), np.float32)
+    points[:, :2] = np.mgrid[0:pattern_size[0], 0:pattern_size[1]].T.reshape(-1, 2) * square_size
+    return points
+
+
+def detect_chessboard(gray, pattern_size, detect_width=640):
+    """Find the inner corners of a chessboard; return them or None.
+
+    The search runs on a copy scaled down to detect_width pixels wide and
+    the corners it finds are refined on the full-resolution image.
+    """
+    h, w = gray.shape[:2]
+    scale = min(detect_width / w, 1.0)
+    small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    found, corners = cv2.findChessboardCorners(small, pattern_size, DETECT_FLAGS)
+    if not found:
+        return None
+    corners = corners / scale
+    # The window must cover the error left by the downscaled search
+    window = max(5, int(round(2 / scale)))
+    return cv2.cornerSubPix(gray, corners.astype(np.float32), (window, window), (-1, -1), SUBPIX_CRITERIA)
+
+
+def pose_descriptor(corners, pattern_size, image_size):
+    """Summarize the view of a board as a small vector.
+
+    Components: board centre (x, y) as a fraction of the image, apparent size,
+    and the length ratios of opposite outer edges, which change as the board
+    tilts away from the camera horizontally and vertically, plus the in-plane
+    rotation.
+    """
+    cols, rows = pattern_size
+    grid = corners.reshape(rows, cols, 2)
+    w, h = image_size
+    top_left, top_right = grid[0, 0], grid[0, -1]
+    bottom_left, bottom_right = grid[-1, 0], grid[-1, -1]
+
+    centre = grid.reshape(-1, 2).mean(axis=0) / (w, h)
+    top = np.linalg.norm(top_right - top_left)
+    bottom = np.linalg.norm(bottom_right - bottom_left)
+    left = np.linalg.norm(bottom_left - top_left)
+    right = np.linalg.norm(bottom_right - top_right)
+    size = np.sqrt(cv2.contourArea(np.array([top_left, top_right, bottom_right, bottom_left],
+                                            dtype=np.float32)) / (w * h))
+    dx, dy = top_right - top_left
+    angle = np.arctan2(dy, dx) / np.pi
+    return np.array([centre[0], centre[1], size,
+                     np.log(top / bottom), np.log(left / right), angle], dtype=np.float64)
+
+
+class KeyframeSelector:
+    """Keeps at most max_keyframes board views, spread out in pose.
+
+    A view closer than min_distance (in pose_descriptor space) to a kept one
+    is rejected as a duplicate. Once the set is full, a new view replaces
+    the kept view with the nearest neighbour if that makes the set more
+    spread out.
+    """
+
+    def __init__(self, max_keyframes=40, min_distance=0.05):
+        self.max_keyframes = max_keyframes
+        self.min_distance = min_distance
+        self.keyframes = []
+        self._descriptors = np.zeros((0, 6))
+        self.views_seen = 0
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    def offer(self, corners, pattern_size, image_size):
+        """Consider a detection; return True if it was kept."""
+        self.views_seen += 1
+        descriptor = pose_descriptor(corners, pattern_size, image_size)
+        if not len(self.keyframes):
+            self._add(descriptor, corners)
+            return True
+
+        distances = np.linalg.norm(self._descriptors - descriptor, axis=1)
+        nearest = distances.min()
+        if nearest < self.min_distance:
+            return False
+        if len(self.keyframes) < self.max_keyframes:
+            self._add(descriptor, corners)
+            return True
+
+        # Nearest-neighbour distance of every kept view; the most crowded one
+        # is replaced if the new view is further from the rest than it is.
+        pairwise = np.linalg.norm(self._descriptors[:, None] - self._descriptors[None], axis=2)
+        np.fill_diagonal(pairwise, np.inf)
+        crowding = pairwise.min(axis=1)
+        victim = int(crowding.argmin())
+        others = np.delete(distances, victim)
+        if others.min() <= crowding[victim]:
+            return False
+        self._descriptors[victim] = descriptor
+        self.keyframes[victim] = corners
+        return True
+
+    def _add(self, descriptor, corners):
+        self._descriptors = np.vstack([self._descriptors, descriptor])
+        self.keyframes.append(corners)
+
+
+def calibrate(keyframes, pattern_size, image_size, square_size=1.0):
+    """Run calibrateCamera on keyframes.
+
+    Returns (rms, camera_matrix, dist_coeffs, seconds).
+    """
+    objp = board_points(pattern_size, square_size)
+    start = time.perf_counter()
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+        [objp] * len(keyframes), keyframes, image_size, None, None)
+    return rms, camera_matrix, dist_coeffs, time.perf_counter() - start
+
+
+class ChessboardDetector(threading.Thread):
+    """Detects the board on a worker thread, always on the newest frame.
+
+    submit() never blocks: a frame submitted while detection is busy
+    replaces the one waiting, so the caller's loop keeps the camera's rate.
+    Each detection is offered to `selector`; `last_corners` holds the most
+    recent result (or None) for drawing.
+    """
+
+    def __init__(self, pattern_size, selector=None, detect_width=640):
+        super().__init__(daemon=True)
+        self.pattern_size = pattern_size
+        self.selector = selector or KeyframeSelector()
+        self.detect_width = detect_width
+        self.image_size = None
+        self.last_corners = None
+        self.frames_detected = 0
+        self.frames_skipped = 0
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._running = True
+
+    def submit(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.frames_skipped += 1
+            self._frame = frame
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._running and self._frame is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                frame, self._frame = self._frame, None
+
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            corners = detect_chessboard(gray, self.pattern_size, self.detect_width)
+            self.frames_detected += 1
+            self.last_corners = corners
+            if corners is not None:
+                self.image_size = (gray.shape[1], gray.shape[0])
+                with self._cond:
+                    self.selector.offer(corners, self.pattern_size, self.image_size)
+
+    @property
+    def keyframes(self):
+        with self._cond:
+            return list(self.selector.keyframes)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
@@ -0,0 +1,165 @@
+"""Calibrations of several cameras, with undistortion maps cached on disk.
+
+Layout of the store directory:
+
+    <camera id>/<width>x<height>.npz   camera_matrix, dist_coeffs, image_size,
+                                       reprojection_error, created
+    maps/<key>-map1.npy                remap tables for one (calibration,
+    maps/<key>-map2.npy                frame size, alpha, map type); key is a
+    maps/<key>-roi.npy                 hash of all of them
+
+Maps are plain .npy files opened with mmap, so loading them costs no
+computation and processes showing the same camera share the pages.
+"""
+import collections
+import hashlib
+import os
+import re
+import struct
+import time
+
+import numpy as np
+
+from undistort import Undistorter, build_maps
+
+CALIBRATION_DIR = 'calibrations'
+
+Calibration = collections.namedtuple(
+    'Calibration', 'camera_id image_size camera_matrix dist_coeffs reprojection_error created')
+
+
+def safe_name(camera_id):
+    """Directory name for a camera id such as '192.168.0.5' or 'usb:1'."""
+    return re.sub(r'[^A-Za-z0-9._-]', '_', str(camera_id)).strip('.') or '_'
+
+
+def _write_atomic(path, write):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        write(f)
+    os.replace(temporary, path)
+
+
+class CalibrationStore:
+    """Calibrations keyed by camera id and resolution."""
+
+    def __init__(self, directory=CALIBRATION_DIR):
+        self.directory = directory
+        self.maps_directory = os.path.join(directory, 'maps')
+
+    def _path(self, camera_id, image_size):
+        return os.path.join(self.directory, safe_name(camera_id), f"{image_size[0]}x{image_size[1]}.npz")
+
+    def save(self, camera_id, image_size, camera_matrix, dist_coeffs, reprojection_error=None):
+        """Store a calibration, replacing any earlier one at this resolution."""
+        calibration = Calibration(
+            str(camera_id), (int(image_size[0]), int(image_size[1])),
+            np.array(camera_matrix, dtype=np.float64).reshape(3, 3),
+            np.array(dist_coeffs, dtype=np.float64).ravel(),
+            float('nan') if reprojection_error is None else float(reprojection_error),
+            time.time(),
+        )
+        path = self._path(camera_id, image_size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, lambda f: np.savez(
+            f, camera_id=calibration.camera_id, image_size=calibration.image_size,
+            camera_matrix=calibration.camera_matrix, dist_coeffs=calibration.dist_coeffs,
+            reprojection_error=calibration.reprojection_error, created=calibration.created,
+        ))
+        return calibration
+
+    def _read(self, path):
+        with np.load(path) as data:
+            return Calibration(
+                str(data['camera_id']), tuple(int(v) for v in data['image_size']),
+                data['camera_matrix'], data['dist_coeffs'],
+                float(data['reprojection_error']), float(data['created']),
+            )
+
+    def cameras(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if name != 'maps' and os.path.isdir(os.path.join(self.directory, name)))
+
+    def calibrations(self, camera_id):
+        """Every stored calibration of a camera, newest first."""
+        directory = os.path.join(self.directory, safe_name(camera_id))
+        if not os.path.isdir(directory):
+            return []
+        found = [self._read(os.path.join(directory, name))
+                 for name in os.listdir(directory) if name.endswith('.npz')]
+        return sorted(found, key=lambda calibration: -calibration.created)
+
+    def find(self, camera_id, image_size=None):
+        """Best calibration for a camera at image_size, or None.
+
+        An exact resolution wins; otherwise the largest calibration with the
+        same aspect ratio is used (Undistorter rescales it). Without
+        image_size the newest calibration is returned.
+        """
+        found = self.calibrations(camera_id)
+        if image_size is None:
+            return found[0] if found else None
+        same_aspect = []
+        for calibration in found:
+            if calibration.image_size == tuple(image_size):
+                return calibration
+            w, h = calibration.image_size
+            if abs(w * image_size[1] - h * image_size[0]) <= max(w, h) // 100:
+                same_aspect.append(calibration)
+        if not same_aspect:
+            return None
+        return max(same_aspect, key=lambda calibration: calibration.image_size[0])
+
+    def maps(self, calibration, size, alpha=1.0, fixed_point=True):
+        """(map1, map2, roi) for frames of `size`, memory-mapped from disk.
+
+        Missing maps are built and written once; later calls, from this or
+        any other process, only map the files.
+        """
+        key = hashlib.sha1(
+            calibration.camera_matrix.astype(np.float64).tobytes()
+            + calibration.dist_coeffs.astype(np.float64).ravel().tobytes()
+            + struct.pack('<IIIIdB', *calibration.image_size, *size, alpha, fixed_point)
+        ).hexdigest()[:20]
+        base = os.path.join(self.maps_directory, key)
+        paths = [f"{base}-map1.npy", f"{base}-map2.npy", f"{base}-roi.npy"]
+        if not all(os.path.exists(path) for path in paths):
+            os.makedirs(self.maps_directory, exist_ok=True)
+            map1, map2, roi = build_maps(calibration.camera_matrix, calibration.dist_coeffs.ravel(),
+                                         calibration.image_size, tuple(size), alpha, fixed_point)
+            # roi last: it marks the set complete for the check above
+            for path, array in zip(paths, (map1, map2, np.array(roi, dtype=np.int32))):
+                _write_atomic(path, lambda f: np.save(f, array))
+        map1 = np.load(paths[0], mmap_mode='r')
+        map2 = np.load(paths[1], mmap_mode='r')
+        roi = tuple(int(v) for v in np.load(paths[2]))
+        return map1, map2, roi
+
+    def undistorter(self, camera_ids, image_size=None, alpha=1.0, **kwargs):
+        """Undistorter for a stored calibration, or None if there is none.
+
+        camera_ids is one id or a list tried in order, such as
+        ['host:port', 'host']. The maps come from the disk cache while the
+        calibration is unchanged; after set_params()/set_values() they are
+        built in memory as usual.
+        """
+        if isinstance(camera_ids, str):
+            camera_ids = [camera_ids]
+        for camera_id in camera_ids:
+            calibration = self.find(camera_id, image_size)
+            if calibration is not None:
+                break
+        else:
+            return None
+
+        def map_builder(camera_matrix, dist_coeffs, calibrated_size, size, map_alpha, fixed_point):
+            if (calibrated_size == calibration.image_size
+                    and np.array_equal(camera_matrix, calibration.camera_matrix)
+                    and np.array_equal(dist_coeffs, calibration.dist_coeffs.ravel())):
+                return self.maps(calibration, size, map_alpha, fixed_point)
+            return build_maps(camera_matrix, dist_coeffs, calibrated_size, size, map_alpha, fixed_point)
+
+        return Undistorter(calibration.camera_matrix, calibration.dist_coeffs, calibration.image_size,
+                           alpha, map_builder=map_builder, **kwargs)
@@ -1,18 +1,44 @@
 import sys
-import socket
-import struct
-import cv2
 import numpy as np
-from PyQt5.QtCore import Qt, QTimer, QSize, QRect
-from PyQt5.QtGui import QImage, QPixmap, QPainter, QColor
+from PyQt5.QtCore import Qt, pyqtSignal, QSize, QRect
+from PyQt5.QtGui import QPixmap, QPainter, QColor
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget, QLineEdit, QPushButton,
-    QTextEdit, QHBoxLayout, QSplitter, QTabWidget, QFileDialog, QSpinBox
+    QTextEdit, QSplitter, QTabWidget, QFileDialog, QDoubleSpinBox
 )
-from PyQt5.QtWebEngineWidgets import QWebEngineView
+
+from calibration_store import CalibrationStore
+from display import FrameDisplay
+from hud import MetricsOverlay
+from map_panel import MapPanel
+from metrics import Metrics, MetricsDumper, serve_metrics
+from multi_view import MultiStreamWidget
+from protocol import DEFAULT_PORT
+from stream_core import CallbackSink, ViewerSession
+from undistort import CALIBRATION_FIELDS, CALIBRATION_FILE, Undistorter
+
+# Number of threads decoding frames in parallel; 0 decodes on the receiver thread
+DECODE_WORKERS = 0
+DECODE_QUEUE_DEPTH = 4
+
+# Export pipeline metrics in the Prometheus text format on this local port
+# and/or to this file every few seconds; 0 and None turn the export off
+METRICS_PORT = 0
+METRICS_FILE = None
+
+# The map panel starts the embedded browser only when first shown. With
+# MAP_TILE_URL set (a {z}/{x}/{y} tile server, e.g. one on the local network)
+# the map is drawn from tiles cached in tiles/ instead of the Yandex Maps API,
+# and keeps working offline within MAP_CACHE_MB
+MAP_ENABLED = True
+MAP_TILE_URL = None
+MAP_CACHE_MB = 256
 
 
 class VideoStreamWindow(QMainWindow):
+    frame_ready = pyqtSignal()
+    stream_error = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
 
@@ -23,6 +49,9 @@ class VideoStreamWindow(QMainWindow):
         self.tab_widget = QTabWidget()
         self.setCentralWidget(self.tab_widget)
 
+        # Calibrations of the cameras, with their undistortion maps cached on disk
+        self.calibrations = CalibrationStore()
+
         # Tab 1: Video Stream and Map
         self.tab1 = QWidget()
         self.setup_tab1()
@@ -33,13 +62,31 @@ class VideoStreamWindow(QMainWindow):
         self.setup_tab2()
         
 
-        # Socket setup
-        self.client_socket = None
+        # Tab 3: Several cameras at once
+        self.camera_grid = MultiStreamWidget(calibrations=self.calibrations)
+        self.tab_widget.addTab(self.camera_grid, "Cameras")
+
+        # Connection, decoding and recording, shared with the command line
+        # viewer in stream_core.py; frames arrive through frame_ready
+        self.session = ViewerSession(
+            CallbackSink(self.frame_ready.emit, self.stream_error.emit),
+            decode_workers=DECODE_WORKERS, queue_depth=DECODE_QUEUE_DEPTH,
+        )
         self.frame = None
+        self.undistorter = None
+        self.display = FrameDisplay([self.video_label, self.video_label2], self)
+
+        # Pipeline metrics exist only while the HUD is shown or exported
+        self.metrics = None
+        self.metrics_server = None
+        self.metrics_dumper = None
+        if METRICS_PORT or METRICS_FILE:
+            self.start_metrics_export()
 
-        # Timer for video updates
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.receive_video)
+        # Frames are read on a background thread; these signals bring them
+        # back to the GUI thread
+        self.frame_ready.connect(self.receive_video)
+        self.stream_error.connect(self.on_stream_error)
 
     def setup_tab1(self):
     # Создаем виджет для первой вкладки
@@ -65,14 +112,33 @@ class VideoStreamWindow(QMainWindow):
         self.disconnect_button.clicked.connect(self.disconnect_from_server)
         self.disconnect_button.setEnabled(False)
 
+        self.snapshot_button = QPushButton("Save Frame", self)
+        self.snapshot_button.setFixedHeight(80)
+        self.snapshot_button.clicked.connect(self.save_snapshot)
+        self.snapshot_button.setEnabled(False)
+
+        self.record_button = QPushButton("Record", self)
+        self.record_button.setFixedHeight(80)
+        self.record_button.setCheckable(True)
+        self.record_button.toggled.connect(self.toggle_recording)
+
+        self.stats_button = QPushButton("Stats", self)
+        self.stats_button.setFixedHeight(80)
+        self.stats_button.setCheckable(True)
+        self.stats_button.toggled.connect(self.toggle_hud)
+
         self.sidebar_layout.addWidget(self.ip_input)
         self.sidebar_layout.addWidget(self.connect_button)
         self.sidebar_layout.addWidget(self.disconnect_button)
+        self.sidebar_layout.addWidget(self.snapshot_button)
+        self.sidebar_layout.addWidget(self.record_button)
+        self.sidebar_layout.addWidget(self.stats_button)
 
     # Создаем центральный виджет для видео
         self.video_label = QLabel(self)
         self.video_label.setAlignment(Qt.AlignCenter)
         self.video_label.setFixedSize(1280, 960)
+        self.hud = MetricsOverlay(self.video_label)
 
     # Поле для вывода сообщений о подключении и разрыве соединения
         self.info_text = QTextEdit(self)
@@ -80,10 +146,9 @@ class VideoStreamWindow(QMainWindow):
         self.info_text.setReadOnly(True)
         self.info_text.setFixedHeight(50)
 
-    # Создаем веб-виджет для карт Яндекс
-        self.map_view = QWebEngineView(self)
+    # Создаем панель карты; браузер запускается при первом показе
+        self.map_view = MapPanel(self, MAP_TILE_URL, cache_bytes=MAP_CACHE_MB * 1024 * 1024, enabled=MAP_ENABLED)
         self.map_view.setFixedSize(1280, 960)
-        self.load_yandex_maps()
 
     # Создаем разделитель для боковой панели, карты и видео
         splitter = QSplitter(Qt.Horizontal)
@@ -106,17 +171,23 @@ class VideoStreamWindow(QMainWindow):
 
     # Calibration coefficients inputs
         self.calibration_inputs = []
-        for i in range(10):
-            spin_box = QSpinBox()
-            spin_box.setRange(-1000, 1000)
-            spin_box.setPrefix(f"Coeff {i + 1}: ")
+        for name, minimum, maximum, decimals in CALIBRATION_FIELDS:
+            spin_box = QDoubleSpinBox()
+            spin_box.setRange(minimum, maximum)
+            spin_box.setDecimals(decimals)
+            spin_box.setSingleStep(10 ** -min(decimals, 3))
+            spin_box.setPrefix(f"{name}: ")
+            spin_box.valueChanged.connect(self.update_calibration)
             self.calibration_inputs.append(spin_box)
 
     # Load image button
         self.load_image_button = QPushButton("Load Image")
         self.load_image_button.clicked.connect(self.load_image)
 
+        # Undistorts the live stream with the coefficients above
         self.calibration_inputs_button = QPushButton("Calibrate")
+        self.calibration_inputs_button.setCheckable(True)
+        self.calibration_inputs_button.toggled.connect(self.toggle_undistort)
 
         self.video_label2 = QLabel(self)
         self.video_label2.setAlignment(Qt.AlignCenter)
@@ -161,91 +232,149 @@ class VideoStreamWindow(QMainWindow):
     # Set the layout for the widget
         self.tab_widget.addTab(tab2_widget, "Camera Calibration")
 
-    def load_yandex_maps(self):
-        """Load Yandex Maps in the map view."""
-        yandex_maps_html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <script src="https://api-maps.yandex.ru/2.1/?lang=ru_RU" type="text/javascript"></script>
-            <style>
-                html, body, #map {
-                    width: 100%;
-                    height: 100%;
-                    margin: 0;
-                    padding: 0;
-                }
-            </style>
-        </head>
-        <body>
-            <div id="map"></div>
-            <script>
-                ymaps.ready(init);
-                function init() {
-                    var map = new ymaps.Map("map", {
-                        center: [56.479187, 85.068086],
-                        zoom: 10
-                    });
-                }
-            </script>
-        </body>
-        </html>
-        """
-        self.map_view.setHtml(yandex_maps_html)
-
     def connect_to_server(self):
         ip_address = self.ip_input.text()
         if not ip_address:
             print("IP Address is required")
             return
 
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            self.client_socket.connect((ip_address, 12345))
+            self.session.display_size = (
+                max(self.video_label.width(), self.video_label2.width()),
+                max(self.video_label.height(), self.video_label2.height()),
+            )
+            self.session.undistorter = self.active_undistorter()
+            self.session.connect(ip_address)
             print(f"Connected to server at {ip_address}")
-            self.timer.start(30)
             self.connect_button.setEnabled(False)
             self.disconnect_button.setEnabled(True)
+            self.snapshot_button.setEnabled(True)
         except Exception as e:
             print(f"Connection failed: {e}")
 
     def disconnect_from_server(self):
-        if self.client_socket:
-            self.client_socket.close()
-            self.client_socket = None
+        if self.session.connected:
+            self.session.disconnect()
             self.connect_button.setEnabled(True)
             self.disconnect_button.setEnabled(False)
-            self.timer.stop()
+            self.snapshot_button.setEnabled(False)
 
     def receive_video(self):
-        if not self.client_socket:
-            return
-
-        length_data = self.client_socket.recv(4)
-        if len(length_data) < 4:
-            return
-
-        length = struct.unpack('I', length_data)[0]
-        data = b""
-        while len(data) < length:
-            data += self.client_socket.recv(length - len(data))
-
-        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        frame = self.session.take_frame()
         if frame is not None:
             self.frame = frame
             self.update_video()
 
+    def save_snapshot(self):
+        if self.session.request_snapshot("saved_frame.jpg"):
+            print("Next frame will be saved to saved_frame.jpg")
+
+    def toggle_recording(self, checked):
+        if checked:
+            self.session.start_recording("recordings")
+            print("Recording to recordings/")
+        elif self.session.recorder:
+            recorder = self.session.stop_recording()
+            print(f"Recorded {recorder.frames_written} frames, dropped {recorder.frames_dropped}")
+
+    def toggle_hud(self, checked):
+        if checked:
+            self.set_metrics(self.metrics or Metrics())
+            self.hud.show_metrics(self.metrics)
+        else:
+            self.hud.hide_metrics()
+            if not (self.metrics_server or self.metrics_dumper):
+                self.set_metrics(None)
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+        self.display.metrics = metrics
+        self.session.metrics = metrics
+
+    def start_metrics_export(self):
+        self.set_metrics(self.metrics or Metrics())
+        if METRICS_PORT:
+            try:
+                self.metrics_server = serve_metrics(self.metrics, METRICS_PORT)
+                print(f"Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"Cannot serve metrics: {e}")
+        if METRICS_FILE:
+            self.metrics_dumper = MetricsDumper(self.metrics, METRICS_FILE)
+            self.metrics_dumper.start()
+
+    def stop_metrics_export(self):
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        if self.metrics_dumper:
+            self.metrics_dumper.stop()
+            self.metrics_dumper.join(timeout=1.0)
+            self.metrics_dumper = None
+
+    def toggle_undistort(self, checked):
+        if checked and self.undistorter is None:
+            self.undistorter = self.load_undistorter()
+            if self.undistorter is None:
+                self.calibration_inputs_button.setChecked(False)
+                return
+            for box, value in zip(self.calibration_inputs, self.undistorter.values()):
+                box.blockSignals(True)
+                box.setValue(value)
+                box.blockSignals(False)
+        self.session.undistorter = self.active_undistorter()
+
+    def load_undistorter(self):
+        # The calibration store first, then the file of older video.py
+        # versions, then whatever was typed into the boxes
+        undistorter = self.stored_undistorter()
+        if undistorter is not None:
+            return undistorter
+        try:
+            undistorter = Undistorter.load(CALIBRATION_FILE)
+            print(f"Loaded calibration from {CALIBRATION_FILE}")
+            return undistorter
+        except (OSError, KeyError, ValueError) as e:
+            values = [box.value() for box in self.calibration_inputs]
+            if values[0] <= 0 or values[1] <= 0:
+                print(f"No calibration found ({e}); enter fx and fy or run video.py")
+                return None
+            print(f"No calibration found ({e}), using the values entered")
+            undistorter = Undistorter(np.eye(3), np.zeros(5))
+            undistorter.set_values(values)
+            return undistorter
+
+    def stored_undistorter(self):
+        host = self.ip_input.text().strip()
+        size = None
+        info = self.session.info
+        if info is not None and info.width:
+            size = (info.width, info.height)
+        undistorter = self.calibrations.undistorter([f"{host}:{DEFAULT_PORT}", host], size)
+        if undistorter is not None:
+            print(f"Loaded calibration of {host} from {self.calibrations.directory}/")
+        return undistorter
+
+    def active_undistorter(self):
+        if self.calibration_inputs_button.isChecked():
+            return self.undistorter
+        return None
+
+    def update_calibration(self):
+        # Maps are rebuilt lazily, on the next frame after the change
+        values = [box.value() for box in self.calibration_inputs]
+        if self.undistorter and values[0] > 0 and values[1] > 0:
+            self.undistorter.set_values(values)
+
+    def on_stream_error(self, message):
+        print(message)
+        self.disconnect_from_server()
+
     def update_video(self):
         if self.frame is None:
             return
-
-        frame_rgb = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = frame_rgb.shape
-        bytes_per_line = ch * w
-        qimage = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimage)
-        self.video_label.setPixmap(pixmap.scaled(self.video_label.size(), Qt.KeepAspectRatio))
-        self.video_label2.setPixmap(pixmap.scaled(self.video_label2.size(), Qt.KeepAspectRatio))
+        self.display.show(self.frame)
 
     def load_image(self):
         filename, _ = QFileDialog.getOpenFileName(self, "Open Image", "", "Image Files (*.png *.jpg *.bmp)")
@@ -282,12 +411,17 @@ class VideoStreamWindow(QMainWindow):
             self.image_label.setPixmap(pixmap_copy)
 
     def closeEvent(self, event):
-        if self.client_socket:
-            self.client_socket.close()
+        self.disconnect_from_server()
+        self.camera_grid.disconnect_streams()
+        self.record_button.setChecked(False)
+        self.stop_metrics_export()
+        self.map_view.stop()
         event.accept()
 
 
 if __name__ == '__main__':
+    # Lets map_panel import QtWebEngine after the application exists
+    QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     window = VideoStreamWindow()
     window.show()
@@ -0,0 +1,138 @@
+import collections
+import threading
+import time
+
+from decoding import decode_frame
+
+
+class DecodePool:
+    """Decodes frames on several threads and delivers them in sequence order.
+
+    cv2.imdecode releases the GIL, so a few workers can decode consecutive
+    frames at once. Results are passed to on_frame strictly in submission
+    order. A finished frame is held while an earlier one is still decoding,
+    but for at most max_wait seconds; after that it is delivered anyway and
+    the earlier frame is counted as late and dropped when it completes.
+
+    When more than queue_depth frames are waiting for a worker the oldest
+    waiting one is discarded, so a slow decoder sheds load instead of
+    building up latency. A payload that fails to decode counts as dropped.
+
+    If `transform` is set, workers pass each decoded frame through it (for
+    example Undistorter.apply) before it is delivered.
+    """
+
+    def __init__(self, on_frame, workers=2, queue_depth=4, max_wait=0.05):
+        self.on_frame = on_frame
+        self.queue_depth = queue_depth
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._pending = set()
+        self._done = {}
+        self._next_seq = 0
+        self._delivered_seq = -1
+        self._running = True
+
+        self.frames_decoded = 0
+        self.frames_dropped = 0
+        self.frames_late = 0
+        self.decode_us = 0.0
+        self.metrics = None
+        self.transform = None
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"decode-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, payload, target_size=None):
+        """Queue a JPEG payload; it must not be modified after this call."""
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+            if len(self._queue) >= self.queue_depth:
+                dropped_seq, _, _ = self._queue.popleft()
+                self._pending.discard(dropped_seq)
+                self.frames_dropped += 1
+                if self.metrics is not None:
+                    self.metrics.count('frames_dropped')
+            self._queue.append((seq, payload, target_size))
+            self._pending.add(seq)
+            self._flush(time.monotonic())
+            self._cond.notify()
+        return seq
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                seq, payload, target_size = self._queue.popleft()
+
+            start = time.perf_counter()
+            try:
+                frame = decode_frame(payload, target_size)
+                elapsed_us = (time.perf_counter() - start) * 1e6
+                transform = self.transform
+                if transform is not None and frame is not None:
+                    frame = transform(frame)
+            except Exception:
+                # A payload imdecode rejects outright (cv2.error on an empty
+                # one) is just a lost frame; its seq must not stay pending
+                frame = None
+                elapsed_us = (time.perf_counter() - start) * 1e6
+
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.observe('decode', elapsed_us / 1e6)
+            with self._cond:
+                self.decode_us += (elapsed_us - self.decode_us) / 8
+                self._pending.discard(seq)
+                if seq <= self._delivered_seq:
+                    self.frames_late += 1
+                    if metrics is not None:
+                        metrics.count('frames_dropped')
+                    continue
+                if frame is None:
+                    self.frames_dropped += 1
+                    if metrics is not None:
+                        metrics.count('frames_dropped')
+                else:
+                    self.frames_decoded += 1
+                    if metrics is not None:
+                        metrics.count('frames_decoded')
+                self._done[seq] = (frame, time.monotonic())
+                self._flush(time.monotonic())
+
+    @property
+    def backlog(self):
+        """Frames waiting for a worker or held back for ordering."""
+        with self._cond:
+            return len(self._queue) + len(self._done)
+
+    def _flush(self, now):
+        # Called with the lock held; delivery happens under the lock so that
+        # frames from different workers cannot overtake each other.
+        for seq in sorted(self._done):
+            earlier_pending = any(p < seq for p in self._pending)
+            frame, finished = self._done[seq]
+            if earlier_pending and now - finished < self.max_wait:
+                break
+            del self._done[seq]
+            self._delivered_seq = seq
+            if frame is not None:
+                self.on_frame(frame)
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._queue.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=1.0)
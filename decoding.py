@@ -0,0 +1,89 @@
+import struct
+
+import cv2
+import numpy as np
+
+# JPEG can be decoded at 1/2, 1/4 or 1/8 scale almost for free by dropping
+# DCT coefficients, which is much cheaper than decoding everything and
+# throwing most of it away in QPixmap.scaled().
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share
+# the range but are not frame headers.
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(data):
+    """Return (width, height) from the JPEG SOF header, or None if not found."""
+    data = memoryview(data)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    pos = 2
+    end = len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            pos += 2
+            continue
+        if marker == 0xDA:
+            return None
+        segment_length = struct.unpack_from('>H', data, pos + 2)[0]
+        if marker in SOF_MARKERS:
+            if pos + 9 > end:
+                return None
+            height, width = struct.unpack_from('>HH', data, pos + 5)
+            return width, height
+        pos += 2 + segment_length
+    return None
+
+
+def reduced_decode_flag(source_size, target_size):
+    """Pick the cheapest imread flag that still covers target_size.
+
+    The frame is shown with Qt.KeepAspectRatio, so it is displayed at
+    min(target_w / w, target_h / h) of its size; any reduction that keeps it
+    at least that large is invisible to the user.
+    """
+    factor = reduction_factor(source_size, target_size)
+    for reduced, flag in REDUCED_FLAGS:
+        if reduced == factor:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def reduction_factor(source_size, target_size):
+    """Largest of 8, 4, 2 or 1 that source_size can be divided by and still cover target_size."""
+    if source_size is None or target_size is None:
+        return 1
+
+    width, height = source_size
+    target_width, target_height = target_size
+    if width <= 0 or height <= 0 or target_width <= 0 or target_height <= 0:
+        return 1
+
+    scale = min(target_width / width, target_height / height)
+    for factor, _ in REDUCED_FLAGS:
+        if scale * factor <= 1.0:
+            return factor
+    return 1
+
+
+def decode_frame(data, target_size=None):
+    """Decode a JPEG payload, at reduced resolution if target_size allows it.
+
+    Pass target_size=None for a full-resolution decode.
+    """
+    flag = cv2.IMREAD_COLOR
+    if target_size is not None:
+        flag = reduced_decode_flag(jpeg_size(data), target_size)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
@@ -0,0 +1,145 @@
+from protocol import (
+    ACK_MAGIC, FRAME_HEADER, HELLO_ACK, LEGACY_HEADER, monotonic_us, pack_hello,
+    unpack_frame_header,
+)
+
+# Anything bigger than this is almost certainly a desynchronised stream
+# rather than a real JPEG, so fail loudly instead of allocating it.
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+_START, _ACK, _HEADER, _PAYLOAD = range(4)
+
+
+class FrameParser:
+    """Incremental parser for the frame stream, independent of socket mode.
+
+    The caller fills pending_view() (typically with recv_into) and reports
+    how many bytes it wrote via advance(); advance() returns the payload as a
+    memoryview over an internal reusable buffer once a frame is complete.
+    That view stays valid only until the next advance().
+
+    With negotiate=True the parser expects either a v2 HELLO_ACK or a legacy
+    length prefix first (the caller sends the hello). `version`, `info` and
+    `clock_offset` describe the stream as in FrameReader.
+    """
+
+    def __init__(self, initial_size=256 * 1024, max_frame_size=MAX_FRAME_SIZE, negotiate=False):
+        self.max_frame_size = max_frame_size
+        self._header = bytearray(max(FRAME_HEADER.size, HELLO_ACK.size))
+        self._header_view = memoryview(self._header)
+        self._buffer = bytearray(initial_size)
+        self._view = memoryview(self._buffer)
+
+        self.version = None if negotiate else 1
+        self.info = None
+        self.clock_offset = 0
+        self._state = None
+        self._target = None
+        self._need = 0
+        self._filled = 0
+        if negotiate:
+            self._expect(_START, self._header_view, LEGACY_HEADER.size)
+        else:
+            self._expect_header()
+
+    @property
+    def at_boundary(self):
+        """True when no part of a frame has been consumed yet."""
+        return self._filled == 0 and self._state in (_START, _HEADER)
+
+    def _expect(self, state, target, size):
+        self._state = state
+        self._target = target
+        self._need = size
+        self._filled = 0
+
+    def _expect_header(self):
+        size = LEGACY_HEADER.size if self.version == 1 else FRAME_HEADER.size
+        self._expect(_HEADER, self._header_view, size)
+
+    def _expect_payload(self, length):
+        if length > self.max_frame_size:
+            raise ValueError(f"Frame length {length} exceeds limit, stream out of sync")
+        if length > len(self._buffer):
+            self._buffer = bytearray(max(length, len(self._buffer) * 2))
+            self._view = memoryview(self._buffer)
+        self._expect(_PAYLOAD, self._view, length)
+
+    def pending_view(self):
+        """Writable view of the bytes still needed for the current step."""
+        return self._target[self._filled:self._need]
+
+    def advance(self, n):
+        """Account for n bytes written to pending_view(); return a payload or None."""
+        self._filled += n
+        while self._filled >= self._need:
+            if self._state == _PAYLOAD:
+                payload = self._view[:self._need]
+                self._expect_header()
+                return payload
+            if self._state == _START:
+                if bytes(self._header[:4]) == ACK_MAGIC:
+                    self._state, self._need = _ACK, HELLO_ACK.size
+                    continue
+                self.version = 1
+                self._expect_payload(LEGACY_HEADER.unpack_from(self._header)[0])
+            elif self._state == _ACK:
+                _, version, _, client_time, server_time = HELLO_ACK.unpack_from(self._header)
+                self.clock_offset = server_time - (client_time + monotonic_us()) // 2
+                self.version = version
+                self._expect_header()
+            elif self.version == 1:
+                self._expect_payload(LEGACY_HEADER.unpack_from(self._header)[0])
+            else:
+                self.info, length = unpack_frame_header(self._header_view[:FRAME_HEADER.size])
+                self._expect_payload(length)
+        return None
+
+
+class FrameReader:
+    """Reads length-prefixed frames from a socket into one reusable buffer.
+
+    read_frame() returns a memoryview over the internal buffer. It stays
+    valid only until the next call, which is exactly what imdecode needs:
+    np.frombuffer(view, np.uint8) wraps it without copying.
+
+    With negotiate=True a v2 hello is sent first and the reader switches to
+    the v2 header if the server acknowledges it; `info` then holds the
+    FrameInfo of the last frame and `clock_offset` the server-minus-client
+    monotonic clock difference in microseconds. Against a legacy server
+    `version` stays 1 and `info` is None. hello_flags (such as HELLO_TILES)
+    tell the server what else the caller can decode.
+    """
+
+    def __init__(self, sock, initial_size=256 * 1024, max_frame_size=MAX_FRAME_SIZE, negotiate=False,
+                 hello_flags=0):
+        self.sock = sock
+        self.parser = FrameParser(initial_size, max_frame_size, negotiate)
+        if negotiate:
+            sock.sendall(pack_hello(hello_flags))
+
+    @property
+    def version(self):
+        return self.parser.version
+
+    @property
+    def info(self):
+        return self.parser.info
+
+    @property
+    def clock_offset(self):
+        return self.parser.clock_offset
+
+    def read_frame(self):
+        """Return the next payload as a memoryview, or None on clean EOF."""
+        parser = self.parser
+        while True:
+            view = parser.pending_view()
+            n = self.sock.recv_into(view, len(view)) if len(view) else 0
+            if n == 0 and len(view):
+                if parser.at_boundary:
+                    return None
+                raise ConnectionError("Connection closed inside a frame")
+            payload = parser.advance(n)
+            if payload is not None:
+                return payload
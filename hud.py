@@ -0,0 +1,75 @@
+import time
+
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QLabel
+
+STAGES = ('recv', 'decode', 'convert', 'paint')
+
+
+class MetricsOverlay(QLabel):
+    """Semi-transparent HUD drawn over a video label.
+
+    The text is refreshed from a Metrics on a timer while the overlay is
+    visible, never per frame, so showing it does not slow the video down.
+    """
+
+    def __init__(self, parent, interval_ms=500):
+        super().__init__(parent)
+        self.metrics = None
+        self._last_frames = 0
+        self._last_bytes = 0
+        self._last_time = time.monotonic()
+
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 160); color: white;"
+            "font-family: monospace; padding: 6px;"
+        )
+        self.move(8, 8)
+        self.hide()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.refresh)
+
+    def show_metrics(self, metrics):
+        self.metrics = metrics
+        self._last_frames = metrics.counters.get('frames_displayed', 0)
+        self._last_bytes = metrics.counters.get('bytes_received', 0)
+        self._last_time = time.monotonic()
+        self.setText("Waiting for frames...")
+        self.adjustSize()
+        self.show()
+        self.raise_()
+        self.timer.start()
+
+    def hide_metrics(self):
+        self.timer.stop()
+        self.metrics = None
+        self.hide()
+
+    def refresh(self):
+        metrics = self.metrics
+        if metrics is None:
+            return
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-6)
+        frames = metrics.counters.get('frames_displayed', 0)
+        received = metrics.counters.get('bytes_received', 0)
+        fps = (frames - self._last_frames) / elapsed
+        mbytes = (received - self._last_bytes) / elapsed / 1e6
+        self._last_frames, self._last_bytes, self._last_time = frames, received, now
+
+        p50, _, p99 = metrics.quantiles('latency')
+        lines = [
+            f"{fps:5.1f} fps  {mbytes:5.2f} MB/s",
+            f"latency  {p50 * 1000:6.1f} / {p99 * 1000:6.1f} ms",
+        ]
+        for stage in STAGES:
+            p50, _, p99 = metrics.quantiles(stage)
+            lines.append(f"{stage:<8} {p50 * 1000:6.2f} / {p99 * 1000:6.2f} ms")
+        lines.append(f"dropped {metrics.counters.get('frames_dropped', 0)}"
+                     f"  lost {metrics.gauges.get('frames_lost', 0)}")
+        self.setText("\n".join(lines))
+        self.adjustSize()
@@ -0,0 +1,202 @@
+"""Map panel that starts QtWebEngine only when it is first shown.
+
+Importing QtWebEngineWidgets and creating the first QWebEngineView start
+Chromium, which dominates the start-up time and memory of the windows.
+MapPanel is an empty widget until its first showEvent; the view is created
+on the next turn of the event loop, after the window has been painted.
+
+By default the page loads the Yandex Maps JS API from the network, as
+before. With tile_url set, the page is a small self-contained tile viewer
+instead, fed through a local TileCache server: tiles come from tile_url
+(any {z}/{x}/{y} server, such as a tile server on the local network) and
+stay on disk, within cache_bytes, so they keep working offline.
+
+QtWebEngine can only be imported after the QApplication exists when
+Qt.AA_ShareOpenGLContexts was set before creating it; the windows' main
+blocks do that.
+"""
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QLabel, QVBoxLayout, QWidget
+
+from tile_cache import TileCache, serve_tiles
+
+MAP_CENTER = (56.479187, 85.068086)
+MAP_ZOOM = 10
+
+YANDEX_MAPS_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <script src="https://api-maps.yandex.ru/2.1/?lang=ru_RU" type="text/javascript"></script>
+    <style>
+        html, body, #map {
+            width: 100%%;
+            height: 100%%;
+            margin: 0;
+            padding: 0;
+        }
+    </style>
+</head>
+<body>
+    <div id="map"></div>
+    <script>
+        ymaps.ready(init);
+        function init() {
+            var map = new ymaps.Map("map", {
+                center: [%(lat)f, %(lon)f],
+                zoom: %(zoom)d
+            });
+        }
+    </script>
+</body>
+</html>
+"""
+
+# Drag to pan, wheel to zoom; Web Mercator tiles as used by OSM-style servers
+TILE_VIEWER_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        html, body, #map {
+            width: 100%%;
+            height: 100%%;
+            margin: 0;
+            padding: 0;
+            overflow: hidden;
+            background: #ddd;
+            position: relative;
+        }
+        #map img {
+            position: absolute;
+            width: 256px;
+            height: 256px;
+            user-select: none;
+        }
+    </style>
+</head>
+<body>
+    <div id="map"></div>
+    <script>
+        var template = "%(template)s";
+        var zoom = %(zoom)d;
+        var centre = project(%(lat)f, %(lon)f, zoom);
+        var map = document.getElementById("map");
+        var pending = false;
+
+        function project(lat, lon, z) {
+            var size = 256 * Math.pow(2, z);
+            var s = Math.sin(lat * Math.PI / 180);
+            return [(lon + 180) / 360 * size, (0.5 - Math.log((1 + s) / (1 - s)) / (4 * Math.PI)) * size];
+        }
+
+        function render() {
+            pending = false;
+            var left = centre[0] - map.clientWidth / 2, top = centre[1] - map.clientHeight / 2;
+            var count = Math.pow(2, zoom), html = "";
+            for (var ty = Math.floor(top / 256); ty * 256 < top + map.clientHeight; ty++) {
+                if (ty < 0 || ty >= count) continue;
+                for (var tx = Math.floor(left / 256); tx * 256 < left + map.clientWidth; tx++) {
+                    var x = ((tx %% count) + count) %% count;
+                    html += '<img src="' + template.replace("{z}", zoom).replace("{x}", x).replace("{y}", ty)
+                        + '" style="left:' + Math.round(tx * 256 - left) + 'px;top:' + Math.round(ty * 256 - top) + 'px">';
+                }
+            }
+            map.innerHTML = html;
+        }
+
+        function schedule() {
+            if (!pending) {
+                pending = true;
+                requestAnimationFrame(render);
+            }
+        }
+
+        var drag = null;
+        map.onmousedown = function (e) { drag = [e.clientX, e.clientY]; e.preventDefault(); };
+        window.onmouseup = function () { drag = null; };
+        window.onmousemove = function (e) {
+            if (!drag) return;
+            centre[0] -= e.clientX - drag[0];
+            centre[1] -= e.clientY - drag[1];
+            drag = [e.clientX, e.clientY];
+            schedule();
+        };
+        map.onwheel = function (e) {
+            var step = e.deltaY < 0 ? 1 : -1;
+            if (zoom + step < 0 || zoom + step > 19) return;
+            zoom += step;
+            centre = [centre[0] * Math.pow(2, step), centre[1] * Math.pow(2, step)];
+            schedule();
+        };
+        window.onresize = schedule;
+        render();
+    </script>
+</body>
+</html>
+"""
+
+
+class MapPanel(QWidget):
+    """Placeholder that turns into a QWebEngineView on first show.
+
+    If QtWebEngine cannot be imported, or the panel is disabled, a label
+    takes the view's place and the rest of the window works as usual.
+    """
+
+    def __init__(self, parent=None, tile_url=None, cache_dir='tiles', cache_bytes=256 * 1024 * 1024,
+                 enabled=True):
+        super().__init__(parent)
+        self.tile_url = tile_url
+        self.cache_dir = cache_dir
+        self.cache_bytes = cache_bytes
+        self.enabled = enabled
+        self.view = None
+        self.tile_cache = None
+        self.tile_server = None
+        self._started = False
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        if not enabled:
+            self._show_message("Map disabled")
+
+    def _show_message(self, text):
+        label = QLabel(text, self)
+        label.setAlignment(Qt.AlignCenter)
+        self.layout().addWidget(label)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.enabled and not self._started:
+            self._started = True
+            QTimer.singleShot(0, self.create_view)
+
+    def create_view(self):
+        """Import QtWebEngine and load the map; normally called on first show."""
+        if self.view is not None:
+            return
+        try:
+            from PyQt5.QtWebEngineWidgets import QWebEngineView
+        except ImportError as e:
+            self._show_message(f"Map unavailable: {e}")
+            return
+        self.view = QWebEngineView(self)
+        self.layout().addWidget(self.view)
+        self.view.setHtml(self.page_html())
+
+    def page_html(self):
+        lat, lon = MAP_CENTER
+        if not self.tile_url:
+            return YANDEX_MAPS_HTML % {'lat': lat, 'lon': lon, 'zoom': MAP_ZOOM}
+        if self.tile_server is None:
+            self.tile_cache = TileCache(self.cache_dir, self.tile_url, self.cache_bytes)
+            self.tile_server = serve_tiles(self.tile_cache)
+        template = f"http://127.0.0.1:{self.tile_server.server_address[1]}/{{z}}/{{x}}/{{y}}"
+        return TILE_VIEWER_HTML % {'template': template, 'lat': lat, 'lon': lon, 'zoom': MAP_ZOOM}
+
+    def stop(self):
+        if self.tile_server:
+            self.tile_server.shutdown()
+            self.tile_server.server_close()
+            self.tile_server = None
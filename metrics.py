@@ -0,0 +1,146 @@
+"""Per-stage timers and counters for the video pipeline.
+
+Instrumented code holds a `metrics` attribute that is None unless metrics are
+wanted, and only does work behind an `if metrics is not None` check, so an
+idle pipeline pays one attribute load per stage:
+
+    metrics = self.metrics
+    if metrics is not None:
+        start = time.perf_counter()
+    ...
+    if metrics is not None:
+        metrics.observe('decode', time.perf_counter() - start)
+
+The same Metrics can be rendered in the Prometheus text format, served on a
+local port with serve_metrics() or written to a file with MetricsDumper.
+"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """The last `size` samples of a value, kept in a ring buffer."""
+
+    def __init__(self, size=512):
+        self.samples = np.zeros(size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples[self.count % len(self.samples)] = value
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        filled = min(self.count, len(self.samples))
+        if not filled:
+            return [0.0] * len(quantiles)
+        return np.percentile(self.samples[:filled], [q * 100 for q in quantiles]).tolist()
+
+
+class Metrics:
+    """Counters, gauges and rolling histograms, named by plain strings.
+
+    Writers may be on any thread. Updates are not locked: a reader can see a
+    histogram one sample behind, which is fine for monitoring.
+    """
+
+    def __init__(self, window=512, prefix='qtvideo'):
+        self.window = window
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.monotonic()
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram(self.window))
+        histogram.observe(seconds)
+
+    def quantiles(self, name, quantiles=QUANTILES):
+        histogram = self.histograms.get(name)
+        return histogram.quantiles(quantiles) if histogram else [0.0] * len(quantiles)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = f"{self.prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in sorted(self.gauges.items()):
+            metric = f"{self.prefix}_{name}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f"{self.prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for q, value in zip(QUANTILES, histogram.quantiles()):
+                lines.append(f'{metric}{{quantile="{q}"}} {value:.6f}')
+            lines += [f"{metric}_sum {histogram.total:.6f}", f"{metric}_count {histogram.count}"]
+        metric = f"{self.prefix}_uptime_seconds"
+        lines += [f"# TYPE {metric} gauge", f"{metric} {time.monotonic() - self.started:.1f}"]
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics, port, host='127.0.0.1'):
+    """Serve metrics.render() over HTTP on a daemon thread; return the server.
+
+    Stop it with server.shutdown(); server.server_close().
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+class MetricsDumper(threading.Thread):
+    """Rewrites a file with metrics.render() every `interval` seconds.
+
+    The file is replaced atomically, so a reader never sees half a dump.
+    """
+
+    def __init__(self, metrics, path, interval=5.0):
+        super().__init__(name='metrics-dump', daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.dump()
+        self.dump()
+
+    def dump(self):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(self.metrics.render())
+        os.replace(temporary, self.path)
+
+    def stop(self):
+        self._stopped.set()
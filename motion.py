@@ -0,0 +1,181 @@
+"""Motion and change detection inside the ROIs of the live stream.
+
+Each frame is shrunk to a small grayscale image and compared with a running
+background (cv2.accumulateWeighted). The changed pixels form a mask whose
+integral image gives the changed area of any rectangle from four lookups, so
+the score of every ROI comes from one fancy-indexing expression, whatever
+the number of ROIs or their size.
+"""
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+MotionEvent = collections.namedtuple('MotionEvent', 'roi_id label started score timestamp')
+
+
+class MotionDetector:
+    """Per-ROI change scores against a running background.
+
+    rects are x, y, w, h in the coordinates of image_size (the image the
+    ROIs were drawn on); frames of another size are mapped onto it. Without
+    image_size the ROIs are in frame coordinates.
+
+    A score is the fraction of an ROI's pixels that differ from the
+    background by more than pixel_threshold. An ROI becomes active when its
+    score reaches threshold and inactive again when it falls below half of
+    that; both transitions are returned by process() as MotionEvents.
+    """
+
+    def __init__(self, analysis_width=160, learning_rate=0.05, pixel_threshold=25, threshold=0.02):
+        self.analysis_width = analysis_width
+        self.learning_rate = learning_rate
+        self.pixel_threshold = pixel_threshold
+        self.threshold = threshold
+
+        self.ids = np.zeros(0, np.int64)
+        self.labels = []
+        self.scores = np.zeros(0)
+        self.active = np.zeros(0, bool)
+        self._rects = np.zeros((0, 4), np.float64)
+        self._image_size = None
+        self._boxes = None
+        self._boxes_for = None
+        self._background = None
+
+    def set_rois(self, rects, ids=None, labels=None, image_size=None):
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        self._rects = rects
+        self.ids = np.arange(len(rects)) if ids is None else np.asarray(ids, dtype=np.int64)
+        self.labels = [''] * len(rects) if labels is None else list(labels)
+        self._image_size = image_size
+        self.scores = np.zeros(len(rects))
+        self.active = np.zeros(len(rects), bool)
+        self._boxes_for = None
+
+    def reset(self):
+        """Forget the background, for example after the camera moved."""
+        self._background = None
+
+    def _analysis_size(self, frame):
+        h, w = frame.shape[:2]
+        width = min(self.analysis_width, w)
+        return width, max(1, round(h * width / w))
+
+    def _boxes_for_size(self, frame_size, small_size):
+        """ROI corners in the analysis image, as integral-image indices."""
+        key = (frame_size, small_size)
+        if self._boxes_for != key:
+            source = self._image_size or frame_size
+            scale = np.array([small_size[0] / source[0], small_size[1] / source[1]] * 2)
+            corners = self._rects.copy()
+            corners[:, 2:] += corners[:, :2]
+            corners = np.rint(corners * scale).astype(np.int64)
+            corners[:, 0::2] = corners[:, 0::2].clip(0, small_size[0])
+            corners[:, 1::2] = corners[:, 1::2].clip(0, small_size[1])
+            # an ROI smaller than one analysis pixel still covers that pixel
+            corners[:, 2] = np.maximum(corners[:, 2], np.minimum(corners[:, 0] + 1, small_size[0]))
+            corners[:, 3] = np.maximum(corners[:, 3], np.minimum(corners[:, 1] + 1, small_size[1]))
+            area = (corners[:, 2] - corners[:, 0]) * (corners[:, 3] - corners[:, 1])
+            self._boxes = corners, np.maximum(area, 1)
+            self._boxes_for = key
+        return self._boxes
+
+    def process(self, frame, timestamp=None):
+        """Score a BGR or grayscale frame; returns the MotionEvents it caused."""
+        frame_size = (frame.shape[1], frame.shape[0])
+        small_size = self._analysis_size(frame)
+        small = cv2.resize(frame, small_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (3, 3), 0).astype(np.float32)
+
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small
+            return []
+        changed = cv2.absdiff(small, self._background) > self.pixel_threshold
+        cv2.accumulateWeighted(small, self._background, self.learning_rate)
+        if not len(self._rects):
+            return []
+
+        integral = cv2.integral(changed.view(np.uint8))
+        corners, area = self._boxes_for_size(frame_size, small_size)
+        x0, y0, x1, y1 = corners.T
+        counts = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        self.scores = counts / area
+
+        started = ~self.active & (self.scores >= self.threshold)
+        ended = self.active & (self.scores < self.threshold / 2)
+        self.active ^= started | ended
+        events = []
+        if started.any() or ended.any():
+            timestamp = time.time() if timestamp is None else timestamp
+            for i in np.flatnonzero(started | ended).tolist():
+                events.append(MotionEvent(int(self.ids[i]), self.labels[i], bool(started[i]),
+                                          float(self.scores[i]), timestamp))
+        return events
+
+
+class MotionMonitor(threading.Thread):
+    """Runs a MotionDetector on a worker thread, always on the newest frame.
+
+    submit() never blocks: a frame submitted while the detector is busy
+    replaces the one waiting, so it can be called from the receiving thread
+    for every decoded frame. Events are passed to on_events (on this
+    thread) as a list. Assigning a Metrics to `metrics` times the stage as
+    'motion'.
+    """
+
+    def __init__(self, detector=None, on_events=None):
+        super().__init__(daemon=True)
+        self.detector = detector or MotionDetector()
+        self.on_events = on_events
+        self.metrics = None
+        self.frames_analyzed = 0
+        self.frames_skipped = 0
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._rois = None
+        self._running = True
+
+    def set_rois(self, rects, ids=None, labels=None, image_size=None):
+        """Replace the ROIs; applied before the next frame is analyzed."""
+        with self._cond:
+            self._rois = (rects, ids, labels, image_size)
+
+    def submit(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.frames_skipped += 1
+            self._frame = frame
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._running and self._frame is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                frame, self._frame = self._frame, None
+                rois, self._rois = self._rois, None
+            if rois is not None:
+                self.detector.set_rois(*rois)
+
+            start = time.perf_counter()
+            events = self.detector.process(frame)
+            self.frames_analyzed += 1
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.observe('motion', time.perf_counter() - start)
+                metrics.count('motion_events', len(events))
+            if events and self.on_events:
+                self.on_events(events)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
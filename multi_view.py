@@ -0,0 +1,134 @@
+import math
+
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (
+    QGridLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QTextEdit, QVBoxLayout, QWidget
+)
+
+from display import frame_to_qimage, scaled_pixmap
+from protocol import parse_address
+from stream_mux import StreamMux, StreamSession
+
+
+def parse_addresses(text):
+    """Parse 'host[:port], [ipv6]:port ...' into (host, port) pairs, as parse_address does."""
+    items = text.replace(';', ',').replace(' ', ',').split(',')
+    return [parse_address(item) for item in items if item.strip()]
+
+
+class MultiStreamWidget(QWidget):
+    """Grid of camera streams sharing one StreamMux I/O loop.
+
+    Decoded frames are picked up in a single coalesced GUI update: however
+    many streams produce frames, at most one refresh is queued at a time and
+    it shows the newest frame of every stream.
+
+    With a CalibrationStore, streams of cameras calibrated in it (by
+    'host:port' or 'host') are undistorted using its cached maps.
+    """
+
+    frames_ready = pyqtSignal()
+    stream_failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, max_fps=15, decode_workers=2, calibrations=None):
+        super().__init__(parent)
+        self.max_fps = max_fps
+        self.decode_workers = decode_workers
+        self.calibrations = calibrations
+        self.mux = None
+        self.tiles = []
+        self._update_pending = False
+
+        self.address_input = QLineEdit(self)
+        self.address_input.setPlaceholderText("host[:port], host[:port], ...")
+
+        self.connect_button = QPushButton("Connect", self)
+        self.connect_button.clicked.connect(self.connect_streams)
+
+        self.disconnect_button = QPushButton("Disconnect", self)
+        self.disconnect_button.clicked.connect(self.disconnect_streams)
+        self.disconnect_button.setEnabled(False)
+
+        self.info_text = QTextEdit(self)
+        self.info_text.setReadOnly(True)
+        self.info_text.setFixedHeight(50)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.address_input)
+        controls.addWidget(self.connect_button)
+        controls.addWidget(self.disconnect_button)
+
+        self.grid = QGridLayout()
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(controls)
+        layout.addWidget(self.info_text)
+        layout.addLayout(self.grid, 1)
+
+        self.frames_ready.connect(self.refresh)
+        self.stream_failed.connect(self.info_text.append)
+
+    def connect_streams(self):
+        try:
+            addresses = parse_addresses(self.address_input.text())
+        except ValueError as e:
+            self.info_text.append(str(e))
+            return
+        if not addresses:
+            self.info_text.append("At least one address is required")
+            return
+
+        self.mux = StreamMux(self._on_frame, self._on_error, self.decode_workers)
+        columns = math.ceil(math.sqrt(len(addresses)))
+        for i, (host, port) in enumerate(addresses):
+            label = QLabel(f"{host}:{port}", self)
+            label.setAlignment(Qt.AlignCenter)
+            label.setMinimumSize(320, 180)
+            self.grid.addWidget(label, i // columns, i % columns)
+            session = StreamSession(host, port, self.max_fps)
+            if self.calibrations is not None:
+                session.undistorter = self.calibrations.undistorter([session.name, host])
+            self.tiles.append((session, label))
+            self.mux.add(session)
+        self.mux.start()
+
+        self.connect_button.setEnabled(False)
+        self.disconnect_button.setEnabled(True)
+
+    def disconnect_streams(self):
+        if self.mux:
+            self.mux.stop()
+            self.mux.join(timeout=1.0)
+            self.mux = None
+        for _, label in self.tiles:
+            self.grid.removeWidget(label)
+            label.deleteLater()
+        self.tiles = []
+        self.connect_button.setEnabled(True)
+        self.disconnect_button.setEnabled(False)
+
+    def _on_frame(self, session):
+        # Called from decode workers; only queue a refresh if none is pending
+        if not self._update_pending:
+            self._update_pending = True
+            self.frames_ready.emit()
+
+    def _on_error(self, session, message):
+        self.stream_failed.emit(f"{session.name}: {message}")
+
+    def refresh(self):
+        self._update_pending = False
+        if not self.isVisible():
+            # Frames stay in their sessions until the tab is shown again
+            return
+        for session, label in self.tiles:
+            session.display_size = (label.width(), label.height())
+            frame = session.take_frame()
+            if frame is None:
+                continue
+            qimage, _ = frame_to_qimage(frame)
+            label.setPixmap(scaled_pixmap(qimage, label.size()))
+
+    def closeEvent(self, event):
+        self.disconnect_streams()
+        event.accept()
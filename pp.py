@@ -1,18 +1,48 @@
 import sys
-import socket
-import struct
 import cv2
 import numpy as np
-from PyQt5.QtCore import Qt, QTimer, QRect
-from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget, QLineEdit, QPushButton,
-    QTextEdit, QSplitter, QTabWidget, QFileDialog, QSpinBox, QHBoxLayout
+    QTextEdit, QSplitter, QTabWidget, QFileDialog, QDoubleSpinBox, QHBoxLayout
 )
-from PyQt5.QtWebEngineWidgets import QWebEngineView
+
+from calibration_store import CalibrationStore
+from display import FrameDisplay
+from hud import MetricsOverlay
+from map_panel import MapPanel
+from metrics import Metrics, MetricsDumper, serve_metrics
+from motion import MotionMonitor
+from multi_view import MultiStreamWidget
+from protocol import DEFAULT_PORT
+from stream_core import CallbackSink, ViewerSession
+from roi_canvas import RoiCanvas
+from roi_store import RoiStore
+from undistort import CALIBRATION_FIELDS, CALIBRATION_FILE, Undistorter
+
+# Number of threads decoding frames in parallel; 0 decodes on the receiver thread
+DECODE_WORKERS = 0
+DECODE_QUEUE_DEPTH = 4
+
+# Export pipeline metrics in the Prometheus text format on this local port
+# and/or to this file every few seconds; 0 and None turn the export off
+METRICS_PORT = 0
+METRICS_FILE = None
+
+# The map panel starts the embedded browser only when first shown. With
+# MAP_TILE_URL set (a {z}/{x}/{y} tile server, e.g. one on the local network)
+# the map is drawn from tiles cached in tiles/ instead of the Yandex Maps API,
+# and keeps working offline within MAP_CACHE_MB
+MAP_ENABLED = True
+MAP_TILE_URL = None
+MAP_CACHE_MB = 256
 
 
 class VideoStreamWindow(QMainWindow):
+    frame_ready = pyqtSignal()
+    stream_error = pyqtSignal(str)
+    motion_events = pyqtSignal(list)
+
     def __init__(self):
         super().__init__()
 
@@ -23,25 +53,46 @@ class VideoStreamWindow(QMainWindow):
         self.tab_widget = QTabWidget()
         self.setCentralWidget(self.tab_widget)
 
+        # Calibrations of the cameras, with their undistortion maps cached on disk
+        self.calibrations = CalibrationStore()
+
+        # Regions of interest drawn on the calibration tab
+        self.rois = RoiStore()
+
         # Tab 1: Video Stream and Map
         self.setup_tab1()
 
         # Tab 2: Camera Calibration
         self.setup_tab2()
 
-        # Socket setup
-        self.client_socket = None
-        self.frame = None
+        # Tab 3: Several cameras at once
+        self.camera_grid = MultiStreamWidget(calibrations=self.calibrations)
+        self.tab_widget.addTab(self.camera_grid, "Cameras")
 
-        # Timer for video updates
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.receive_video)
+        # Connection, decoding and recording, shared with the command line
+        # viewer in stream_core.py; frames arrive through frame_ready
+        self.session = ViewerSession(
+            CallbackSink(self.frame_ready.emit, self.stream_error.emit),
+            decode_workers=DECODE_WORKERS, queue_depth=DECODE_QUEUE_DEPTH,
+        )
+        self.frame = None
+        self.undistorter = None
+        self.motion = None
+        self.display = FrameDisplay([self.video_label], self)
+
+        # Pipeline metrics exist only while the HUD is shown or exported
+        self.metrics = None
+        self.metrics_server = None
+        self.metrics_dumper = None
+        if METRICS_PORT or METRICS_FILE:
+            self.start_metrics_export()
+
+        # Frames are read on a background thread; these signals bring them
+        # back to the GUI thread
+        self.frame_ready.connect(self.receive_video)
+        self.stream_error.connect(self.on_stream_error)
+        self.motion_events.connect(self.on_motion_events)
 
-        # Attributes for drawing
-        self.drawing = False
-        self.start_point = None
-        self.end_point = None
-        self.rectangles = []
         self.original_image = None  # OpenCV image for drawing
 
     def setup_tab1(self):
@@ -66,14 +117,39 @@ class VideoStreamWindow(QMainWindow):
         self.disconnect_button.clicked.connect(self.disconnect_from_server)
         self.disconnect_button.setEnabled(False)
 
+        self.snapshot_button = QPushButton("Save Frame", self)
+        self.snapshot_button.setFixedHeight(80)
+        self.snapshot_button.clicked.connect(self.save_snapshot)
+        self.snapshot_button.setEnabled(False)
+
+        self.record_button = QPushButton("Record", self)
+        self.record_button.setFixedHeight(80)
+        self.record_button.setCheckable(True)
+        self.record_button.toggled.connect(self.toggle_recording)
+
+        self.stats_button = QPushButton("Stats", self)
+        self.stats_button.setFixedHeight(80)
+        self.stats_button.setCheckable(True)
+        self.stats_button.toggled.connect(self.toggle_hud)
+
+        self.motion_button = QPushButton("Motion", self)
+        self.motion_button.setFixedHeight(80)
+        self.motion_button.setCheckable(True)
+        self.motion_button.toggled.connect(self.toggle_motion)
+
         self.sidebar_layout.addWidget(self.ip_input)
         self.sidebar_layout.addWidget(self.connect_button)
         self.sidebar_layout.addWidget(self.disconnect_button)
+        self.sidebar_layout.addWidget(self.snapshot_button)
+        self.sidebar_layout.addWidget(self.record_button)
+        self.sidebar_layout.addWidget(self.stats_button)
+        self.sidebar_layout.addWidget(self.motion_button)
 
         # Video display
         self.video_label = QLabel(self)
         self.video_label.setAlignment(Qt.AlignCenter)
         self.video_label.setFixedSize(1280, 960)
+        self.hud = MetricsOverlay(self.video_label)
 
         # Connection status
         self.info_text = QTextEdit(self)
@@ -81,10 +157,9 @@ class VideoStreamWindow(QMainWindow):
         self.info_text.setReadOnly(True)
         self.info_text.setFixedHeight(50)
 
-        # Yandex Map
-        self.map_view = QWebEngineView(self)
+        # Yandex Map, created on first show
+        self.map_view = MapPanel(self, MAP_TILE_URL, cache_bytes=MAP_CACHE_MB * 1024 * 1024, enabled=MAP_ENABLED)
         self.map_view.setFixedSize(1280, 960)
-        self.load_yandex_maps()
 
         # Splitter layout
         splitter = QSplitter(Qt.Horizontal)
@@ -104,33 +179,50 @@ class VideoStreamWindow(QMainWindow):
 
         # Calibration coefficients inputs
         self.calibration_inputs = []
-        for i in range(10):
-            spin_box = QSpinBox()
-            spin_box.setRange(-1000, 1000)
-            spin_box.setPrefix(f"Coeff {i + 1}: ")
+        for name, minimum, maximum, decimals in CALIBRATION_FIELDS:
+            spin_box = QDoubleSpinBox()
+            spin_box.setRange(minimum, maximum)
+            spin_box.setDecimals(decimals)
+            spin_box.setSingleStep(10 ** -min(decimals, 3))
+            spin_box.setPrefix(f"{name}: ")
+            spin_box.valueChanged.connect(self.update_calibration)
             self.calibration_inputs.append(spin_box)
 
         # Load image button
         self.load_image_button = QPushButton("Load Image")
         self.load_image_button.clicked.connect(self.load_image)
 
+        # Undistorts the live stream with the coefficients above
         self.calibration_inputs_button = QPushButton("Calibrate")
+        self.calibration_inputs_button.setCheckable(True)
+        self.calibration_inputs_button.toggled.connect(self.toggle_undistort)
 
         self.video_label2 = QLabel(self)
         self.video_label2.setAlignment(Qt.AlignCenter)
         self.video_label2.setFixedSize(1280, 960)    
 
         # Image display and editing
-        self.image_label = QLabel()
+        self.image_label = RoiCanvas(self.rois)
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setFixedSize(959, 926)
 
         # Add delete rectangle button
         self.delete_rect_input = QLineEdit(self)
-        self.delete_rect_input.setPlaceholderText("Enter rectangle number to delete")
+        self.delete_rect_input.setPlaceholderText("Enter ROI id to delete")
         self.delete_rect_button = QPushButton("Delete Rectangle", self)
         self.delete_rect_button.clicked.connect(self.delete_rectangle)
 
+        # ROI label, bulk delete, export and import
+        self.roi_label_input = QLineEdit(self)
+        self.roi_label_input.setPlaceholderText("Label for new and selected rectangles")
+        self.roi_label_input.textChanged.connect(self.set_roi_label)
+        self.delete_selected_button = QPushButton("Delete Selected", self)
+        self.delete_selected_button.clicked.connect(self.delete_selected_rois)
+        self.export_rois_button = QPushButton("Export ROIs", self)
+        self.export_rois_button.clicked.connect(self.export_rois)
+        self.import_rois_button = QPushButton("Import ROIs", self)
+        self.import_rois_button.clicked.connect(self.import_rois)
+
         # Layout setup for calibration
         calibration_layout = QVBoxLayout()
         for spin_box in self.calibration_inputs:
@@ -145,6 +237,15 @@ class VideoStreamWindow(QMainWindow):
         delete_widget = QWidget()
         delete_widget.setLayout(delete_layout)
 
+        # Layout for ROI operations
+        roi_layout = QHBoxLayout()
+        roi_layout.addWidget(self.roi_label_input)
+        roi_layout.addWidget(self.delete_selected_button)
+        roi_layout.addWidget(self.export_rois_button)
+        roi_layout.addWidget(self.import_rois_button)
+        roi_widget = QWidget()
+        roi_widget.setLayout(roi_layout)
+
         # Create splitter and add widgets
         splitter = QSplitter(Qt.Horizontal)
 
@@ -153,6 +254,7 @@ class VideoStreamWindow(QMainWindow):
         splitter2.addWidget(self.load_image_button)
         splitter2.addWidget(self.calibration_inputs_button)
         splitter2.addWidget(delete_widget)  # Add delete layout to the splitter
+        splitter2.addWidget(roi_widget)
 
         # Add vertical splitter and image/video widgets
         splitter.addWidget(splitter2)
@@ -162,176 +264,256 @@ class VideoStreamWindow(QMainWindow):
         tab2_layout.addWidget(splitter)
 
         # Add drawing functionality
-        self.image_label.mousePressEvent = self.start_drawing
-        self.image_label.mouseMoveEvent = self.update_drawing
-        self.image_label.mouseReleaseEvent = self.finish_drawing
+        self.image_label.selection_changed.connect(self.show_roi_selection)
+        self.image_label.rois_changed.connect(self.update_motion_rois)
+        self.image_label.image_missing.connect(
+            lambda: self.info_text.append("Please load an image before drawing."))
 
         self.tab_widget.addTab(tab2_widget, "Camera Calibration")
 
-    def load_yandex_maps(self):
-        """Load Yandex Maps in the map view."""
-        yandex_maps_html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <script src="https://api-maps.yandex.ru/2.1/?lang=ru_RU" type="text/javascript"></script>
-            <style>
-                html, body, #map {
-                    width: 100%;
-                    height: 100%;
-                    margin: 0;
-                    padding: 0;
-                }
-            </style>
-        </head>
-        <body>
-            <div id="map"></div>
-            <script>
-                ymaps.ready(init);
-                function init() {
-                    var map = new ymaps.Map("map", {
-                        center: [56.479187, 85.068086],
-                        zoom: 10
-                    });
-                }
-            </script>
-        </body>
-        </html>
-        """
-        self.map_view.setHtml(yandex_maps_html)
-
     def connect_to_server(self):
         ip_address = self.ip_input.text()
         if not ip_address:
             self.info_text.append("IP Address is required")
             return
 
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            self.client_socket.connect((ip_address, 12345))
+            self.session.display_size = (self.video_label.width(), self.video_label.height())
+            self.session.undistorter = self.active_undistorter()
+            self.session.connect(ip_address)
             self.info_text.append(f"Connected to server at {ip_address}")
-            self.timer.start(30)
             self.connect_button.setEnabled(False)
             self.disconnect_button.setEnabled(True)
+            self.snapshot_button.setEnabled(True)
         except Exception as e:
             self.info_text.append(f"Connection failed: {e}")
 
     def disconnect_from_server(self):
-        if self.client_socket:
-            self.client_socket.close()
-            self.client_socket = None
+        if self.session.connected:
+            self.session.disconnect()
             self.connect_button.setEnabled(True)
             self.disconnect_button.setEnabled(False)
-            self.timer.stop()
+            self.snapshot_button.setEnabled(False)
 
     def receive_video(self):
-        if not self.client_socket:
+        frame = self.session.take_frame()
+        if frame is not None:
+            self.frame = frame
+            self.update_video()
+
+    def save_snapshot(self):
+        if self.session.request_snapshot("saved_frame.jpg"):
+            self.info_text.append("Next frame will be saved to saved_frame.jpg")
+
+    def toggle_recording(self, checked):
+        if checked:
+            self.session.start_recording("recordings")
+            self.info_text.append("Recording to recordings/")
+        elif self.session.recorder:
+            recorder = self.session.stop_recording()
+            self.info_text.append(f"Recorded {recorder.frames_written} frames, dropped {recorder.frames_dropped}")
+
+    def toggle_hud(self, checked):
+        if checked:
+            self.set_metrics(self.metrics or Metrics())
+            self.hud.show_metrics(self.metrics)
+        else:
+            self.hud.hide_metrics()
+            if not (self.metrics_server or self.metrics_dumper):
+                self.set_metrics(None)
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+        self.display.metrics = metrics
+        if self.motion:
+            self.motion.metrics = metrics
+        self.session.metrics = metrics
+
+    def start_metrics_export(self):
+        self.set_metrics(self.metrics or Metrics())
+        if METRICS_PORT:
+            try:
+                self.metrics_server = serve_metrics(self.metrics, METRICS_PORT)
+                self.info_text.append(f"Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+            except OSError as e:
+                self.info_text.append(f"Cannot serve metrics: {e}")
+        if METRICS_FILE:
+            self.metrics_dumper = MetricsDumper(self.metrics, METRICS_FILE)
+            self.metrics_dumper.start()
+
+    def stop_metrics_export(self):
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        if self.metrics_dumper:
+            self.metrics_dumper.stop()
+            self.metrics_dumper.join(timeout=1.0)
+            self.metrics_dumper = None
+
+    def toggle_motion(self, checked):
+        if checked and self.motion is None:
+            if not len(self.rois):
+                self.info_text.append("Draw rectangles on the calibration tab to watch for motion")
+                self.motion_button.setChecked(False)
+                return
+            self.motion = MotionMonitor(on_events=self.motion_events.emit)
+            self.motion.metrics = self.metrics
+            self.update_motion_rois()
+            self.motion.start()
+            self.info_text.append(f"Watching {len(self.rois)} rectangles for motion")
+        elif not checked and self.motion is not None:
+            self.motion.stop()
+            self.motion.join(timeout=1.0)
+            self.motion = None
+        self.session.analyzer = self.motion
+
+    def update_motion_rois(self):
+        if self.motion is None:
             return
-
-        try:
-            length_data = self.client_socket.recv(4)
-            if len(length_data) < 4:
+        # Rectangles are drawn on the loaded image, usually a saved frame of
+        # the stream; they are scaled to whatever size frames are decoded at
+        image_size = None
+        if self.original_image is not None:
+            image_size = (self.original_image.shape[1], self.original_image.shape[0])
+        self.motion.set_rois(self.rois.rects(), self.rois.rois['id'], self.rois.rois['label'].tolist(), image_size)
+
+    def on_motion_events(self, events):
+        for event in events:
+            name = f"{event.roi_id} {event.label}".strip()
+            if event.started:
+                self.info_text.append(f"Motion in rectangle {name} ({event.score:.0%})")
+            else:
+                self.info_text.append(f"Motion ended in rectangle {name}")
+
+    def toggle_undistort(self, checked):
+        if checked and self.undistorter is None:
+            self.undistorter = self.load_undistorter()
+            if self.undistorter is None:
+                self.calibration_inputs_button.setChecked(False)
                 return
-
-            length = struct.unpack('I', length_data)[0]
-            data = b"" 
-            while len(data) < length:
-                data += self.client_socket.recv(length - len(data))
-
-            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
-            if frame is not None:
-                self.frame = frame
-                self.update_video()
-        except Exception as e:
-            self.info_text.append(f"Video reception failed: {e}")
+            for box, value in zip(self.calibration_inputs, self.undistorter.values()):
+                box.blockSignals(True)
+                box.setValue(value)
+                box.blockSignals(False)
+        self.session.undistorter = self.active_undistorter()
+
+    def load_undistorter(self):
+        # The calibration store first, then the file of older video.py
+        # versions, then whatever was typed into the boxes
+        undistorter = self.stored_undistorter()
+        if undistorter is not None:
+            return undistorter
+        try:
+            undistorter = Undistorter.load(CALIBRATION_FILE)
+            self.info_text.append(f"Loaded calibration from {CALIBRATION_FILE}")
+            return undistorter
+        except (OSError, KeyError, ValueError) as e:
+            values = [box.value() for box in self.calibration_inputs]
+            if values[0] <= 0 or values[1] <= 0:
+                self.info_text.append(f"No calibration found ({e}); enter fx and fy or run video.py")
+                return None
+            self.info_text.append(f"No calibration found ({e}), using the values entered")
+            undistorter = Undistorter(np.eye(3), np.zeros(5))
+            undistorter.set_values(values)
+            return undistorter
+
+    def stored_undistorter(self):
+        host = self.ip_input.text().strip()
+        size = None
+        info = self.session.info
+        if info is not None and info.width:
+            size = (info.width, info.height)
+        undistorter = self.calibrations.undistorter([f"{host}:{DEFAULT_PORT}", host], size)
+        if undistorter is not None:
+            self.info_text.append(f"Loaded calibration of {host} from {self.calibrations.directory}/")
+        return undistorter
+
+    def active_undistorter(self):
+        if self.calibration_inputs_button.isChecked():
+            return self.undistorter
+        return None
+
+    def update_calibration(self):
+        # Maps are rebuilt lazily, on the next frame after the change
+        values = [box.value() for box in self.calibration_inputs]
+        if self.undistorter and values[0] > 0 and values[1] > 0:
+            self.undistorter.set_values(values)
+
+    def on_stream_error(self, message):
+        self.info_text.append(message)
+        self.disconnect_from_server()
 
     def update_video(self):
         if self.frame is None:
             return
-
-        frame_rgb = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = frame_rgb.shape
-        bytes_per_line = ch * w
-        qimage = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimage)
-        self.video_label.setPixmap(pixmap.scaled(self.video_label.size(), Qt.KeepAspectRatio))
+        self.display.show(self.frame)
 
     def load_image(self):
         filename, _ = QFileDialog.getOpenFileName(self, "Open Image", "", "Image Files (*.png *.jpg *.bmp)")
         if filename:
             self.original_image = cv2.imread(filename)
             self.original_image = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
-            height, width, channel = self.original_image.shape
-            bytes_per_line = channel * width
-            qimage = QImage(self.original_image.data, width, height, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimage)
-            self.image_label.setPixmap(pixmap)
-
-    def start_drawing(self, event):
-        if self.original_image is None:
-            self.info_text.append("Please load an image before drawing.")
-            return
-        self.drawing = True
-        self.start_point = event.pos()
-
-    def update_drawing(self, event):
-        if self.drawing and self.original_image is not None:
-            self.end_point = event.pos()
-            self.repaint_with_opencv()
-
-    def finish_drawing(self, event):
-        if self.drawing and self.original_image is not None:
-            self.drawing = False
-            self.rectangles.append(QRect(self.start_point, self.end_point))
-            self.repaint_with_opencv()
-
-    def repaint_with_opencv(self):
-        if self.original_image is None:
-            return
-
-        image_copy = self.original_image.copy()
-
-        for rect in self.rectangles:
-            cv2.rectangle(
-                image_copy,
-                (rect.x(), rect.y()),
-                (rect.x() + rect.width(), rect.y() + rect.height()),
-                (0, 0, 255),
-                2
-            )
-
-        if self.drawing and self.start_point and self.end_point:
-            cv2.rectangle(
-                image_copy,
-                (self.start_point.x(), self.start_point.y()),
-                (self.end_point.x(), self.end_point.y()),
-                (0, 255, 0),
-                2
-            )
-
-        height, width, channel = image_copy.shape
-        bytes_per_line = channel * width
-        qimage = QImage(image_copy.data, width, height, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimage)
-        self.image_label.setPixmap(pixmap)
+            self.image_label.set_image(self.original_image)
+            self.update_motion_rois()
 
     def delete_rectangle(self):
         rect_number = self.delete_rect_input.text()
-        if not rect_number.isdigit() or int(rect_number) >= len(self.rectangles) or int(rect_number) < 0:
-            self.info_text.append("Invalid rectangle number.")
+        if not rect_number.isdigit() or not self.rois.remove([int(rect_number)]):
+            self.info_text.append("Invalid ROI id.")
             return
+        self.image_label.refresh()
+        self.update_motion_rois()
+
+    def delete_selected_rois(self):
+        removed = self.image_label.delete_selected()
+        self.info_text.append(f"Deleted {removed} rectangles.")
+
+    def show_roi_selection(self):
+        selected = sorted(self.image_label.selected)
+        if selected:
+            labels = self.rois.rois['label'][self.rois.rows(selected)]
+            self.info_text.append(f"Selected {len(selected)}: "
+                                  + ", ".join(f"{i} {label}".strip() for i, label in zip(selected, labels)))
+
+    def set_roi_label(self, text):
+        self.image_label.new_label = text
+        if self.image_label.selected:
+            self.rois.set_label(list(self.image_label.selected), text)
+            self.update_motion_rois()
+
+    def export_rois(self):
+        filename, _ = QFileDialog.getSaveFileName(self, "Export ROIs", "rois.json", "ROI Files (*.json)")
+        if filename:
+            self.rois.save(filename)
+            self.info_text.append(f"Exported {len(self.rois)} rectangles to {filename}")
 
-        # Remove the specified rectangle
-        self.rectangles.pop(int(rect_number))
-        self.repaint_with_opencv()
+    def import_rois(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Import ROIs", "", "ROI Files (*.json)")
+        if filename:
+            try:
+                self.rois.load(filename)
+            except (OSError, ValueError, KeyError) as e:
+                self.info_text.append(f"Could not import ROIs: {e}")
+                self.image_label.refresh()
+                return
+            self.image_label.refresh()
+            self.update_motion_rois()
+            self.info_text.append(f"Imported {len(self.rois)} rectangles from {filename}")
 
     def closeEvent(self, event):
-        if self.client_socket:
-            self.client_socket.close()
+        self.disconnect_from_server()
+        self.camera_grid.disconnect_streams()
+        self.record_button.setChecked(False)
+        self.motion_button.setChecked(False)
+        self.stop_metrics_export()
+        self.map_view.stop()
         event.accept()
 
 
 if __name__ == '__main__':
+    # Lets map_panel import QtWebEngine after the application exists
+    QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     window = VideoStreamWindow()
     window.show()
@@ -0,0 +1,154 @@
+"""Wire format shared by the client, server and tools.
+
+Version 1 (legacy): native-endian struct 'I' payload length, then the JPEG.
+
+Version 2: every frame starts with a little-endian FRAME_HEADER carrying a
+magic, sequence number, capture timestamp (microseconds of the sender's
+monotonic clock), frame size, codec id and payload length.
+
+A v2 client sends HELLO right after connecting. A v2 server answers with
+HELLO_ACK before the first frame; a legacy server never reads the hello and
+just starts sending v1 frames, which the client recognises because the first
+four bytes are not the ACK magic.
+
+On a v2 connection the client may send FEEDBACK messages back over the same
+socket at any time; the server uses them to adapt quality, resolution and
+frame rate (see adaptive.py).
+
+A client that sets HELLO_TILES in its hello flags can decode the tile-delta
+stream of tile_codec.py: CODEC_TILES frames between JPEG keyframes marked
+with FLAG_KEYFRAME. Other clients are sent a complete JPEG every frame.
+"""
+import collections
+import socket
+import struct
+import time
+
+DEFAULT_PORT = 12345
+
+LEGACY_HEADER = struct.Struct('I')
+
+VERSION = 2
+
+HELLO_MAGIC = b'QTVH'
+ACK_MAGIC = b'QTVA'
+FRAME_MAGIC = b'QTVF'
+
+# magic, version, flags, client monotonic time (us)
+HELLO = struct.Struct('<4sBBxxQ')
+# magic, version, flags, echoed client time (us), server monotonic time (us)
+HELLO_ACK = struct.Struct('<4sBBxxQQ')
+# magic, version, codec, flags, seq, capture time (us), width, height, length
+FRAME_HEADER = struct.Struct('<4sBBBxIQHHI')
+# magic, decode time (us), end-to-end latency (us), queue depth, display width, display height
+FEEDBACK = struct.Struct('<4sIiHHHxx')
+FEEDBACK_MAGIC = b'QTVC'
+
+CODEC_JPEG = 1
+# Never sent over TCP: marks the raw frames of shm_transport.py in FrameInfo
+CODEC_BGR = 2
+# Changed tiles against the last keyframe, see tile_codec.py
+CODEC_TILES = 3
+
+# FrameInfo.flags
+FLAG_KEYFRAME = 1
+
+# HELLO flags
+HELLO_TILES = 1
+
+FrameInfo = collections.namedtuple('FrameInfo', 'seq timestamp width height codec flags')
+Feedback = collections.namedtuple('Feedback', 'decode_us latency_us queue_depth display_width display_height')
+
+
+def monotonic_us():
+    return time.monotonic_ns() // 1000
+
+
+def parse_address(text, default_port=DEFAULT_PORT):
+    """Split "HOST:PORT", "HOST", "[IPV6]:PORT" or a bare IPv6 address into (host, port).
+
+    A missing or empty port means default_port; anything else that is not
+    a port number raises ValueError.
+    """
+    text = text.strip()
+    if text.startswith('['):
+        host, bracket, rest = text[1:].partition(']')
+        if not bracket or (rest and not rest.startswith(':')):
+            raise ValueError(f"Invalid address {text!r}: expected [IPV6]:PORT")
+        port = rest[1:]
+    elif text.count(':') > 1:
+        # An IPv6 address without brackets cannot carry a port
+        return text, default_port
+    else:
+        host, _, port = text.partition(':')
+    if not port:
+        return host, default_port
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"Invalid port {port!r} in address {text!r}")
+    return host, int(port)
+
+
+def pack_hello(flags=0):
+    return HELLO.pack(HELLO_MAGIC, VERSION, flags, monotonic_us())
+
+
+def pack_frame_header(length, seq, timestamp, width=0, height=0, codec=CODEC_JPEG, flags=0):
+    return FRAME_HEADER.pack(FRAME_MAGIC, VERSION, codec, flags,
+                             seq & 0xFFFFFFFF, timestamp, width, height, length)
+
+
+def unpack_frame_header(data):
+    magic, version, codec, flags, seq, timestamp, width, height, length = FRAME_HEADER.unpack(data)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Bad frame magic, stream out of sync")
+    return FrameInfo(seq, timestamp, width, height, codec, flags), length
+
+
+def pack_feedback(feedback):
+    return FEEDBACK.pack(FEEDBACK_MAGIC, min(feedback.decode_us, 0xFFFFFFFF),
+                         max(-0x80000000, min(feedback.latency_us, 0x7FFFFFFF)),
+                         min(feedback.queue_depth, 0xFFFF),
+                         feedback.display_width, feedback.display_height)
+
+
+def unpack_feedback(data):
+    magic, *fields = FEEDBACK.unpack(data)
+    if magic != FEEDBACK_MAGIC:
+        raise ValueError("Bad feedback magic, control channel out of sync")
+    return Feedback(*fields)
+
+
+def pack_frame(payload, info):
+    """Return the header bytes for payload in the negotiated format (None = v1)."""
+    if info is None:
+        return LEGACY_HEADER.pack(len(payload))
+    return pack_frame_header(len(payload), info.seq, info.timestamp,
+                             info.width, info.height, info.codec, info.flags)
+
+
+def server_handshake(sock, timeout=0.2):
+    """Wait briefly for a client hello; return the protocol version to use and the hello flags.
+
+    Legacy clients never send anything, so after the timeout they get v1.
+    """
+    previous_timeout = sock.gettimeout()
+    sock.settimeout(timeout)
+    data = b""
+    try:
+        while len(data) < HELLO.size:
+            chunk = sock.recv(HELLO.size - len(data))
+            if not chunk:
+                break
+            data += chunk
+    except socket.timeout:
+        pass
+    finally:
+        sock.settimeout(previous_timeout)
+
+    if len(data) < HELLO.size:
+        return 1, 0
+    magic, version, flags, client_time = HELLO.unpack(data)
+    if magic != HELLO_MAGIC or version < VERSION:
+        return 1, 0
+    sock.sendall(HELLO_ACK.pack(ACK_MAGIC, VERSION, 0, client_time, monotonic_us()))
+    return VERSION, flags
@@ -0,0 +1,279 @@
+import socket
+import threading
+import time
+
+import cv2
+
+from decode_pool import DecodePool
+from decoding import decode_frame
+from frame_reader import FrameReader
+from protocol import CODEC_TILES, HELLO_TILES, Feedback, pack_feedback, parse_address
+from shm_transport import SHM_PREFIX, SharedMemoryReceiver
+from stream_stats import StreamStats
+from tile_codec import TileDecoder
+from udp_transport import DEFAULT_UDP_PORT, UDP_PREFIX, UdpFrameReader
+
+
+def open_stream(address, on_frame, on_error=None, decode_workers=0, queue_depth=4):
+    """Connect to a stream and return its receiver, not yet started.
+
+    "shm:NAME" attaches to a shared-memory ring published on this host (see
+    shm_transport.py), "udp://HOST:PORT" receives datagrams sent to a
+    multicast group or to this host (see udp_transport.py); anything else
+    is a TCP server given as HOST or HOST:PORT. All receivers have the same
+    interface, and the caller stops, joins and closes them the same way.
+    """
+    if address.startswith(SHM_PREFIX):
+        return SharedMemoryReceiver(address[len(SHM_PREFIX):], on_frame, on_error)
+    if address.startswith(UDP_PREFIX):
+        reader = UdpFrameReader.open(*parse_address(address[len(UDP_PREFIX):], DEFAULT_UDP_PORT))
+        receiver = FrameReceiver(reader.sock, on_frame, on_error, decode_workers, queue_depth, reader)
+        # One-way stream: there is nobody to send feedback to
+        receiver.feedback_interval = 0
+        return receiver
+    sock = socket.create_connection(parse_address(address))
+    return FrameReceiver(sock, on_frame, on_error, decode_workers, queue_depth)
+
+
+class FrameReceiver(threading.Thread):
+    """Background reader for the length-prefixed JPEG stream.
+
+    Frames are decoded on this thread and only the newest one is kept, so
+    the GUI never sees a backlog: if it has not picked up the previous frame
+    by the time the next one is decoded, the previous one is dropped.
+
+    When display_size is set, frames are decoded at the smallest JPEG scale
+    that still fills it. Zooming in (zoom > 1) asks for a larger decode, and
+    request_snapshot() forces one full-resolution decode to disk.
+
+    With decode_workers > 0 decoding is handed to a DecodePool instead, and
+    this thread only reads from the socket.
+
+    If the server speaks the v2 protocol, `stats` holds a StreamStats with
+    latency, drop-rate and jitter for the stream; it stays None otherwise.
+    On such streams the receiver also reports its decode time, backlog and
+    display size to the server every feedback_interval seconds so that an
+    adaptive server can lower quality before latency builds up (0 turns
+    this off). Another source of frames with FrameReader's interface, such
+    as a UdpFrameReader, can be passed as `reader`.
+
+    Assigning a SegmentRecorder to `recorder` records every payload as
+    received, before decoding, and assigning a Metrics to `metrics` times
+    the recv and decode stages; both are None (and free) by default. The
+    recv time includes waiting for the frame to arrive. An Undistorter
+    assigned to `undistorter` is applied to every decoded frame on the
+    decoding thread; snapshots are saved without it. Every published frame,
+    including those the GUI never picks up, is also passed to the submit()
+    of `analyzer` (such as a MotionMonitor), which must not block.
+
+    The receiver asks for the tile-delta stream of tile_codec.py. Keyframes
+    and deltas are composited by a TileDecoder on this thread even with a
+    decode pool, since each delta needs its keyframe. While recording, delta
+    frames are decoded at full resolution and re-encoded as JPEG for the
+    recorder, because recordings hold complete JPEGs.
+    """
+
+    def __init__(self, sock, on_frame, on_error=None, decode_workers=0, queue_depth=4, reader=None):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.reader = reader or FrameReader(sock, negotiate=True, hello_flags=HELLO_TILES)
+        self.tiles = TileDecoder()
+        self.stats = None
+        self.on_frame = on_frame
+        self.on_error = on_error
+
+        self._lock = threading.Lock()
+        self._latest = None
+        self._running = True
+        self._snapshot_path = None
+
+        self.display_size = None
+        self.zoom = 1.0
+        self.recorder = None
+        self.analyzer = None
+        self.feedback_interval = 0.5
+        self.decode_us = 0.0
+        self._last_feedback = 0.0
+
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+        self.pool = None
+        if decode_workers > 0:
+            self.pool = DecodePool(self._publish, workers=decode_workers, queue_depth=queue_depth)
+        self._metrics = None
+        self._undistorter = None
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+        if self.pool:
+            self.pool.metrics = metrics
+
+    @property
+    def info(self):
+        """FrameInfo of the last frame read (None on a legacy stream)."""
+        return self.reader.info
+
+    @property
+    def undistorter(self):
+        return self._undistorter
+
+    @undistorter.setter
+    def undistorter(self, undistorter):
+        self._undistorter = undistorter
+        if self.pool:
+            self.pool.transform = undistorter.apply if undistorter else None
+
+    def run(self):
+        try:
+            while self._running:
+                metrics = self._metrics
+                if metrics is not None:
+                    start = time.perf_counter()
+                data = self.reader.read_frame()
+                if data is None:
+                    break
+                if metrics is not None:
+                    metrics.observe('recv', time.perf_counter() - start)
+                    metrics.count('bytes_received', len(data))
+                    metrics.count('frames_received')
+                if self.reader.info is not None:
+                    if self.stats is None:
+                        self.stats = StreamStats(self.reader.clock_offset)
+                    self.stats.update(self.reader.info)
+                    if metrics is not None:
+                        metrics.observe('latency', self.stats.latency_us / 1e6)
+                        metrics.set('frames_lost', self.stats.frames_lost)
+                    self._send_feedback()
+
+                info = self.reader.info
+                tiled = TileDecoder.wants(info)
+                recorder = self.recorder
+                if recorder is not None and not (tiled and info.codec == CODEC_TILES):
+                    recorder.write(data, info.seq if info else self.frames_received)
+
+                snapshot_path = self._snapshot_path
+                if snapshot_path is not None:
+                    self._snapshot_path = None
+                    try:
+                        snapshot = self.tiles.decode(data, info) if tiled else decode_frame(data)
+                    except Exception:
+                        snapshot = None
+                    if snapshot is not None:
+                        cv2.imwrite(snapshot_path, snapshot)
+
+                if self.pool and not tiled:
+                    # The reader reuses its buffer, so the pool needs its own copy
+                    self.pool.submit(bytes(data), self._target_size())
+                    continue
+                start = time.perf_counter()
+                try:
+                    if tiled:
+                        frame = self.tiles.decode(data, info, None if recorder else self._target_size())
+                        if recorder is not None and frame is not None and info.codec == CODEC_TILES:
+                            ok, encoded = cv2.imencode('.jpg', frame)
+                            if ok:
+                                recorder.write(encoded.tobytes(), info.seq)
+                    else:
+                        frame = decode_frame(data, self._target_size())
+                except Exception:
+                    # A payload imdecode rejects outright (cv2.error on an
+                    # empty one) is just a lost frame, as in stream_mux
+                    frame = None
+                    self.frames_dropped += 1
+                    if metrics is not None:
+                        metrics.count('frames_dropped')
+                elapsed = time.perf_counter() - start
+                self.decode_us += (elapsed * 1e6 - self.decode_us) / 8
+                if metrics is not None:
+                    metrics.observe('decode', elapsed)
+                undistorter = self._undistorter
+                if undistorter is not None and frame is not None:
+                    frame = undistorter.apply(frame)
+                    if metrics is not None:
+                        metrics.observe('undistort', time.perf_counter() - start - elapsed)
+                if frame is not None:
+                    if metrics is not None:
+                        metrics.count('frames_decoded')
+                    self._publish(frame)
+        except (OSError, ValueError) as e:
+            if self._running and self.on_error:
+                self.on_error(f"Video reception failed: {e}")
+            return
+        finally:
+            if self.pool:
+                self.pool.close()
+
+        if self._running and self.on_error:
+            self.on_error("Server closed the connection")
+
+    def _send_feedback(self):
+        if not self.feedback_interval:
+            return
+        now = time.monotonic()
+        if now - self._last_feedback < self.feedback_interval:
+            return
+        self._last_feedback = now
+
+        if self.pool:
+            decode_us, queue_depth = self.pool.decode_us, self.pool.backlog
+        else:
+            decode_us, queue_depth = self.decode_us, int(self._latest is not None)
+        width, height = self._target_size() or (0, 0)
+        self.sock.sendall(pack_feedback(Feedback(
+            int(decode_us), int(self.stats.latency_us), queue_depth, width, height,
+        )))
+
+    def _target_size(self):
+        size = self.display_size
+        if size is None:
+            return None
+        return int(size[0] * self.zoom), int(size[1] * self.zoom)
+
+    def _publish(self, frame):
+        analyzer = self.analyzer
+        if analyzer is not None:
+            analyzer.submit(frame)
+        with self._lock:
+            notify = self._latest is None
+            if not notify:
+                self.frames_dropped += 1
+                if self._metrics is not None:
+                    self._metrics.count('frames_dropped')
+            self._latest = frame
+            self.frames_received += 1
+        # Only wake the GUI when the slot goes from empty to full; a frame
+        # arriving while one is still pending simply replaces it.
+        if notify:
+            self.on_frame()
+
+    def take_frame(self):
+        """Return the newest frame and clear the slot (None if nothing new)."""
+        with self._lock:
+            frame = self._latest
+            self._latest = None
+        return frame
+
+    def request_snapshot(self, path):
+        """Decode the next frame at full resolution and save it to path."""
+        self._snapshot_path = path
+
+    def stop(self):
+        self._running = False
+        if isinstance(self.reader, UdpFrameReader):
+            # recv returns 0 for an empty datagram too, so the reader has to be told
+            self.reader.stop()
+            return
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        """Close the socket; call after the thread has been joined."""
+        self.sock.close()
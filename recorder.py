@@ -0,0 +1,241 @@
+"""Pass-through recording of the received JPEG payloads.
+
+A recording is a directory of segments. Each segment is a pair of files:
+
+    segment-<start>.mjpg   the JPEG payloads back to back, as received
+    segment-<start>.idx    INDEX_HEADER, then one INDEX_DTYPE record per frame
+
+Index records have a fixed size, so an index is opened by mapping it with
+mmap and viewing it as a NumPy array; seeking by time is a binary search
+over that array and does not read the data file at all.
+"""
+import collections
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+INDEX_MAGIC = b'QTVI'
+INDEX_VERSION = 1
+# magic, version, reserved
+INDEX_HEADER = struct.Struct('<4sB11x')
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<u8'),   # wall clock, microseconds since the epoch
+    ('offset', '<u8'),      # byte offset of the payload in the .mjpg file
+    ('size', '<u4'),
+    ('seq', '<u4'),
+])
+
+
+def wall_clock_us():
+    return time.time_ns() // 1000
+
+
+class SegmentRecorder:
+    """Writes payloads to rotating segments on a background thread.
+
+    write() only copies the payload into a queue, so recording never stalls
+    reception; the writer thread drains everything queued in one batch per
+    wakeup. If the disk cannot keep up and more than max_queue frames are
+    waiting, new frames are dropped and counted in frames_dropped.
+    """
+
+    def __init__(self, directory, max_segment_bytes=512 * 1024 * 1024, max_segment_seconds=600,
+                 max_queue=256):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.max_queue = max_queue
+        os.makedirs(directory, exist_ok=True)
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.bytes_written = 0
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._data = None
+        self._index = None
+        self._segment_bytes = 0
+        self._segment_start = 0.0
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def write(self, payload, seq=0, timestamp=None):
+        if timestamp is None:
+            timestamp = wall_clock_us()
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.frames_dropped += 1
+                return
+            self._queue.append((bytes(payload), seq, timestamp))
+            self._cond.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    break
+                batch = list(self._queue)
+                self._queue.clear()
+            self._write_batch(batch)
+        self._close_segment()
+
+    def _write_batch(self, batch):
+        start = 0
+        while start < len(batch):
+            if self._data is None or self._segment_full():
+                self._open_segment()
+
+            # Take as many frames as fit; an oversized frame still gets a
+            # segment of its own rather than being dropped.
+            end = start
+            size = 0
+            while end < len(batch):
+                length = len(batch[end][0])
+                used = self._segment_bytes + size
+                if used and used + length > self.max_segment_bytes:
+                    break
+                size += length
+                end += 1
+            if end == start:
+                self._open_segment()
+                continue
+
+            records = np.empty(end - start, dtype=INDEX_DTYPE)
+            offset = self._segment_bytes
+            for i, (payload, seq, timestamp) in enumerate(batch[start:end]):
+                records[i] = (timestamp, offset, len(payload), seq & 0xFFFFFFFF)
+                offset += len(payload)
+
+            # Data goes out before its index entries, so an index never
+            # points past the end of the data file after a crash.
+            self._data.writelines(payload for payload, _, _ in batch[start:end])
+            self._data.flush()
+            self._index.write(records.tobytes())
+            self._index.flush()
+
+            self._segment_bytes = offset
+            self.frames_written += end - start
+            self.bytes_written += size
+            start = end
+
+    def _segment_full(self):
+        return (self._segment_bytes >= self.max_segment_bytes
+                or time.monotonic() - self._segment_start >= self.max_segment_seconds)
+
+    def _open_segment(self):
+        self._close_segment()
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(self.directory, f"segment-{stamp}-{wall_clock_us() % 1000000:06d}")
+        self._data = open(base + '.mjpg', 'wb')
+        self._index = open(base + '.idx', 'wb')
+        self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION))
+        self._segment_bytes = 0
+        self._segment_start = time.monotonic()
+
+    def _close_segment(self):
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = None
+            self._index = None
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+
+
+class Segment:
+    """One recorded segment with its index mapped into memory."""
+
+    def __init__(self, base):
+        self.base = base
+        self._index_file = open(base + '.idx', 'rb')
+        self._data_file = open(base + '.mjpg', 'rb')
+        size = os.fstat(self._index_file.fileno()).st_size
+        count = (size - INDEX_HEADER.size) // INDEX_DTYPE.itemsize if size > INDEX_HEADER.size else 0
+
+        self._index_map = None
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        if count:
+            self._index_map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version = INDEX_HEADER.unpack_from(self._index_map)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                raise ValueError(f"{base}.idx is not a recording index")
+            self.index = np.frombuffer(self._index_map, dtype=INDEX_DTYPE, count=count,
+                                       offset=INDEX_HEADER.size)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def start(self):
+        return int(self.index['timestamp'][0]) if len(self.index) else None
+
+    @property
+    def end(self):
+        return int(self.index['timestamp'][-1]) if len(self.index) else None
+
+    def find(self, timestamp):
+        """Index of the last frame at or before timestamp (0 if none)."""
+        return max(int(np.searchsorted(self.index['timestamp'], timestamp, side='right')) - 1, 0)
+
+    def read(self, i):
+        entry = self.index[i]
+        return os.pread(self._data_file.fileno(), int(entry['size']), int(entry['offset']))
+
+    def close(self):
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        if self._index_map is not None:
+            self._index_map.close()
+        self._index_file.close()
+        self._data_file.close()
+
+
+class Recording:
+    """All segments of a recording directory, ordered by start time."""
+
+    def __init__(self, directory):
+        bases = sorted(os.path.join(directory, name[:-4])
+                       for name in os.listdir(directory) if name.endswith('.idx'))
+        self.segments = [segment for segment in map(Segment, bases) if len(segment)]
+        self._starts = np.array([segment.start for segment in self.segments], dtype=np.uint64)
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def start(self):
+        return self.segments[0].start if self.segments else None
+
+    @property
+    def end(self):
+        return self.segments[-1].end if self.segments else None
+
+    def seek(self, timestamp):
+        """Return (segment number, frame number) of the frame shown at timestamp."""
+        if not self.segments:
+            raise ValueError("Recording is empty")
+        number = max(int(np.searchsorted(self._starts, timestamp, side='right')) - 1, 0)
+        return number, self.segments[number].find(timestamp)
+
+    def frames(self, timestamp=None):
+        """Yield (timestamp, payload) from timestamp (or the start) onwards."""
+        number, i = self.seek(timestamp) if timestamp is not None else (0, 0)
+        for segment in self.segments[number:]:
+            for j in range(i, len(segment)):
+                yield int(segment.index['timestamp'][j]), segment.read(j)
+            i = 0
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
@@ -0,0 +1,140 @@
+"""Fan-out relay: one upstream stream, many viewers, no re-encoding.
+
+The relay connects to a camera server as an ordinary client and serves the
+same wire protocol to its own viewers, so the camera host sends every frame
+once however many people watch:
+
+    python relay.py --upstream 192.168.0.5 --port 12346
+    python relay.py --upstream 192.168.0.5:12345 --queue-size 2
+    python relay.py --upstream 192.168.0.5 --udp 239.255.0.1:12350
+
+Payloads are forwarded as received: every viewer's drop-oldest queue gets
+the same bytes object, so a slow viewer loses old frames without slowing
+the others, and more viewers cost no copies. The newest frame is kept so
+that a viewer that connects gets it at once instead of waiting for the
+next one.
+"""
+import argparse
+import socket
+import threading
+import time
+
+from decoding import jpeg_size
+from frame_reader import FrameReader
+from protocol import CODEC_JPEG, DEFAULT_PORT, FrameInfo, monotonic_us, parse_address
+from server import FanOutServer, attach_udp
+
+
+class StreamRelay(FanOutServer):
+    """Re-serves the stream of an upstream server to any number of viewers.
+
+    Frame timestamps are moved from the upstream clock to the relay's own,
+    so viewers still measure latency from capture. A legacy (v1) upstream
+    gets sequence numbers and arrival timestamps from the relay. If the
+    upstream connection drops, or sends nothing for stall_timeout seconds,
+    the relay reconnects every retry_interval seconds and keeps its viewers
+    connected meanwhile.
+    """
+
+    def __init__(self, upstream_host, upstream_port=DEFAULT_PORT, host='0.0.0.0', port=DEFAULT_PORT,
+                 queue_size=2, retry_interval=1.0, stall_timeout=5.0):
+        super().__init__(host, port, queue_size)
+        self.upstream = (upstream_host, upstream_port)
+        self.retry_interval = retry_interval
+        self.stall_timeout = stall_timeout
+        self.latest = None
+        self.frames_relayed = 0
+        self.upstream_connected = False
+        self._upstream_socket = None
+        self._upstream_lock = threading.Lock()
+
+    def _workers(self):
+        return super()._workers() + [self._upstream_loop]
+
+    def _client_added(self, client):
+        with self._lock:
+            latest = self.latest
+        if latest is not None:
+            client.push(*latest)
+
+    def _upstream_loop(self):
+        while self._running:
+            try:
+                sock = socket.create_connection(self.upstream, timeout=5.0)
+            except OSError as e:
+                print(f"Upstream {self.upstream[0]}:{self.upstream[1]} unavailable: {e}")
+                time.sleep(self.retry_interval)
+                continue
+            sock.settimeout(self.stall_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._upstream_lock:
+                self._upstream_socket = sock
+            self.upstream_connected = True
+            print(f"Relaying {self.upstream[0]}:{self.upstream[1]}")
+            try:
+                self._relay(FrameReader(sock, negotiate=True))
+            except (OSError, ValueError) as e:
+                if self._running:
+                    print(f"Upstream failed: {e}")
+            finally:
+                self.upstream_connected = False
+                with self._upstream_lock:
+                    self._upstream_socket = None
+                sock.close()
+            if self._running:
+                time.sleep(self.retry_interval)
+
+    def _relay(self, reader):
+        seq = 0
+        while self._running:
+            data = reader.read_frame()
+            if data is None:
+                return
+            # The reader reuses its buffer; this is the only copy of the frame
+            payload = bytes(data)
+            info = reader.info
+            if info is None:
+                size = jpeg_size(payload) or (0, 0)
+                info = FrameInfo(seq, monotonic_us(), size[0], size[1], CODEC_JPEG, 0)
+            else:
+                info = info._replace(timestamp=info.timestamp - reader.clock_offset)
+            seq += 1
+            with self._lock:
+                self.latest = (payload, info)
+                clients = list(self.clients)
+            for client in clients:
+                client.push(payload, info)
+            self.frames_relayed += 1
+
+    def stop(self):
+        self._running = False
+        with self._upstream_lock:
+            sock = self._upstream_socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        super().stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay one camera stream to many VideoStreamWindow clients")
+    parser.add_argument('--upstream', required=True, help="camera server as HOST or HOST:PORT")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT + 1)
+    parser.add_argument('--queue-size', type=int, default=2, help="frames buffered per viewer")
+    parser.add_argument('--udp', action='append', default=[], metavar='HOST:PORT',
+                        help="also send every frame over UDP to this viewer or multicast group (repeatable)")
+    parser.add_argument('--udp-interface', help="local address to send multicast from")
+    args = parser.parse_args()
+
+    upstream_host, upstream_port = parse_address(args.upstream)
+    relay = StreamRelay(upstream_host, upstream_port, args.host, args.port, args.queue_size)
+    attach_udp(relay, args.udp, args.udp_interface)
+    print(f"Relay on {args.host}:{args.port}")
+    relay.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""Deterministic replay server and load generator.
+
+Serves pre-encoded JPEG payloads over the client's wire protocol, so a
+performance problem can be reproduced without a camera:
+
+    python replay.py --recording recordings --rate recorded
+    python replay.py --directory frames/ --rate max
+    python replay.py --synthetic saved_frame.jpg --sizes 640x480,1920x1440 --rate 30@5,max@2,0@1.5
+
+--rate is a schedule of RATE@SECONDS steps that repeats: RATE is frames per
+second, `max` (as fast as the slowest viewer drains its queue), `0` (stall:
+send nothing) or `recorded` (the gaps stored in a recording). A single step
+without @SECONDS runs forever.
+
+With --clients N the tool also starts N simulated viewers against itself and
+prints their throughput and latency when --duration is over:
+
+    python replay.py --synthetic saved_frame.jpg --rate max --clients 20 --duration 10
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from decoding import decode_frame, jpeg_size
+from frame_reader import FrameReader
+from protocol import CODEC_JPEG, DEFAULT_PORT, FrameInfo, monotonic_us
+from recorder import Recording
+from server import FanOutServer
+from stream_stats import StreamStats
+
+
+class RecordingSource:
+    """Payloads of a SegmentRecorder recording with their recorded gaps."""
+
+    timed = True
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __iter__(self):
+        while True:
+            recording = Recording(self.directory)
+            if not len(recording):
+                raise ValueError(f"Recording {self.directory!r} is empty")
+            previous = None
+            for timestamp, payload in recording.frames():
+                gap = (timestamp - previous) / 1e6 if previous is not None else 0.0
+                previous = timestamp
+                yield payload, gap
+            recording.close()
+
+
+class DirectorySource:
+    """JPEG files of a directory in name order, loaded once and looped."""
+
+    timed = False
+
+    def __init__(self, path):
+        names = sorted(glob.glob(os.path.join(path, '*.jpg')) + glob.glob(os.path.join(path, '*.jpeg')))
+        if not names:
+            raise ValueError(f"No JPEG files in {path!r}")
+        self.payloads = []
+        for name in names:
+            with open(name, 'rb') as f:
+                self.payloads.append(f.read())
+
+    def __iter__(self):
+        for payload in itertools.cycle(self.payloads):
+            yield payload, None
+
+
+class SyntheticSource:
+    """One image re-encoded once at each of several sizes, then cycled."""
+
+    timed = False
+
+    def __init__(self, path, sizes=None, quality=80):
+        image = cv2.imread(path)
+        if image is None:
+            raise OSError(f"Cannot read image {path!r}")
+        self.payloads = []
+        for size in sizes or [(image.shape[1], image.shape[0])]:
+            resized = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+            ok, encoded = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise ValueError(f"Cannot encode {path!r} at {size}")
+            self.payloads.append(encoded.tobytes())
+
+    def __iter__(self):
+        for payload in itertools.cycle(self.payloads):
+            yield payload, None
+
+
+class Schedule:
+    """Repeating list of (rate, seconds) steps; see the module docstring."""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.period = sum(seconds for _, seconds in steps)
+
+    @property
+    def recorded(self):
+        return any(rate == 'recorded' for rate, _ in self.steps)
+
+    @classmethod
+    def parse(cls, spec):
+        steps = []
+        for item in spec.split(','):
+            rate, _, seconds = item.strip().partition('@')
+            if rate not in ('max', 'recorded'):
+                rate = float(rate)
+            steps.append((rate, float(seconds) if seconds else float('inf')))
+        return cls(steps)
+
+    def step_at(self, elapsed):
+        """Return (rate, seconds left in this step) at elapsed seconds."""
+        if self.period != float('inf'):
+            elapsed %= self.period
+        for rate, seconds in self.steps:
+            if elapsed < seconds:
+                return rate, seconds - elapsed
+            elapsed -= seconds
+        return self.steps[-1][0], 0.0
+
+
+class ReplayServer(FanOutServer):
+    """Sends a source's payloads to every viewer on a Schedule, unmodified.
+
+    Rate 'recorded' needs a source with timestamps (a recording); with any
+    other source it raises ValueError.
+    """
+
+    def __init__(self, source, schedule, host='0.0.0.0', port=DEFAULT_PORT, queue_size=2):
+        if schedule.recorded and not source.timed:
+            raise ValueError("rate 'recorded' needs --recording: this source has no timestamps")
+        super().__init__(host, port, queue_size)
+        self.source = source
+        self.schedule = schedule
+        self.frames_sent = 0
+        # Signalled when a viewer connects, so rate 'max' idles without viewers
+        self._viewers = threading.Condition(self._lock)
+
+    def _client_added(self, client):
+        super()._client_added(client)
+        with self._viewers:
+            self._viewers.notify_all()
+
+    def _workers(self):
+        return super()._workers() + [self._replay_loop]
+
+    def _replay_loop(self):
+        start = next_send = time.monotonic()
+        payloads = iter(self.source)
+        seq = 0
+        while self._running:
+            now = time.monotonic()
+            rate, left = self.schedule.step_at(now - start)
+            if rate == 0:
+                time.sleep(min(left, 0.1))
+                next_send = time.monotonic()
+                continue
+
+            if rate == 'max':
+                with self._viewers:
+                    if not self.clients:
+                        # Nobody to pace against: wait instead of spinning through the source
+                        self._viewers.wait(0.1)
+                        continue
+                    clients = list(self.clients)
+
+            payload, gap = next(payloads)
+            if rate == 'max':
+                for client in clients:
+                    client.wait_for_room(0.1)
+                next_send = time.monotonic()
+            else:
+                next_send += (gap or 0.0) if rate == 'recorded' else 1.0 / rate
+                if next_send < now - 1.0:
+                    # Far behind (slow disk, paused process): resync rather than burst
+                    next_send = now
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            size = jpeg_size(payload) or (0, 0)
+            self.broadcast(payload, FrameInfo(seq, monotonic_us(), size[0], size[1], CODEC_JPEG, 0))
+            seq += 1
+            self.frames_sent += 1
+
+
+class LoadClient(threading.Thread):
+    """Simulated viewer that reads (and optionally decodes) as fast as it can."""
+
+    def __init__(self, host, port, decode=False):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.decode = decode
+        self.frames = 0
+        self.bytes = 0
+        self.latencies_us = []
+        self.stats = None
+        self.error = None
+        self._running = True
+        self._start_time = None
+        self._elapsed = 0.0
+
+    def run(self):
+        try:
+            sock = socket.create_connection((self.host, self.port))
+        except OSError as e:
+            self.error = str(e)
+            return
+        reader = FrameReader(sock, negotiate=True)
+        self._start_time = time.monotonic()
+        try:
+            while self._running:
+                payload = reader.read_frame()
+                if payload is None:
+                    break
+                if self.decode:
+                    decode_frame(payload)
+                self.frames += 1
+                self.bytes += len(payload)
+                if reader.info is not None:
+                    if self.stats is None:
+                        self.stats = StreamStats(reader.clock_offset)
+                    self.stats.update(reader.info)
+                    self.latencies_us.append(self.stats.latency_us)
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            self._elapsed = time.monotonic() - self._start_time
+            sock.close()
+
+    def stop(self):
+        self._running = False
+
+    def summary(self):
+        elapsed = self._elapsed or (time.monotonic() - self._start_time if self._start_time else 0.0)
+        latencies = np.array(self.latencies_us or [0], dtype=np.float64) / 1000
+        return {
+            'frames': self.frames,
+            'fps': round(self.frames / elapsed, 2) if elapsed else 0.0,
+            'mbytes_per_s': round(self.bytes / elapsed / 1e6, 2) if elapsed else 0.0,
+            'latency_p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'latency_p99_ms': round(float(np.percentile(latencies, 99)), 2),
+            'drop_rate': round(self.stats.drop_rate, 4) if self.stats else 0.0,
+            'error': self.error,
+        }
+
+
+def run_load(host, port, clients, duration, decode=False):
+    """Run `clients` LoadClients for `duration` seconds; return their summaries."""
+    load = [LoadClient(host, port, decode) for _ in range(clients)]
+    for client in load:
+        client.start()
+    time.sleep(duration)
+    for client in load:
+        client.stop()
+    for client in load:
+        client.join(timeout=2.0)
+    return [client.summary() for client in load]
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded or synthetic frames to stream clients")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--recording', help="SegmentRecorder directory")
+    group.add_argument('--directory', help="directory of JPEG files")
+    group.add_argument('--synthetic', help="image to re-encode at --sizes")
+    parser.add_argument('--sizes', default='', help="comma-separated WxH list for --synthetic")
+    parser.add_argument('--quality', type=int, default=80, help="JPEG quality for --synthetic")
+    parser.add_argument('--rate', default='30', help="schedule, e.g. 30, max, recorded or 30@5,0@1")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--queue-size', type=int, default=2, help="frames buffered per client")
+    parser.add_argument('--clients', type=int, default=0, help="simulated viewers to run against the replay")
+    parser.add_argument('--decode', action='store_true', help="simulated viewers also decode frames")
+    parser.add_argument('--duration', type=float, default=10, help="seconds to run with --clients")
+    parser.add_argument('--json', help="write the --clients results to this file")
+    args = parser.parse_args()
+
+    if args.recording:
+        source = RecordingSource(args.recording)
+    elif args.directory:
+        source = DirectorySource(args.directory)
+    else:
+        sizes = [parse_size(size) for size in args.sizes.split(',') if size]
+        source = SyntheticSource(args.synthetic, sizes, args.quality)
+
+    try:
+        server = ReplayServer(source, Schedule.parse(args.rate), args.host, args.port, args.queue_size)
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.clients:
+        print(f"Replaying on {args.host}:{args.port}")
+        server.serve_forever()
+        return
+
+    server.start()
+    try:
+        results = run_load('127.0.0.1', server.port, args.clients, args.duration, args.decode)
+    finally:
+        server.stop()
+    for i, result in enumerate(results):
+        print(f"client {i:3d}: {result['fps']:7.1f} fps {result['mbytes_per_s']:7.1f} MB/s "
+              f"p50 {result['latency_p50_ms']:6.1f} ms p99 {result['latency_p99_ms']:6.1f} ms "
+              f"drops {result['drop_rate']:.1%}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'clients': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
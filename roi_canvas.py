@@ -0,0 +1,221 @@
+import numpy as np
+from PyQt5.QtCore import QPoint, QRect, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen, QPixmap
+from PyQt5.QtWidgets import QLabel
+
+from roi_store import RoiStore
+
+
+class RoiCanvas(QLabel):
+    """Image label for drawing, selecting and moving the ROIs of a RoiStore.
+
+    The image and the ROIs are rendered once into a cached composite pixmap;
+    a new ROI is painted onto it on its own. While dragging only the rubber
+    band (or the ROIs being moved) is drawn, over the part of the composite
+    it uncovers, and each mouse move just marks that small area dirty. Qt
+    merges the dirty areas of all moves between two paints, so the cost of
+    a drag does not depend on the image size or the number of ROIs.
+
+    Mouse: dragging on the image draws an ROI, a click selects the topmost
+    ROI under the cursor (Ctrl toggles it in the selection), Shift-drag
+    selects every ROI touching the band and dragging a selected ROI moves
+    the whole selection. Delete removes the selection, Escape clears it.
+
+    ROIs are in image coordinates, also when the image is centered in a
+    larger label.
+    """
+
+    rois_changed = pyqtSignal()
+    selection_changed = pyqtSignal()
+    image_missing = pyqtSignal()
+
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+        self.store = RoiStore() if store is None else store
+        self.selected = set()
+        self.new_label = ''
+        self.pen_width = 2
+        self.rectangle_color = QColor(0, 0, 255)
+        self.selected_color = QColor(255, 255, 0)
+        self.drag_color = QColor(0, 255, 0)
+        self.setFocusPolicy(Qt.ClickFocus)
+
+        self._base = None
+        self._composite = None
+        self._mode = None  # 'draw', 'select' or 'move' while the button is down
+        self._origin = None
+        self._current = None
+        self._moving = False
+
+    def set_image(self, image_rgb):
+        """Show an RGB ndarray; it is copied into the cached base pixmap."""
+        height, width, channel = image_rgb.shape
+        qimage = QImage(image_rgb.data, width, height, channel * width, QImage.Format_RGB888)
+        self._base = QPixmap.fromImage(qimage)
+        self.refresh()
+
+    def has_image(self):
+        return self._base is not None
+
+    def refresh(self):
+        """Render the composite again after the store was changed elsewhere."""
+        self.selected &= set(self.store.rois['id'].tolist())
+        self._render_composite()
+
+    def select(self, ids):
+        self.selected = set(int(i) for i in ids)
+        self.update()
+        self.selection_changed.emit()
+
+    def delete_selected(self):
+        """Remove the selected ROIs; returns how many were removed."""
+        removed = self.store.remove(list(self.selected))
+        self.selected.clear()
+        if removed:
+            self._render_composite()
+            self.rois_changed.emit()
+        self.selection_changed.emit()
+        return removed
+
+    def _render_composite(self, hidden=()):
+        if self._base is None:
+            return
+        self._composite = self._base.copy()
+        rects = self.store.rects()
+        if hidden:
+            rects = rects[~np.isin(self.store.rois['id'], list(hidden))]
+        painter = QPainter(self._composite)
+        self._draw_rects(painter, rects, self.rectangle_color)
+        painter.end()
+        self.update()
+
+    def _draw_rects(self, painter, rects, color, style=Qt.SolidLine):
+        painter.setPen(QPen(color, self.pen_width, style))
+        for x, y, w, h in rects.tolist():
+            painter.drawRect(x, y, w, h)
+
+    def image_offset(self):
+        """Top-left corner of the (centered) image in label coordinates."""
+        if self._base is None:
+            return QPoint(0, 0)
+        return QPoint((self.width() - self._base.width()) // 2, (self.height() - self._base.height()) // 2)
+
+    def _dirty(self, rect):
+        margin = self.pen_width + 1
+        return rect.normalized().translated(self.image_offset()).adjusted(-margin, -margin, margin, margin)
+
+    def _band(self):
+        if self._origin is None or self._current is None:
+            return None
+        return QRect(self._origin, self._current).normalized()
+
+    def _delta(self):
+        return self._current - self._origin
+
+    def _selection_bounds(self, delta):
+        rects = self.store.rects(list(self.selected))
+        if not len(rects):
+            return QRect()
+        x0, y0 = rects[:, :2].min(axis=0).tolist()
+        x1, y1 = (rects[:, :2] + rects[:, 2:]).max(axis=0).tolist()
+        return QRect(x0, y0, x1 - x0, y1 - y0).translated(delta)
+
+    def paintEvent(self, event):
+        if self._composite is None:
+            super().paintEvent(event)
+            return
+        painter = QPainter(self)
+        offset = self.image_offset()
+        exposed = event.rect()
+        painter.drawPixmap(exposed, self._composite, exposed.translated(-offset))
+        painter.translate(offset)
+        if self.selected:
+            rects = self.store.rects(list(self.selected))
+            if self._moving:
+                delta = self._delta()
+                rects[:, 0] += delta.x()
+                rects[:, 1] += delta.y()
+            self._draw_rects(painter, rects, self.selected_color)
+        band = self._band()
+        if band is not None and self._mode in ('draw', 'select'):
+            style = Qt.DashLine if self._mode == 'select' else Qt.SolidLine
+            self._draw_rects(painter, np.array([[band.x(), band.y(), band.width(), band.height()]]),
+                             self.drag_color, style)
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if self._base is None:
+            self.image_missing.emit()
+            return
+        if event.button() != Qt.LeftButton:
+            return
+        pos = event.pos() - self.image_offset()
+        self._origin = self._current = pos
+        if event.modifiers() & Qt.ShiftModifier:
+            self._mode = 'select'
+            return
+        hit = self.store.hit_test(pos.x(), pos.y())
+        if hit is None:
+            self._mode = 'draw'
+            if self.selected and not event.modifiers() & Qt.ControlModifier:
+                self.select([])
+        elif event.modifiers() & Qt.ControlModifier:
+            self._mode = None
+            self.select(self.selected ^ {hit})
+        else:
+            self._mode = 'move'
+            if hit not in self.selected:
+                self.select([hit])
+
+    def mouseMoveEvent(self, event):
+        if self._mode is None:
+            return
+        if self._mode == 'move':
+            if not self._moving:
+                # the composite leaves the moving ROIs out until they are dropped
+                self._moving = True
+                self._render_composite(hidden=self.selected)
+            old = self._selection_bounds(self._delta())
+            self._current = event.pos() - self.image_offset()
+            self.update(self._dirty(old).united(self._dirty(self._selection_bounds(self._delta()))))
+            return
+        old = self._band()
+        self._current = event.pos() - self.image_offset()
+        self.update(self._dirty(old).united(self._dirty(self._band())))
+
+    def mouseReleaseEvent(self, event):
+        mode, band = self._mode, self._band()
+        if mode is None or band is None:
+            return
+        delta = self._delta()
+        moving = self._moving
+        self._mode = self._origin = self._current = None
+        self._moving = False
+        self.update(self._dirty(band))
+
+        # QRect(p, p) is 1x1: a click on empty space is not an ROI
+        if mode == 'draw' and band.width() > 2 and band.height() > 2:
+            self.store.add(band.x(), band.y(), band.width(), band.height(), self.new_label)
+            if self._composite is not None:
+                painter = QPainter(self._composite)
+                self._draw_rects(painter, self.store.rects()[-1:], self.rectangle_color)
+                painter.end()
+            self.rois_changed.emit()
+        elif mode == 'select':
+            ids = self.store.query(band.x(), band.y(), band.width(), band.height()).tolist()
+            if event.modifiers() & Qt.ControlModifier:
+                ids = self.selected | set(ids)
+            self.select(ids)
+        elif mode == 'move' and moving:
+            self.store.move(list(self.selected), delta.x(), delta.y())
+            self._render_composite()
+            if delta.x() or delta.y():
+                self.rois_changed.emit()
+
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key_Delete, Qt.Key_Backspace):
+            self.delete_selected()
+        elif event.key() == Qt.Key_Escape:
+            self.select([])
+        else:
+            super().keyPressEvent(event)
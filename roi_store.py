@@ -0,0 +1,186 @@
+"""Regions of interest in a NumPy array with a spatial index.
+
+ROIs are rows of a structured array (x, y, w, h, id, label) kept in drawing
+order, so a later row lies on top of an earlier one. Hit-testing goes
+through a grid index stored as sorted arrays:
+
+    keys      sorted cell keys, one entry per (cell, ROI) pair
+    members   ROI rows, in the same order as keys
+
+A point or box query finds its cells with np.searchsorted (O(log n)) and
+tests only the ROIs listed there. The index is rebuilt lazily after the set
+changes, which is one vectorized pass.
+"""
+import json
+
+import numpy as np
+
+ROI_DTYPE = np.dtype([
+    ('x', np.int32), ('y', np.int32), ('w', np.int32), ('h', np.int32),
+    ('id', np.int64), ('label', 'U32'),
+])
+
+# ROIs spanning more grid cells than this are tested on every query instead
+MAX_CELLS_PER_ROI = 256
+
+
+class RoiStore:
+    """Rectangles with stable ids; rows are in z-order, topmost last."""
+
+    def __init__(self):
+        self.rois = np.zeros(0, ROI_DTYPE)
+        self.next_id = 0
+        self.version = 0
+        self._index = None
+
+    def __len__(self):
+        return len(self.rois)
+
+    def _changed(self):
+        self.version += 1
+        self._index = None
+
+    def add(self, x, y, w, h, label=''):
+        """Add one ROI on top of the others and return its id."""
+        return int(self.add_many([(x, y, w, h)], [label])[0])
+
+    def add_many(self, rects, labels=None):
+        """Add (n, 4) x, y, w, h rectangles; returns their ids."""
+        rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+        added = np.zeros(len(rects), ROI_DTYPE)
+        # negative sizes come from dragging up or left
+        added['x'] = np.minimum(rects[:, 0], rects[:, 0] + rects[:, 2])
+        added['y'] = np.minimum(rects[:, 1], rects[:, 1] + rects[:, 3])
+        added['w'] = np.abs(rects[:, 2])
+        added['h'] = np.abs(rects[:, 3])
+        added['id'] = np.arange(self.next_id, self.next_id + len(rects))
+        if labels is not None:
+            added['label'] = labels
+        self.next_id += len(rects)
+        self.rois = np.concatenate([self.rois, added])
+        self._changed()
+        return added['id']
+
+    def rows(self, ids):
+        """Row positions of ids; unknown ids are skipped."""
+        return np.flatnonzero(np.isin(self.rois['id'], np.asarray(ids, dtype=np.int64)))
+
+    def remove(self, ids):
+        """Delete ROIs; returns how many were removed."""
+        rows = self.rows(ids)
+        if len(rows):
+            self.rois = np.delete(self.rois, rows)
+            self._changed()
+        return len(rows)
+
+    def clear(self):
+        if len(self.rois):
+            self.rois = np.zeros(0, ROI_DTYPE)
+            self._changed()
+
+    def move(self, ids, dx, dy):
+        rows = self.rows(ids)
+        if len(rows) and (dx or dy):
+            self.rois['x'][rows] += dx
+            self.rois['y'][rows] += dy
+            self._changed()
+
+    def set_label(self, ids, label):
+        self.rois['label'][self.rows(ids)] = label
+        self.version += 1
+
+    def rects(self, ids=None):
+        """(n, 4) int32 array of x, y, w, h, for all ROIs or for ids."""
+        rois = self.rois if ids is None else self.rois[self.rows(ids)]
+        return np.stack([rois['x'], rois['y'], rois['w'], rois['h']], axis=1)
+
+    def _build_index(self):
+        rois = self.rois
+        if len(rois):
+            cell = int(max(16, np.median(np.maximum(rois['w'], rois['h']))))
+        else:
+            cell = 16
+        x0 = rois['x'] // cell
+        y0 = rois['y'] // cell
+        x1 = (rois['x'] + rois['w']) // cell
+        y1 = (rois['y'] + rois['h']) // cell
+        spans_x = x1 - x0 + 1
+        spans_y = y1 - y0 + 1
+        cells = spans_x.astype(np.int64) * spans_y
+        large = cells > MAX_CELLS_PER_ROI
+
+        rows = np.flatnonzero(~large)
+        counts = cells[rows]
+        pair_rows = np.repeat(rows, counts)
+        # position of each pair within its ROI's block of cells
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = x0[pair_rows] + within % spans_x[pair_rows]
+        cy = y0[pair_rows] + within // spans_x[pair_rows]
+        keys = self._keys(cx, cy)
+        order = np.argsort(keys, kind='stable')
+        self._index = (cell, keys[order], pair_rows[order], np.flatnonzero(large))
+
+    @staticmethod
+    def _keys(cx, cy):
+        # cells may be negative after a move; offset them into one int64
+        return (np.asarray(cy, np.int64) + (1 << 30)) * (1 << 31) + (np.asarray(cx, np.int64) + (1 << 30))
+
+    def _candidates(self, x0, y0, x1, y1):
+        if self._index is None:
+            self._build_index()
+        cell, keys, members, large = self._index
+        found = [large]
+        for cy in range(y0 // cell, y1 // cell + 1):
+            lo = np.searchsorted(keys, self._keys(x0 // cell, cy), 'left')
+            hi = np.searchsorted(keys, self._keys(x1 // cell, cy), 'right')
+            found.append(members[lo:hi])
+        return np.unique(np.concatenate(found))
+
+    def hit_test(self, x, y):
+        """Id of the topmost ROI containing (x, y), or None."""
+        rows = self._candidates(x, y, x, y)
+        rois = self.rois[rows]
+        inside = ((rois['x'] <= x) & (x <= rois['x'] + rois['w'])
+                  & (rois['y'] <= y) & (y <= rois['y'] + rois['h']))
+        if not inside.any():
+            return None
+        return int(rois['id'][inside][-1])
+
+    def query(self, x, y, w, h):
+        """Ids of every ROI intersecting the box, bottom to top."""
+        x0, x1 = min(x, x + w), max(x, x + w)
+        y0, y1 = min(y, y + h), max(y, y + h)
+        rows = self._candidates(x0, y0, x1, y1)
+        rois = self.rois[rows]
+        hit = ((rois['x'] <= x1) & (x0 <= rois['x'] + rois['w'])
+               & (rois['y'] <= y1) & (y0 <= rois['y'] + rois['h']))
+        return rois['id'][hit]
+
+    def save(self, path):
+        """Export as JSON: a list of {id, x, y, w, h, label}."""
+        rois = [{name: self.rois[name][i].item() for name in ROI_DTYPE.names}
+                for i in range(len(self.rois))]
+        with open(path, 'w') as f:
+            json.dump({'rois': rois}, f, indent=1)
+
+    def load(self, path, replace=True):
+        """Import ROIs exported by save(); returns their new ids.
+
+        Imported ROIs get new ids, so importing into a non-empty store never
+        clashes with the ids already there. The whole file is checked before
+        the store is touched, so a malformed one raises ValueError or
+        KeyError and leaves the existing ROIs in place.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or 'rois' not in data:
+            raise ValueError(f"{path} is not an ROI export: expected an object with a 'rois' list")
+        rois = data['rois']
+        try:
+            rects = np.array([(r['x'], r['y'], r['w'], r['h']) for r in rois], dtype=np.int64).reshape(-1, 4)
+            labels = [str(r.get('label', '')) for r in rois]
+        except (TypeError, AttributeError) as e:
+            raise ValueError(f"malformed ROI in {path}: {e}") from e
+        if replace:
+            self.clear()
+        return self.add_many(rects, labels)
@@ -0,0 +1,494 @@
+"""Reference streaming server for the client's wire protocol.
+
+Frames go out on TCP port 12345 by default. Clients that send a v2 hello
+get the versioned header from protocol.py; anything else gets the legacy
+native-endian struct 'I' payload length followed by the JPEG bytes.
+
+    python server.py --camera 1
+    python server.py --file video.mp4
+    python server.py --image saved_frame.jpg --fps 60 --scale 2
+    python server.py --camera 1 --target-latency 150
+    python server.py --camera 1 --delta
+    python server.py --camera 1 --udp 239.255.0.1:12350
+"""
+import argparse
+import collections
+import socket
+import threading
+import time
+
+import cv2
+
+from adaptive import AdaptiveController
+from protocol import (
+    CODEC_JPEG, DEFAULT_PORT, FEEDBACK, FLAG_KEYFRAME, HELLO_TILES, FrameInfo, monotonic_us, pack_frame,
+    parse_address, server_handshake, unpack_feedback,
+)
+from tile_codec import TileEncoder
+
+
+class Pacer:
+    """Sleeps just enough to hold a fixed frame rate (0 means no limit)."""
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next + self.interval, now)
+
+
+class CaptureSource:
+    """Frames from cv2.VideoCapture: a camera index or a video file.
+
+    Cameras deliver at their own rate; files are paced to their nominal fps
+    (or the one given) instead of being read as fast as they decode.
+    """
+
+    def __init__(self, target, fps=None, loop=False):
+        self.target = target
+        self.loop = loop
+        self.cap = cv2.VideoCapture(target)
+        if not self.cap.isOpened():
+            raise OSError(f"Cannot open capture source {target!r}")
+        if isinstance(target, str):
+            self.pacer = Pacer(fps or self.cap.get(cv2.CAP_PROP_FPS) or 30)
+        else:
+            self.pacer = None
+            if fps:
+                self.cap.set(cv2.CAP_PROP_FPS, fps)
+
+    def read(self):
+        if self.pacer:
+            self.pacer.wait()
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def close(self):
+        self.cap.release()
+
+
+class ImageSource:
+    """Synthetic source repeating one image at a fixed rate."""
+
+    def __init__(self, path, fps=30, scale=1.0):
+        frame = cv2.imread(path)
+        if frame is None:
+            raise OSError(f"Cannot read image {path!r}")
+        if scale != 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        self.frame = frame
+        self.pacer = Pacer(fps)
+
+    def read(self):
+        self.pacer.wait()
+        return self.frame
+
+    def close(self):
+        pass
+
+
+class ClientConnection:
+    """One viewer with its own sender thread and a drop-oldest queue.
+
+    v2 clients also get a reader thread that passes their FEEDBACK messages
+    to on_feedback(client, feedback). `tiles` is True once the client has
+    said it decodes tile deltas. A keyframe waiting in the queue is kept
+    when the queue overflows, since the deltas after it are useless without
+    it; the frame after it is dropped instead, or with a queue_size of 1 the
+    incoming delta.
+    """
+
+    def __init__(self, sock, address, queue_size=2, on_close=None, on_feedback=None):
+        self.sock = sock
+        self.address = address
+        self.on_close = on_close
+        self.on_feedback = on_feedback
+        self.version = 1
+        self.tiles = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        self._queue = collections.deque(maxlen=queue_size)
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._send_loop, daemon=True)
+        self._thread.start()
+
+    def push(self, payload, info):
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.frames_dropped += 1
+                if self._queue[0][1].flags & FLAG_KEYFRAME:
+                    if len(self._queue) > 1:
+                        del self._queue[1]
+                    elif not info.flags & FLAG_KEYFRAME:
+                        # A one-frame queue: drop the delta, not the keyframe it needs
+                        return
+            self._queue.append((payload, info))
+            self._cond.notify_all()
+
+    def wait_for_room(self, timeout=None):
+        """Block until the queue can take a frame without dropping one."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._running or len(self._queue) < self._queue.maxlen, timeout)
+
+    def _send_loop(self):
+        try:
+            self._handshake()
+            while True:
+                with self._cond:
+                    while self._running and not self._queue:
+                        self._cond.wait()
+                    if not self._running:
+                        break
+                    payload, info = self._queue.popleft()
+                    self._cond.notify_all()
+                self._send(payload, info)
+                self.frames_sent += 1
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def _handshake(self):
+        self.version, flags = server_handshake(self.sock)
+        self.tiles = bool(flags & HELLO_TILES)
+        if self.version > 1 and self.on_feedback:
+            threading.Thread(target=self._feedback_loop, args=(self.sock,), daemon=True).start()
+
+    def _send(self, payload, info):
+        self.sock.sendall(pack_frame(payload, info if self.version > 1 else None))
+        self.sock.sendall(payload)
+
+    def _feedback_loop(self, sock):
+        data = bytearray(FEEDBACK.size)
+        view = memoryview(data)
+        try:
+            while True:
+                received = 0
+                while received < FEEDBACK.size:
+                    n = sock.recv_into(view[received:])
+                    if n == 0:
+                        return
+                    received += n
+                self.on_feedback(self, unpack_feedback(data))
+        except (OSError, ValueError):
+            self.close()
+
+    def close(self):
+        with self._cond:
+            if not self._running and self.sock is None:
+                return
+            self._running = False
+            self._cond.notify_all()
+            sock, self.sock = self.sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+            if self.on_close:
+                self.on_close(self)
+
+
+class FanOutServer:
+    """Accepts viewers and sends every broadcast payload to all of them.
+
+    Subclasses produce the payloads: they add their own threads through
+    _workers() and call broadcast() for each frame. _client_added() is
+    called for every new viewer, for example to send it a first frame.
+    attach() adds a viewer that did not come through accept(), such as a
+    udp_transport.UdpSender.
+    """
+
+    def __init__(self, host='0.0.0.0', port=DEFAULT_PORT, queue_size=2):
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+
+        self.clients = []
+        self._lock = threading.Lock()
+        self._running = False
+        self._threads = []
+        self.server_socket = None
+
+    def _workers(self):
+        return [self._accept_loop]
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen()
+        self.port = self.server_socket.getsockname()[1]
+        self._running = True
+        for target in self._workers():
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while self._running:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, address = self.server_socket.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = ClientConnection(sock, address, self.queue_size, on_close=self._remove_client,
+                                      on_feedback=self._on_feedback)
+            self.attach(client)
+            print(f"Client connected: {address[0]}:{address[1]}")
+
+    def attach(self, client):
+        with self._lock:
+            self.clients.append(client)
+        self._client_added(client)
+
+    def _client_added(self, client):
+        pass
+
+    def _remove_client(self, client):
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        print(f"Client disconnected: {client.address[0]}:{client.address[1]}")
+
+    def _on_feedback(self, client, feedback):
+        pass
+
+    def broadcast(self, payload, info):
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.push(payload, info)
+
+    def stop(self):
+        self._running = False
+        if self.server_socket:
+            self.server_socket.close()
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+
+class StreamServer(FanOutServer):
+    """Captures, encodes and fans frames out to every connected client.
+
+    Capture and JPEG encoding run on separate threads with a latest-frame
+    slot between them, and each client has its own bounded queue, so neither
+    a slow encoder nor a slow viewer can stall the camera loop.
+
+    With a controller (AdaptiveController) the quality, resolution and frame
+    rate follow the clients' feedback instead of the fixed settings.
+
+    With a delta encoder (TileEncoder) clients that decode tiles get
+    keyframes and changed-tile deltas; any other client gets a complete
+    JPEG of the same frame, encoded only while such a client is connected.
+    """
+
+    def __init__(self, source, host='0.0.0.0', port=DEFAULT_PORT, quality=80, queue_size=2, controller=None,
+                 delta=None):
+        super().__init__(host, port, queue_size)
+        self.source = source
+        self.quality = quality
+        self.controller = controller
+        self.delta = delta
+
+        self.frames_captured = 0
+        self.frames_encoded = 0
+
+        self._frame_cond = threading.Condition()
+        self._raw_frame = None
+        self._seq = 0
+
+    def _workers(self):
+        return super()._workers() + [self._capture_loop, self._encode_loop]
+
+    def _client_added(self, client):
+        if self.delta:
+            self.delta.request_keyframe()
+
+    def _remove_client(self, client):
+        if self.controller:
+            with self._lock:
+                self.controller.forget(client)
+        super()._remove_client(client)
+
+    def _on_feedback(self, client, feedback):
+        if self.controller:
+            with self._lock:
+                self.controller.report(client, feedback)
+
+    def _capture_loop(self):
+        while self._running:
+            frame = self.source.read()
+            if frame is None:
+                print("Capture source exhausted")
+                self._running = False
+                break
+            timestamp = monotonic_us()
+            with self._frame_cond:
+                self._raw_frame = (frame, self._seq, timestamp)
+                self._seq += 1
+                self.frames_captured += 1
+                self._frame_cond.notify()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+
+    def _encode_loop(self):
+        last_encode = 0.0
+        while True:
+            with self._frame_cond:
+                while self._running and self._raw_frame is None:
+                    self._frame_cond.wait()
+                if not self._running:
+                    break
+                (frame, seq, timestamp), self._raw_frame = self._raw_frame, None
+
+            quality, scale = self.quality, 1.0
+            if self.controller:
+                now = time.monotonic()
+                height, width = frame.shape[:2]
+                with self._lock:
+                    self.controller.adjust(now, (width, height))
+                if now - last_encode < 1.0 / self.controller.fps:
+                    continue
+                last_encode = now
+                quality, scale = self.controller.quality, self.controller.scale
+
+            if self.delta:
+                self._broadcast_delta(frame, seq, timestamp, quality, scale)
+                continue
+            encoded = self.encode(frame, quality, scale)
+            if encoded is None:
+                continue
+            payload, width, height = encoded
+            self.frames_encoded += 1
+            self.broadcast(payload, FrameInfo(seq, timestamp, width, height, CODEC_JPEG, 0))
+
+    def _broadcast_delta(self, frame, seq, timestamp, quality, scale):
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        encoded = self.delta.encode(frame, seq, quality)
+        if encoded is None:
+            return
+        payload, codec, flags = encoded
+        height, width = frame.shape[:2]
+        info = FrameInfo(seq, timestamp, width, height, codec, flags)
+        self.frames_encoded += 1
+        full = None
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            if client.tiles or codec == CODEC_JPEG:
+                client.push(payload, info)
+                continue
+            if full is None:
+                full = self.encode(frame, quality)
+                if full is None:
+                    return
+            client.push(full[0], info._replace(codec=CODEC_JPEG, flags=0))
+
+    def encode(self, frame, quality, scale=1.0):
+        """Return (jpeg bytes, width, height) or None if encoding failed."""
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        if not ok:
+            return None
+        height, width = frame.shape[:2]
+        return encoded.tobytes(), width, height
+
+    def stop(self):
+        self._running = False
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        super().stop()
+        self.source.close()
+
+
+def attach_udp(server, addresses, interface=None):
+    """Attach a UdpSender for each "HOST:PORT" in addresses to server."""
+    from udp_transport import DEFAULT_UDP_PORT, UdpSender
+
+    for text in addresses:
+        address = parse_address(text, DEFAULT_UDP_PORT)
+        try:
+            sender = UdpSender(address, server.queue_size, interface=interface, on_close=server._remove_client)
+        except OSError as e:
+            print(f"Cannot send UDP to {address[0]}:{address[1]}: {e}")
+            continue
+        server.attach(sender)
+        print(f"Sending UDP to {address[0]}:{address[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream JPEG frames to VideoStreamWindow clients")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--camera', type=int, default=0, help="camera index for cv2.VideoCapture")
+    group.add_argument('--file', help="video file to stream")
+    group.add_argument('--image', help="image to repeat as a synthetic source")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--fps', type=float, default=None, help="frame rate (default: 30 or the file's own)")
+    parser.add_argument('--scale', type=float, default=1.0, help="resize factor for --image")
+    parser.add_argument('--quality', type=int, default=80, help="JPEG quality")
+    parser.add_argument('--queue-size', type=int, default=2, help="frames buffered per client")
+    parser.add_argument('--target-latency', type=float, default=0,
+                        help="adapt quality/resolution/fps to keep latency under this many ms (0 = off)")
+    parser.add_argument('--delta', action='store_true',
+                        help="send only changed tiles between keyframes to clients that support it")
+    parser.add_argument('--tile-size', type=int, default=64, help="tile size for --delta, a multiple of 16")
+    parser.add_argument('--keyframe-interval', type=float, default=2.0, help="seconds between keyframes for --delta")
+    parser.add_argument('--udp', action='append', default=[], metavar='HOST:PORT',
+                        help="also send every frame over UDP to this viewer or multicast group (repeatable)")
+    parser.add_argument('--udp-interface', help="local address to send multicast from")
+    args = parser.parse_args()
+
+    if args.image:
+        source = ImageSource(args.image, fps=args.fps or 30, scale=args.scale)
+    elif args.file:
+        source = CaptureSource(args.file, fps=args.fps, loop=True)
+    else:
+        source = CaptureSource(args.camera, fps=args.fps)
+
+    controller = None
+    if args.target_latency:
+        controller = AdaptiveController(args.target_latency, max_fps=args.fps or 30, max_quality=args.quality)
+
+    delta = None
+    if args.delta:
+        delta = TileEncoder(args.tile_size, args.keyframe_interval, quality=args.quality)
+
+    server = StreamServer(source, args.host, args.port, args.quality, args.queue_size, controller, delta)
+    attach_udp(server, args.udp, args.udp_interface)
+    print(f"Streaming on {args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""Raw BGR frames in shared memory, for a producer and viewer on one host.
+
+When the camera and the window share a machine, JPEG encoding, the loopback
+socket and cv2.imdecode are pure overhead. Here the producer copies each
+captured frame into the next slot of a ring in multiprocessing.shared_memory
+and the viewer reads it straight out of the mapping:
+
+    python shm_transport.py --camera 1 --name camera1
+    python shm_transport.py --image saved_frame.jpg --fps 60 --name test
+
+and "shm:camera1" typed into the window's address field instead of an IP.
+
+Layout of the block (little-endian, native alignment):
+
+    RING_HEADER   magic, version, channels, slot count, width, height
+    counters      uint64 frames published so far, uint64 closed flag
+    slot table    one SLOT_DTYPE record per slot, from offset 64
+    frames        slot count * height * width * channels bytes, 64-byte aligned
+
+Each slot is guarded by a sequence lock: the writer makes the slot's `lock`
+odd, writes the pixels, seq and timestamp, then makes it even again, and
+only then publishes the frame. A reader never blocks the writer; it reads
+`lock`, uses the pixels, and discards the result if `lock` changed
+meanwhile, which only happens when it fell a whole ring behind.
+"""
+import argparse
+import signal
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+from decoding import reduction_factor
+from protocol import CODEC_BGR, FrameInfo, monotonic_us
+from stream_stats import StreamStats
+
+SHM_PREFIX = 'shm:'
+
+RING_MAGIC = b'QTVS'
+RING_VERSION = 1
+# magic, version, channels, slots, width, height
+RING_HEADER = struct.Struct('<4sBBHII')
+COUNTERS_OFFSET = RING_HEADER.size
+SLOTS_OFFSET = 64
+SLOT_DTYPE = np.dtype([
+    ('lock', '<u8'),        # odd while the writer is inside the slot
+    ('seq', '<u8'),
+    ('timestamp', '<u8'),   # capture time, microseconds of the monotonic clock
+])
+
+
+def _aligned(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class SharedFrameRing:
+    """A ring of fixed-size frame slots in a named shared memory block.
+
+    Use create() on the producer side and attach() on the viewer side. The
+    creator owns the block: its close() marks the ring closed for readers
+    and unlinks the name.
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        magic, version, channels, slots, width, height = RING_HEADER.unpack_from(shm.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            raise ValueError(f"Shared memory {shm.name!r} is not a frame ring")
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.shape = (height, width, channels)
+        self.counters = np.ndarray((2,), '<u8', shm.buf, COUNTERS_OFFSET)
+        self.slots = np.ndarray((slots,), SLOT_DTYPE, shm.buf, SLOTS_OFFSET)
+        frames_offset = _aligned(SLOTS_OFFSET + slots * SLOT_DTYPE.itemsize)
+        self.frames = np.ndarray((slots,) + self.shape, np.uint8, shm.buf, frames_offset)
+
+    @classmethod
+    def create(cls, name, width, height, slots=4, channels=3):
+        frames_offset = _aligned(SLOTS_OFFSET + slots * SLOT_DTYPE.itemsize)
+        size = frames_offset + slots * width * height * channels
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a producer that died without close(): replace it
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        RING_HEADER.pack_into(shm.buf, 0, RING_MAGIC, RING_VERSION, channels, slots, width, height)
+        shm.buf[COUNTERS_OFFSET:frames_offset] = bytes(frames_offset - COUNTERS_OFFSET)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        shm = shared_memory.SharedMemory(name)
+        # Before Python 3.13 attaching registers the block with this process's
+        # resource tracker, which would unlink it under the producer on exit
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        try:
+            return cls(shm)
+        except ValueError:
+            shm.close()
+            raise
+
+    @property
+    def published(self):
+        """Number of frames written so far; the newest has seq published - 1."""
+        return int(self.counters[0])
+
+    @property
+    def closed(self):
+        return bool(self.counters[1])
+
+    def write(self, frame, timestamp=None):
+        """Copy frame into the next slot, resizing it to the ring's size if needed; return its seq."""
+        if frame.ndim != 3 or frame.shape[2] != self.channels:
+            raise ValueError(f"Expected {self.channels}-channel frames, got shape {frame.shape}")
+        seq = self.published
+        index = seq % len(self.slots)
+        slot = self.slots[index:index + 1]
+        slot['lock'] += 1
+        if frame.shape == self.shape:
+            np.copyto(self.frames[index], frame)
+        else:
+            cv2.resize(frame, (self.width, self.height), dst=self.frames[index], interpolation=cv2.INTER_AREA)
+        slot['seq'] = seq
+        slot['timestamp'] = monotonic_us() if timestamp is None else timestamp
+        slot['lock'] += 1
+        self.counters[0] = seq + 1
+        return seq
+
+    def read(self, seq, convert):
+        """Return (convert(view), FrameInfo) for frame seq, or None if it is no longer in the ring.
+
+        view is the slot itself, mapped without copying; convert must copy
+        what it needs out of it (np.copy, cv2.resize, ...) rather than keep it.
+        """
+        index = seq % len(self.slots)
+        lock = int(self.slots[index]['lock'])
+        if lock & 1 or int(self.slots[index]['seq']) != seq:
+            return None
+        timestamp = int(self.slots[index]['timestamp'])
+        result = convert(self.frames[index])
+        if int(self.slots[index]['lock']) != lock:
+            return None
+        return result, FrameInfo(seq, timestamp, self.width, self.height, CODEC_BGR, 0)
+
+    def close(self):
+        if self.owner:
+            self.counters[1] = 1
+        # Views into the buffer must go before it can be unmapped
+        self.counters = self.slots = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedMemoryReceiver(threading.Thread):
+    """FrameReceiver's interface over a SharedFrameRing on this host.
+
+    The ring is attached in the constructor, so a missing producer fails
+    there just as a refused TCP connection does. The thread polls for new
+    frames every poll_interval seconds and always jumps to the newest one;
+    frames it skips count as lost in `stats`, as gaps do on a TCP stream.
+    Producer and viewer share the monotonic clock, so the latency in
+    `stats` needs no clock offset.
+
+    The only copy of a frame is the one that turns the mapped slot into the
+    displayed frame, reduced by 2, 4 or 8 when display_size allows it as
+    with JPEG. display_size, zoom, metrics, undistorter, analyzer and
+    request_snapshot() behave as in FrameReceiver; a recorder gets each
+    frame encoded as JPEG, since recordings hold JPEG payloads. The stream
+    ends when the producer closes the ring or publishes nothing for
+    stall_timeout seconds.
+    """
+
+    def __init__(self, name, on_frame, on_error=None, poll_interval=0.002, stall_timeout=5.0):
+        super().__init__(daemon=True)
+        self.name = name
+        self.ring = SharedFrameRing.attach(name)
+        self.on_frame = on_frame
+        self.on_error = on_error
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        self.stats = StreamStats()
+        self.info = None
+
+        self._lock = threading.Lock()
+        self._latest = None
+        self._running = True
+        self._finished = False
+        self._close_pending = False
+        self._snapshot_path = None
+
+        self.display_size = None
+        self.zoom = 1.0
+        self.recorder = None
+        self.analyzer = None
+        self.metrics = None
+        self.undistorter = None
+
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_torn = 0
+
+    def run(self):
+        last_seq = None
+        last_frame = time.monotonic()
+        try:
+            while self._running:
+                published = self.ring.published
+                if not published or published - 1 == last_seq:
+                    if self.ring.closed:
+                        self._fail("Producer closed the stream")
+                        return
+                    if time.monotonic() - last_frame > self.stall_timeout:
+                        self._fail(f"No frames for {self.stall_timeout:.0f} s")
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+                last_frame = time.monotonic()
+                self._receive(published - 1)
+                last_seq = published - 1
+        except (OSError, ValueError) as e:
+            self._fail(f"Video reception failed: {e}")
+        finally:
+            with self._lock:
+                self._finished = True
+                close = self._close_pending
+            if close:
+                self._unmap()
+
+    def _receive(self, seq):
+        metrics = self.metrics
+        full = self._snapshot_path is not None or self.recorder is not None
+        start = time.perf_counter()
+        result = self.ring.read(seq, np.copy if full else self._convert)
+        if result is None:
+            self.frames_torn += 1
+            if metrics is not None:
+                metrics.count('frames_torn')
+            return
+        frame, self.info = result
+        self.stats.update(self.info)
+        if metrics is not None:
+            metrics.observe('latency', self.stats.latency_us / 1e6)
+            metrics.set('frames_lost', self.stats.frames_lost)
+            metrics.count('bytes_received', frame.nbytes)
+            metrics.count('frames_received')
+
+        if full:
+            snapshot_path = self._snapshot_path
+            if snapshot_path is not None:
+                self._snapshot_path = None
+                cv2.imwrite(snapshot_path, frame)
+            recorder = self.recorder
+            if recorder is not None:
+                ok, encoded = cv2.imencode('.jpg', frame)
+                if ok:
+                    recorder.write(encoded.tobytes(), seq)
+            frame = self._convert(frame)
+        elapsed = time.perf_counter() - start
+        if metrics is not None:
+            metrics.observe('decode', elapsed)
+
+        undistorter = self.undistorter
+        if undistorter is not None:
+            frame = undistorter.apply(frame)
+            if metrics is not None:
+                metrics.observe('undistort', time.perf_counter() - start - elapsed)
+        if metrics is not None:
+            metrics.count('frames_decoded')
+        self._publish(frame)
+
+    def _convert(self, view):
+        height, width = view.shape[:2]
+        factor = reduction_factor((width, height), self._target_size())
+        if factor == 1:
+            return view.copy()
+        return cv2.resize(view, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+
+    def _target_size(self):
+        size = self.display_size
+        if size is None:
+            return None
+        return int(size[0] * self.zoom), int(size[1] * self.zoom)
+
+    def _publish(self, frame):
+        analyzer = self.analyzer
+        if analyzer is not None:
+            analyzer.submit(frame)
+        with self._lock:
+            notify = self._latest is None
+            if not notify:
+                self.frames_dropped += 1
+                if self.metrics is not None:
+                    self.metrics.count('frames_dropped')
+            self._latest = frame
+            self.frames_received += 1
+        if notify:
+            self.on_frame()
+
+    def _fail(self, message):
+        if self._running and self.on_error:
+            self.on_error(message)
+
+    def take_frame(self):
+        """Return the newest frame and clear the slot (None if nothing new)."""
+        with self._lock:
+            frame = self._latest
+            self._latest = None
+        return frame
+
+    def request_snapshot(self, path):
+        """Save the next frame at full resolution to path."""
+        self._snapshot_path = path
+
+    def stop(self):
+        self._running = False
+
+    def close(self):
+        """Unmap the ring, or have the thread unmap it when it exits if it is still running."""
+        self._running = False
+        with self._lock:
+            if self.ident is not None and not self._finished:
+                self._close_pending = True
+                return
+        self._unmap()
+
+    def _unmap(self):
+        ring, self.ring = self.ring, None
+        if ring is not None:
+            ring.close()
+
+
+def publish(source, name, slots=4):
+    """Copy frames from a server.py source into a new ring until it runs out."""
+    frame = source.read()
+    if frame is None:
+        return
+    height, width = frame.shape[:2]
+    ring = SharedFrameRing.create(name, width, height, slots)
+    print(f"Publishing {width}x{height} frames as {SHM_PREFIX}{name}")
+    try:
+        while frame is not None:
+            ring.write(frame, monotonic_us())
+            frame = source.read()
+        print("Capture source exhausted")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+        source.close()
+
+
+def main():
+    from server import CaptureSource, ImageSource
+
+    parser = argparse.ArgumentParser(description="Publish raw frames in shared memory for a viewer on this host")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--camera', type=int, default=0, help="camera index for cv2.VideoCapture")
+    group.add_argument('--file', help="video file to publish")
+    group.add_argument('--image', help="image to repeat as a synthetic source")
+    parser.add_argument('--name', default='qt-video', help=f"ring name; viewers connect to {SHM_PREFIX}NAME")
+    parser.add_argument('--slots', type=int, default=4, help="frames kept in the ring")
+    parser.add_argument('--fps', type=float, default=None, help="frame rate (default: 30 or the file's own)")
+    parser.add_argument('--scale', type=float, default=1.0, help="resize factor for --image")
+    args = parser.parse_args()
+    # Close the ring on kill too, so viewers see the stream end at once
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    if args.image:
+        source = ImageSource(args.image, fps=args.fps or 30, scale=args.scale)
+    elif args.file:
+        source = CaptureSource(args.file, fps=args.fps, loop=True)
+    else:
+        source = CaptureSource(args.camera, fps=args.fps)
+    publish(source, args.name, args.slots)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""The viewer's streaming pipeline without a GUI.
+
+The windows in client.py and pp.py and the command line below share it:
+
+    address ──open_stream()──> receiver ──> ViewerSession ──> FrameSink
+
+open_stream() (receiver.py) picks the transport from the address and
+returns a receiver: a FrameReader or UdpFrameReader feeding the decoders
+of decoding.py and tile_codec.py, or a SharedMemoryReceiver. The
+ViewerSession owns the receiver of the current connection and the
+settings that outlive it, and tells its FrameSink when a frame is ready.
+Nothing here imports Qt.
+
+Run as a script it connects to one stream and writes what arrives as fast
+as it arrives, printing statistics to stderr:
+
+    python stream_core.py 192.168.0.5 --duration 10
+    python stream_core.py udp://239.255.0.1:12350 --frames out/ --count 300
+    python stream_core.py 192.168.0.5 --record recordings --size 80x60
+    python stream_core.py shm:qt-video --raw - | ffplay -f rawvideo -pixel_format bgr24 -video_size 640x480 -
+
+--size decodes for that window size (JPEG reduced decode), which costs a
+fraction of a full decode when only statistics or recordings are wanted.
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+import cv2
+
+from receiver import open_stream
+from recorder import SegmentRecorder
+
+# Defaults of the settings a ViewerSession applies to every receiver it opens
+SESSION_SETTINGS = {
+    'display_size': None,
+    'zoom': 1.0,
+    'recorder': None,
+    'metrics': None,
+    'undistorter': None,
+    'analyzer': None,
+}
+
+
+class FrameSink:
+    """Where a ViewerSession delivers its stream; override what you need.
+
+    Both methods are called on the session's receiving thread, and the time
+    they take holds up the stream. frame_ready() means a new frame is
+    waiting: session.take_frame() returns it, from any thread, and a frame
+    nobody takes is replaced by the next one. stream_failed() is called once
+    when the connection breaks or the server closes it; disconnect the
+    session from another thread, not from inside the call.
+    """
+
+    def frame_ready(self, session):
+        pass
+
+    def stream_failed(self, session, message):
+        pass
+
+
+class CallbackSink(FrameSink):
+    """A FrameSink calling on_frame() and on_error(message), such as Qt signal emits."""
+
+    def __init__(self, on_frame, on_error=None):
+        self.on_frame = on_frame
+        self.on_error = on_error
+
+    def frame_ready(self, session):
+        self.on_frame()
+
+    def stream_failed(self, session, message):
+        if self.on_error:
+            self.on_error(message)
+
+
+def _setting(name):
+    def get(self):
+        return self._settings[name]
+
+    def set(self, value):
+        self._settings[name] = value
+        if self.receiver is not None:
+            setattr(self.receiver, name, value)
+
+    return property(get, set)
+
+
+class ViewerSession:
+    """One viewer's connection to a stream, and its settings.
+
+    display_size, zoom, recorder, metrics, undistorter and analyzer mean
+    what they do on FrameReceiver. They can be set at any time: the session
+    keeps them and applies them to every receiver it opens, so they survive
+    a reconnect, and a change while connected takes effect with the next
+    frame. connect() raises OSError or ValueError if the stream cannot be
+    opened.
+    """
+
+    display_size = _setting('display_size')
+    zoom = _setting('zoom')
+    recorder = _setting('recorder')
+    metrics = _setting('metrics')
+    undistorter = _setting('undistorter')
+    analyzer = _setting('analyzer')
+
+    def __init__(self, sink=None, decode_workers=0, queue_depth=4):
+        self.sink = sink or FrameSink()
+        self.decode_workers = decode_workers
+        self.queue_depth = queue_depth
+        self.address = None
+        self.receiver = None
+        self._settings = dict(SESSION_SETTINGS)
+
+    @property
+    def connected(self):
+        return self.receiver is not None
+
+    @property
+    def info(self):
+        """FrameInfo of the last frame read, or None."""
+        return self.receiver.info if self.receiver else None
+
+    @property
+    def stats(self):
+        """StreamStats of the current connection, or None."""
+        return self.receiver.stats if self.receiver else None
+
+    def connect(self, address):
+        self.disconnect()
+        receiver = open_stream(address, self._frame_ready, self._stream_failed,
+                               decode_workers=self.decode_workers, queue_depth=self.queue_depth)
+        for name, value in self._settings.items():
+            setattr(receiver, name, value)
+        self.address = address
+        self.receiver = receiver
+        receiver.start()
+
+    def disconnect(self):
+        receiver, self.receiver = self.receiver, None
+        if receiver is not None:
+            receiver.stop()
+            receiver.join(timeout=1.0)
+            receiver.close()
+
+    def take_frame(self):
+        """Return the newest frame and clear the slot (None if nothing new)."""
+        receiver = self.receiver
+        return receiver.take_frame() if receiver else None
+
+    def request_snapshot(self, path):
+        """Save the next frame at full resolution to path; False if not connected."""
+        if self.receiver is None:
+            return False
+        self.receiver.request_snapshot(path)
+        return True
+
+    def start_recording(self, directory):
+        self.stop_recording()
+        self.recorder = SegmentRecorder(directory)
+        return self.recorder
+
+    def stop_recording(self):
+        """Stop recording and return the closed recorder, or None if not recording."""
+        recorder = self.recorder
+        if recorder is not None:
+            self.recorder = None
+            recorder.close()
+        return recorder
+
+    def _frame_ready(self):
+        self.sink.frame_ready(self)
+
+    def _stream_failed(self, message):
+        self.sink.stream_failed(self, message)
+
+
+class FrameWriter(FrameSink):
+    """Takes every frame as soon as it is ready and passes it to write().
+
+    Stops taking frames after `limit` of them (0: no limit) and sets `done`
+    then, or when the stream fails, with the reason in `error`.
+    """
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.frames = 0
+        self.error = None
+        self.done = threading.Event()
+
+    def frame_ready(self, session):
+        if self.done.is_set():
+            return
+        frame = session.take_frame()
+        if frame is None:
+            return
+        self.write(frame, session.info)
+        self.frames += 1
+        if self.limit and self.frames >= self.limit:
+            self.done.set()
+
+    def write(self, frame, info):
+        pass
+
+    def stream_failed(self, session, message):
+        self.error = message
+        self.done.set()
+
+
+class ImageWriter(FrameWriter):
+    """Saves every frame to directory as <seq>.<extension>."""
+
+    def __init__(self, directory, extension='jpg', limit=0):
+        super().__init__(limit)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.extension = extension
+
+    def write(self, frame, info):
+        seq = info.seq if info is not None else self.frames
+        cv2.imwrite(os.path.join(self.directory, f"{seq:08d}.{self.extension}"), frame)
+
+
+class RawWriter(FrameWriter):
+    """Writes every frame as raw BGR bytes to a binary file, such as stdout."""
+
+    def __init__(self, file, limit=0):
+        super().__init__(limit)
+        self.file = file
+        self.size = None
+
+    def write(self, frame, info):
+        size = (frame.shape[1], frame.shape[0])
+        if size != self.size:
+            self.size = size
+            print(f"Raw frames: {size[0]}x{size[1]} bgr24", file=sys.stderr)
+        self.file.write(frame.data if frame.flags.c_contiguous else frame.tobytes())
+
+
+def format_stats(session, sink, elapsed, frames_before=0, interval=None):
+    receiver = session.receiver
+    received = receiver.frames_received if receiver else 0
+    rate = (received - frames_before) / interval if interval else received / max(elapsed, 1e-9)
+    line = f"{elapsed:7.1f} s  frames {received} ({rate:.1f}/s)  taken {sink.frames}"
+    if receiver is not None:
+        line += f"  dropped {receiver.frames_dropped}"
+    stats = session.stats
+    if stats is not None and stats.frames:
+        line += (f"  lost {stats.frames_lost}  latency {stats.latency_us / 1000:.1f} ms"
+                 f" (mean {stats.mean_latency_us / 1000:.1f})  jitter {stats.jitter_us / 1000:.1f} ms")
+    return line, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive a stream without a GUI and write frames or statistics")
+    parser.add_argument('address', help="HOST[:PORT], udp://HOST:PORT or shm:NAME, as in the window")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--frames', metavar='DIR', help="save every decoded frame as an image in DIR")
+    output.add_argument('--raw', metavar='FILE', help="write decoded frames as raw BGR to FILE ('-': stdout)")
+    parser.add_argument('--format', default='jpg', help="image format for --frames")
+    parser.add_argument('--record', metavar='DIR', help="record the received payloads to DIR, as the window does")
+    parser.add_argument('--size', help="decode for a window of WxH (default: full resolution)")
+    parser.add_argument('--workers', type=int, default=0, help="decode threads (0: decode on the receiving thread)")
+    parser.add_argument('--count', type=int, default=0, help="stop after this many frames")
+    parser.add_argument('--duration', type=float, default=0, help="stop after this many seconds")
+    parser.add_argument('--stats', type=float, default=1.0, help="seconds between statistics lines (0: off)")
+    args = parser.parse_args()
+    # Finish recordings and image files on kill too
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    raw_file = None
+    if args.frames:
+        sink = ImageWriter(args.frames, args.format, args.count)
+    elif args.raw:
+        raw_file = sys.stdout.buffer if args.raw == '-' else open(args.raw, 'wb')
+        sink = RawWriter(raw_file, args.count)
+    else:
+        sink = FrameWriter(args.count)
+
+    session = ViewerSession(sink, args.workers)
+    if args.size:
+        session.display_size = tuple(int(v) for v in args.size.split('x'))
+    if args.record:
+        session.start_recording(args.record)
+    try:
+        session.connect(args.address)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Connection failed: {e}")
+
+    started = last = time.monotonic()
+    received = 0
+    try:
+        while True:
+            timeout = args.stats or 0.5
+            if args.duration:
+                timeout = min(timeout, max(0.0, started + args.duration - time.monotonic()))
+            if sink.done.wait(timeout):
+                break
+            now = time.monotonic()
+            if args.stats and now - last >= args.stats:
+                line, received = format_stats(session, sink, now - started, received, now - last)
+                print(line, file=sys.stderr)
+                last = now
+            if args.duration and now - started >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        elapsed = time.monotonic() - started
+        line, _ = format_stats(session, sink, elapsed)
+        session.disconnect()
+        recorder = session.stop_recording()
+        if raw_file is not None and raw_file is not sys.stdout.buffer:
+            raw_file.close()
+        print(f"total {line.strip()}", file=sys.stderr)
+        if recorder is not None:
+            print(f"Recorded {recorder.frames_written} frames, dropped {recorder.frames_dropped}", file=sys.stderr)
+        if sink.error:
+            print(sink.error, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
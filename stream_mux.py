@@ -0,0 +1,236 @@
+import collections
+import os
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decoding import decode_frame
+from frame_reader import FrameParser
+from protocol import DEFAULT_PORT, pack_hello
+from stream_stats import StreamStats
+
+# Upper bound on recv calls for one session per wakeup, so a fast stream
+# cannot starve the others sharing the loop.
+READS_PER_WAKEUP = 16
+
+
+class StreamSession:
+    """One camera connection, driven by a StreamMux.
+
+    Frames arriving faster than max_fps are skipped before decoding, and at
+    most one decode per session is in flight: a payload arriving meanwhile
+    replaces any older one still waiting. display_size is the area the frame
+    will be shown in and selects a reduced-resolution decode. An Undistorter
+    assigned to `undistorter` is applied after decoding.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, max_fps=15, display_size=None):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.max_fps = max_fps
+        self.display_size = display_size
+        self.undistorter = None
+
+        self.sock = None
+        self.parser = FrameParser(negotiate=True)
+        self.connected = False
+        self.stats = None
+        self.error = None
+
+        self.frames_received = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+
+        self._lock = threading.Lock()
+        self._payload = None
+        self._decoding = False
+        self._frame = None
+        self._last_accept = 0.0
+
+    def take_frame(self):
+        """Return the newest decoded frame and clear it (None if nothing new)."""
+        with self._lock:
+            frame, self._frame = self._frame, None
+        return frame
+
+
+class StreamMux(threading.Thread):
+    """Runs every StreamSession on one selector loop.
+
+    Sockets are non-blocking and read on this thread only; decoding happens
+    on a small shared worker pool. on_frame(session) is called from a worker
+    when a session has a new frame, on_error(session, message) when a
+    session fails.
+    """
+
+    def __init__(self, on_frame, on_error=None, decode_workers=2):
+        super().__init__(daemon=True)
+        self.on_frame = on_frame
+        self.on_error = on_error
+        self.sessions = []
+
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(decode_workers, thread_name_prefix='mux-decode')
+        self._commands = collections.deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._running = True
+
+    def add(self, session):
+        self._commands.append((self._open, session))
+        self._wake()
+
+    def remove(self, session):
+        self._commands.append((self._close, session))
+        self._wake()
+
+    def stop(self):
+        self._running = False
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except BlockingIOError:
+            pass
+
+    def run(self):
+        try:
+            while self._running:
+                for key, _ in self.selector.select(timeout=1.0):
+                    session = key.data
+                    if session is None:
+                        self._drain_wakeups()
+                    elif not session.connected:
+                        self._finish_connect(session)
+                    else:
+                        self._read(session)
+                while self._commands:
+                    command, session = self._commands.popleft()
+                    command(session)
+        finally:
+            for session in list(self.sessions):
+                self._close(session)
+            self.executor.shutdown(wait=False)
+            self.selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _open(self, session):
+        family = socket.AF_INET6 if ':' in session.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        session.sock = sock
+        self.sessions.append(session)
+        try:
+            sock.connect((session.host, session.port))
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            self._fail(session, f"Connection failed: {e}")
+            return
+        self.selector.register(sock, selectors.EVENT_WRITE, session)
+
+    def _finish_connect(self, session):
+        error = session.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self._fail(session, f"Connection failed: {os.strerror(error)}")
+            return
+        try:
+            session.sock.send(pack_hello())
+        except OSError as e:
+            self._fail(session, f"Connection failed: {e}")
+            return
+        session.connected = True
+        self.selector.modify(session.sock, selectors.EVENT_READ, session)
+
+    def _read(self, session):
+        parser = session.parser
+        try:
+            for _ in range(READS_PER_WAKEUP):
+                n = session.sock.recv_into(parser.pending_view())
+                if n == 0:
+                    self._fail(session, "Server closed the connection")
+                    return
+                payload = parser.advance(n)
+                if payload is not None:
+                    self._on_payload(session, payload)
+        except BlockingIOError:
+            pass
+        except (OSError, ValueError) as e:
+            self._fail(session, f"Video reception failed: {e}")
+
+    def _on_payload(self, session, payload):
+        session.frames_received += 1
+        if session.parser.info is not None:
+            if session.stats is None:
+                session.stats = StreamStats(session.parser.clock_offset)
+            session.stats.update(session.parser.info)
+
+        now = time.monotonic()
+        if session.max_fps and now - session._last_accept < 1.0 / session.max_fps:
+            session.frames_skipped += 1
+            return
+        session._last_accept = now
+
+        # The parser reuses its buffer, so the decoder gets its own copy
+        payload = bytes(payload)
+        with session._lock:
+            if session._decoding:
+                if session._payload is not None:
+                    session.frames_skipped += 1
+                session._payload = payload
+                return
+            session._decoding = True
+        self.executor.submit(self._decode, session, payload)
+
+    def _decode(self, session, payload):
+        while payload is not None:
+            try:
+                frame = decode_frame(payload, session.display_size)
+                undistorter = session.undistorter
+                if undistorter is not None and frame is not None:
+                    frame = undistorter.apply(frame)
+            except Exception:
+                # A payload imdecode rejects outright is just a lost frame
+                frame = None
+            with session._lock:
+                if frame is not None:
+                    if session._frame is not None:
+                        session.frames_dropped += 1
+                    session._frame = frame
+                payload, session._payload = session._payload, None
+                if payload is None:
+                    session._decoding = False
+            if frame is not None:
+                self.on_frame(session)
+
+    def _close(self, session):
+        if session in self.sessions:
+            self.sessions.remove(session)
+        if session.sock is not None:
+            try:
+                self.selector.unregister(session.sock)
+            except (KeyError, ValueError):
+                pass
+            session.sock.close()
+            session.sock = None
+        session.connected = False
+
+    def _fail(self, session, message):
+        session.error = message
+        self._close(session)
+        if self.on_error:
+            self.on_error(session, message)
@@ -0,0 +1,64 @@
+from protocol import monotonic_us
+
+
+class StreamStats:
+    """Latency, drop-rate and jitter of one v2 stream.
+
+    Latency is arrival time minus capture time after converting the capture
+    timestamp to the local clock with the offset measured during the
+    handshake. Jitter is the RFC 3550 interarrival jitter: a running mean of
+    how much the spacing between arrivals differs from the spacing between
+    captures. Drops are gaps in the sequence numbers.
+    """
+
+    def __init__(self, clock_offset=0):
+        self.clock_offset = clock_offset
+        self.frames = 0
+        self.frames_lost = 0
+        self.latency_us = 0
+        self.min_latency_us = None
+        self.max_latency_us = 0
+        self.jitter_us = 0.0
+        self._latency_sum = 0
+        self._last_seq = None
+        self._last_transit = None
+
+    def update(self, info, arrival=None):
+        if arrival is None:
+            arrival = monotonic_us()
+        transit = arrival - (info.timestamp - self.clock_offset)
+
+        if self._last_seq is not None:
+            gap = (info.seq - self._last_seq) & 0xFFFFFFFF
+            if 1 < gap < 0x80000000:
+                self.frames_lost += gap - 1
+            self.jitter_us += (abs(transit - self._last_transit) - self.jitter_us) / 16
+        self._last_seq = info.seq
+        self._last_transit = transit
+
+        self.frames += 1
+        self.latency_us = transit
+        self._latency_sum += transit
+        self.max_latency_us = max(self.max_latency_us, transit)
+        if self.min_latency_us is None or transit < self.min_latency_us:
+            self.min_latency_us = transit
+
+    @property
+    def drop_rate(self):
+        total = self.frames + self.frames_lost
+        return self.frames_lost / total if total else 0.0
+
+    @property
+    def mean_latency_us(self):
+        return self._latency_sum / self.frames if self.frames else 0.0
+
+    def summary(self):
+        return {
+            'frames': self.frames,
+            'lost': self.frames_lost,
+            'drop_rate': round(self.drop_rate, 4),
+            'latency_ms': round(self.latency_us / 1000, 2),
+            'mean_latency_ms': round(self.mean_latency_us / 1000, 2),
+            'max_latency_ms': round(self.max_latency_us / 1000, 2),
+            'jitter_ms': round(self.jitter_us / 1000, 2),
+        }
@@ -0,0 +1,135 @@
+"""Map tiles cached on disk with a size cap, served on a local port.
+
+Tiles are stored as <directory>/<z>/<x>/<y>.tile. A tile missing from the
+cache is fetched from the upstream URL template (any {z}/{x}/{y} tile
+server, including one on the local network), so tiles seen once keep
+working without a network. When the cache grows past max_bytes the least
+recently used tiles are deleted; a hit touches the file's mtime, so the
+order survives restarts.
+"""
+import collections
+import os
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TileCache:
+    """Least-recently-used tile cache on disk, in front of an optional upstream."""
+
+    def __init__(self, directory='tiles', upstream=None, max_bytes=256 * 1024 * 1024, timeout=5.0):
+        self.directory = directory
+        self.upstream = upstream
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.fetch_errors = 0
+
+        self._lock = threading.Lock()
+        self._sizes = collections.OrderedDict()  # path -> bytes, oldest first
+        self._total = 0
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tile'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._sizes[path] = size
+            self._total += size
+
+    def _path(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x), f"{y}.tile")
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def get(self, z, x, y):
+        """Tile bytes, from disk or upstream; None if neither has it."""
+        path = self._path(z, x, y)
+        with self._lock:
+            cached = path in self._sizes
+            if cached:
+                self._sizes.move_to_end(path)
+        if cached:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+                self.hits += 1
+                return data
+            except OSError:
+                with self._lock:
+                    self._total -= self._sizes.pop(path, 0)
+
+        self.misses += 1
+        if not self.upstream:
+            return None
+        try:
+            request = urllib.request.Request(self.upstream.format(z=z, x=x, y=y),
+                                             headers={'User-Agent': 'qt-video-client'})
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+        except (OSError, ValueError):
+            self.fetch_errors += 1
+            return None
+        self.put(z, x, y, data)
+        return data
+
+    def put(self, z, x, y, data):
+        path = self._path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+        with self._lock:
+            self._total += len(data) - self._sizes.pop(path, 0)
+            self._sizes[path] = len(data)
+            while self._total > self.max_bytes and len(self._sizes) > 1:
+                oldest, size = self._sizes.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(oldest)
+                except OSError:
+                    pass
+
+
+def serve_tiles(cache, port=0, host='127.0.0.1'):
+    """Serve /<z>/<x>/<y> from a TileCache on a daemon thread; return the server.
+
+    The port actually used is server.server_address[1]. Stop it with
+    server.shutdown(); server.server_close().
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            try:
+                z, x, y = (int(part.split('.')[0]) for part in parts)
+            except ValueError:
+                self.send_error(404)
+                return
+            data = cache.get(z, x, y)
+            if data is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png' if data[:4] == b'\x89PNG' else 'image/jpeg')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'max-age=86400')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='tiles-http', daemon=True).start()
+    return server
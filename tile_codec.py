@@ -0,0 +1,213 @@
+"""Tile-based delta coding for mostly static scenes.
+
+A keyframe is an ordinary JPEG of the whole frame, sent with FLAG_KEYFRAME.
+Every other frame is cut into tile_size squares and compared with the
+keyframe; only the tiles that differ are sent, each as its own small JPEG,
+in a CODEC_TILES payload:
+
+    TILES_HEADER   keyframe seq, tile size, tile count
+    per tile       TILE_ENTRY (column, row, JPEG length), then the JPEG
+
+Deltas are always against the keyframe, never against the previous frame,
+so a viewer that misses some of them (drop-oldest queues, skipped frames)
+still gets a correct picture from the next one. A viewer that missed the
+keyframe itself skips deltas until the next keyframe arrives.
+"""
+import struct
+import time
+
+import cv2
+import numpy as np
+
+from decoding import REDUCED_FLAGS, reduction_factor
+from protocol import CODEC_JPEG, CODEC_TILES, FLAG_KEYFRAME
+
+# keyframe seq, tile size, tile count
+TILES_HEADER = struct.Struct('<IHH')
+# column, row, JPEG length
+TILE_ENTRY = struct.Struct('<HHI')
+
+
+def _tile_edges(length, tile_size):
+    return np.append(np.arange(0, length, tile_size), length)
+
+
+class TileEncoder:
+    """Turns frames into keyframes and changed-tile deltas.
+
+    A tile has changed when more than min_changed of its pixel channels
+    differ from the keyframe by more than pixel_threshold, so sensor noise
+    is ignored but a small object moving through the tile is not. The
+    comparison runs over the whole frame at once: cv2.absdiff and a
+    threshold, then an integral image gives every tile's count from four
+    lookups, as in motion.py. A new keyframe is sent every
+    keyframe_interval seconds, when the frame size changes, after
+    request_keyframe(), and whenever more than max_changed of the tiles
+    differ, since by then a complete JPEG is smaller than the tiles. Slow
+    changes below pixel_threshold, such as fading daylight, therefore
+    reach the viewer with the next keyframe.
+    """
+
+    def __init__(self, tile_size=64, keyframe_interval=2.0, pixel_threshold=16, min_changed=8,
+                 max_changed=0.5, quality=80):
+        # Whole JPEG blocks, so tiles line up with the keyframe at every reduced decode scale
+        if tile_size <= 0 or tile_size % 16:
+            raise ValueError(f"tile_size must be a positive multiple of 16, got {tile_size}")
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.max_changed = max_changed
+        self.quality = quality
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.tiles_sent = 0
+
+        self._key = None
+        self._key_seq = 0
+        self._key_time = 0.0
+        self._force = True
+        self._row_edges = None
+        self._col_edges = None
+
+    def request_keyframe(self):
+        """Make the next frame a keyframe, for example for a viewer that just connected."""
+        self._force = True
+
+    def changed_tiles(self, frame):
+        """Boolean (rows, columns) grid of the tiles of frame that differ from the keyframe."""
+        diff = cv2.absdiff(frame, self._key)
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 1, cv2.THRESH_BINARY)
+        # Channels side by side, so one integral covers all three
+        integral = cv2.integral(mask.reshape(mask.shape[0], -1))
+        corners = integral[np.ix_(self._row_edges, self._col_edges)]
+        counts = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        return counts > self.min_changed
+
+    def encode(self, frame, seq, quality=None):
+        """Return (payload, codec, flags) for frame, or None if JPEG encoding failed."""
+        quality = int(quality or self.quality)
+        now = time.monotonic()
+        changed = None
+        if (not self._force and self._key is not None and frame.shape == self._key.shape
+                and now - self._key_time < self.keyframe_interval):
+            changed = self.changed_tiles(frame)
+            if changed.mean() > self.max_changed:
+                changed = None
+
+        if changed is None:
+            ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                return None
+            if self._key is None or self._key.shape != frame.shape:
+                self._key = np.empty_like(frame)
+                self._row_edges = _tile_edges(frame.shape[0], self.tile_size)
+                self._col_edges = _tile_edges(frame.shape[1], self.tile_size) * frame.shape[2]
+            np.copyto(self._key, frame)
+            self._key_seq = seq & 0xFFFFFFFF
+            self._key_time = now
+            self._force = False
+            self.keyframes += 1
+            return encoded.tobytes(), CODEC_JPEG, FLAG_KEYFRAME
+
+        size = self.tile_size
+        parts = [b'']
+        for row, column in np.argwhere(changed):
+            tile = frame[row * size:(row + 1) * size, column * size:(column + 1) * size]
+            ok, encoded = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                return None
+            parts.append(TILE_ENTRY.pack(column, row, len(encoded)))
+            parts.append(encoded.tobytes())
+        count = (len(parts) - 1) // 2
+        parts[0] = TILES_HEADER.pack(self._key_seq, size, count)
+        self.deltas += 1
+        self.tiles_sent += count
+        return b''.join(parts), CODEC_TILES, 0
+
+
+class TileDecoder:
+    """Rebuilds frames from keyframes and deltas in a persistent buffer.
+
+    Each delta is composited in place: tiles it carries are decoded into the
+    buffer, and tiles that the previous delta changed but this one does not
+    are restored from the decoded keyframe. Everything is decoded at the
+    reduced JPEG scale that still covers target_size, as decode_frame does;
+    when that scale changes the keyframe is decoded again from its payload.
+    decode() returns a copy, since the buffer is rewritten by the next call
+    while the GUI or an analyzer may still hold the frame.
+    """
+
+    def __init__(self):
+        self.frames_skipped = 0
+        self._key_seq = None
+        self._key_payload = None
+        self._key_size = None
+        self._factor = None
+        self._key = None
+        self._frame = None
+        self._dirty = None
+        self._tile_size = None
+
+    @staticmethod
+    def wants(info):
+        """True if the frame described by info belongs to a tile-delta stream."""
+        return info is not None and (info.codec == CODEC_TILES or bool(info.flags & FLAG_KEYFRAME))
+
+    def decode(self, data, info, target_size=None):
+        """Return the frame for a keyframe or delta payload, or None if it cannot be decoded."""
+        if info.codec != CODEC_TILES:
+            self._key_seq = info.seq
+            self._key_payload = bytes(data)
+            self._key_size = (info.width, info.height)
+            self._factor = None
+            self._dirty = None
+        if self._key_payload is None:
+            self.frames_skipped += 1
+            return None
+
+        factor = reduction_factor(self._key_size, target_size)
+        if factor != self._factor:
+            self._key = cv2.imdecode(np.frombuffer(self._key_payload, np.uint8),
+                                     dict(REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR))
+            if self._key is None:
+                self._key_payload = None
+                return None
+            self._factor = factor
+            self._frame = self._key.copy()
+            self._dirty = None
+        if info.codec != CODEC_TILES:
+            return self._key.copy()
+
+        key_seq, tile_size, count = TILES_HEADER.unpack_from(data)
+        if key_seq != self._key_seq:
+            self.frames_skipped += 1
+            return None
+        step = tile_size // factor
+        if self._dirty is None or tile_size != self._tile_size:
+            rows = -(-self._key_size[1] // tile_size)
+            columns = -(-self._key_size[0] // tile_size)
+            self._dirty = np.zeros((rows, columns), bool)
+            self._tile_size = tile_size
+        changed = np.zeros_like(self._dirty)
+        flag = dict(REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR)
+        data = memoryview(data)
+        offset = TILES_HEADER.size
+        for _ in range(count):
+            column, row, length = TILE_ENTRY.unpack_from(data, offset)
+            offset += TILE_ENTRY.size
+            tile = cv2.imdecode(np.frombuffer(data[offset:offset + length], np.uint8), flag)
+            offset += length
+            if tile is None:
+                continue
+            y, x = row * step, column * step
+            target = self._frame[y:y + tile.shape[0], x:x + tile.shape[1]]
+            target[...] = tile[:target.shape[0], :target.shape[1]]
+            changed[row, column] = True
+
+        for row, column in np.argwhere(self._dirty & ~changed):
+            y, x = row * step, column * step
+            self._frame[y:y + step, x:x + step] = self._key[y:y + step, x:x + step]
+        self._dirty = changed
+        return self._frame.copy()
@@ -0,0 +1,368 @@
+"""UDP transport: frames cut into datagrams, unicast or multicast.
+
+Over TCP one lost segment holds up everything behind it until it has been
+retransmitted, which on a lossy link freezes the picture for seconds, and
+every viewer is a separate stream. Here each frame is split into datagrams
+of at most max_datagram bytes, each starting with FRAGMENT_HEADER. The
+receiver reassembles them and gives up on a frame that is not complete
+within `deadline` seconds, or as soon as a newer frame completes. Nothing is
+retransmitted, so a lost datagram costs one frame and no more.
+
+Sent to a multicast group, one send reaches every viewer on the segment
+that joined it:
+
+    python server.py --camera 1 --udp 239.255.0.1:12350
+    udp://239.255.0.1:12350     in the window's address field
+
+For unicast the sender names the viewer's address and the viewer listens
+with udp://0.0.0.0:PORT. There is no handshake or return channel, so UDP
+viewers get a complete JPEG every frame (no tile deltas or feedback), and
+latency is measured relative to the first frame received.
+
+LossShim sits between the two on loopback and drops datagrams, singly or in
+bursts, so reassembly can be tried against a lossy link:
+
+    python udp_transport.py --listen 12350 --forward 127.0.0.1:12351 --loss 0.05 --burst 3
+"""
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+
+from frame_reader import MAX_FRAME_SIZE
+from protocol import FrameInfo, monotonic_us, parse_address
+from server import ClientConnection
+
+UDP_PREFIX = 'udp://'
+DEFAULT_UDP_PORT = 12350
+
+FRAGMENT_MAGIC = b'QTVU'
+UDP_VERSION = 1
+# magic, version, codec, flags, seq, capture time (us), width, height, frame length,
+# offset of this fragment in the frame, fragment index, fragment count
+FRAGMENT_HEADER = struct.Struct('<4sBBBxIQHHIIHH')
+# Fits a 1500-byte Ethernet MTU after the IP and UDP headers
+MAX_DATAGRAM = 1400
+SOCKET_BUFFER = 4 * 1024 * 1024
+
+
+def is_multicast(host):
+    try:
+        return 224 <= int(socket.inet_aton(host)[0]) <= 239
+    except OSError:
+        return False
+
+
+def _membership(group, interface):
+    return struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton(interface or '0.0.0.0'))
+
+
+class UdpSender(ClientConnection):
+    """Sends the frames pushed to it to one UDP address, fragmented.
+
+    A ClientConnection without a handshake, so a FanOutServer can attach()
+    it and treat it as one more viewer, queue and all. The socket is
+    connected to the address, which saves a route lookup per datagram; an
+    unicast address with nobody listening is not an error. For a multicast
+    group, ttl limits how many routers the datagrams cross and interface
+    picks the local address to send from.
+    """
+
+    def __init__(self, address, queue_size=2, max_datagram=MAX_DATAGRAM, ttl=1, interface=None, on_close=None):
+        self.max_datagram = max_datagram
+        self.datagrams_sent = 0
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+        if is_multicast(address[0]):
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            if interface:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        sock.connect(address)
+        super().__init__(sock, address, queue_size, on_close)
+
+    def _handshake(self):
+        self.version = 2
+
+    def _send(self, payload, info):
+        chunk = self.max_datagram - FRAGMENT_HEADER.size
+        count = max(1, -(-len(payload) // chunk))
+        if count > 0xFFFF:
+            return
+        view = memoryview(payload)
+        for index in range(count):
+            header = FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, UDP_VERSION, info.codec, info.flags,
+                                          info.seq & 0xFFFFFFFF, info.timestamp, info.width, info.height,
+                                          len(payload), index * chunk, index, count)
+            try:
+                self.sock.sendmsg([header, view[index * chunk:(index + 1) * chunk]])
+            except ConnectionRefusedError:
+                # ICMP port unreachable from an earlier datagram: no viewer yet
+                continue
+            self.datagrams_sent += 1
+
+
+class _Partial:
+    """A frame being reassembled, in a buffer that is reused for later frames."""
+
+    def __init__(self):
+        self.buffer = bytearray(256 * 1024)
+        self.received = bytearray()
+        self.seq = None
+        self.timestamp = 0
+
+    def start(self, seq, timestamp, length, count, now):
+        if length > len(self.buffer):
+            self.buffer = bytearray(max(length, len(self.buffer) * 2))
+        self.seq = seq
+        self.timestamp = timestamp
+        self.length = length
+        self.count = count
+        self.missing = count
+        self.started = now
+        self.received = bytearray(count)
+
+
+class UdpFrameReader:
+    """FrameReader's interface over a UDP socket receiving UdpSender datagrams.
+
+    read_frame() returns the payload as a memoryview over one of `slots`
+    reusable reassembly buffers, valid until the next call, and sets `info`.
+    A frame is dropped when it is still incomplete `deadline` seconds after
+    its first datagram, when a newer frame completes first, or when its
+    buffer is needed for a newer frame; frames_incomplete counts them. With
+    no datagram at all for stall_timeout seconds read_frame() raises
+    TimeoutError. It returns None once stop() has been called.
+    """
+
+    def __init__(self, sock, deadline=0.2, stall_timeout=5.0, slots=3, max_frame_size=MAX_FRAME_SIZE):
+        self.sock = sock
+        self.deadline = deadline
+        self.stall_timeout = stall_timeout
+        self.max_frame_size = max_frame_size
+        self.version = 2
+        self.info = None
+        self.clock_offset = None
+        # Cleared by stop(); an empty datagram from the network is not a shutdown
+        self.running = True
+
+        self.frames_completed = 0
+        self.frames_incomplete = 0
+        self.datagrams_received = 0
+        self.datagrams_late = 0
+        self.datagrams_invalid = 0
+
+        self._datagram = bytearray(65536)
+        self._datagram_view = memoryview(self._datagram)
+        self._slots = [_Partial() for _ in range(slots)]
+        self._last_timestamp = None
+        self._last_delivery = 0.0
+        self._last_datagram = time.monotonic()
+        sock.settimeout(min(deadline / 2, 0.1))
+
+    @classmethod
+    def open(cls, host, port=DEFAULT_UDP_PORT, interface=None, **kwargs):
+        """Bind a socket for host:port, joining the group if host is multicast."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Several viewers on one host can join the same group and port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+        try:
+            if is_multicast(host):
+                sock.bind(('', port))
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _membership(host, interface))
+            else:
+                sock.bind((host, port))
+        except OSError:
+            sock.close()
+            raise
+        return cls(sock, **kwargs)
+
+    def stop(self):
+        """Make read_frame() return None; it wakes within one socket timeout."""
+        self.running = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _expire(self, now):
+        for slot in self._slots:
+            if slot.seq is not None and now - slot.started > self.deadline:
+                slot.seq = None
+                self.frames_incomplete += 1
+
+    def _is_stale(self, timestamp, now):
+        # A sender that restarted after a reboot has an earlier clock; after
+        # stall_timeout without a frame anything is accepted again
+        return (self._last_timestamp is not None and timestamp <= self._last_timestamp
+                and now - self._last_delivery < self.stall_timeout)
+
+    def _slot_for(self, seq, timestamp, length, count, now):
+        free = None
+        for slot in self._slots:
+            if slot.seq == seq:
+                return slot
+            if slot.seq is None and free is None:
+                free = slot
+        if free is None:
+            free = min(self._slots, key=lambda slot: slot.timestamp)
+            if timestamp < free.timestamp:
+                return None
+            self.frames_incomplete += 1
+        free.start(seq, timestamp, length, count, now)
+        return free
+
+    def read_frame(self):
+        """Return the next complete payload as a memoryview, or None once shut down."""
+        while self.running:
+            now = time.monotonic()
+            self._expire(now)
+            try:
+                n = self.sock.recv_into(self._datagram)
+            except socket.timeout:
+                if now - self._last_datagram > self.stall_timeout:
+                    raise TimeoutError(f"No datagrams for {self.stall_timeout:.0f} s")
+                continue
+            if n == 0 and not self.running:
+                return None
+            # An empty datagram counts as invalid below
+            self._last_datagram = now
+            self.datagrams_received += 1
+            if n < FRAGMENT_HEADER.size:
+                self.datagrams_invalid += 1
+                continue
+            (magic, version, codec, flags, seq, timestamp, width, height,
+             length, offset, index, count) = FRAGMENT_HEADER.unpack_from(self._datagram)
+            chunk = n - FRAGMENT_HEADER.size
+            if (magic != FRAGMENT_MAGIC or version != UDP_VERSION or index >= count
+                    or length > self.max_frame_size or offset + chunk > length):
+                self.datagrams_invalid += 1
+                continue
+            if self._is_stale(timestamp, now):
+                self.datagrams_late += 1
+                continue
+
+            slot = self._slot_for(seq, timestamp, length, count, now)
+            if slot is None:
+                self.datagrams_late += 1
+                continue
+            if slot.length != length or slot.count != count:
+                self.datagrams_invalid += 1
+                continue
+            if slot.received[index]:
+                continue
+            slot.buffer[offset:offset + chunk] = self._datagram_view[FRAGMENT_HEADER.size:n]
+            slot.received[index] = 1
+            slot.missing -= 1
+            if slot.missing:
+                continue
+
+            slot.seq = None
+            for other in self._slots:
+                if other.seq is not None and other.timestamp < timestamp:
+                    other.seq = None
+                    self.frames_incomplete += 1
+            self._last_timestamp = timestamp
+            self._last_delivery = now
+            self.frames_completed += 1
+            if self.clock_offset is None:
+                self.clock_offset = timestamp - monotonic_us()
+            self.info = FrameInfo(seq, timestamp, width, height, codec, flags)
+            return memoryview(slot.buffer)[:length]
+        return None
+
+
+class LossShim:
+    """Forwards UDP datagrams from a local port to an address, losing some.
+
+    About `loss` of the datagrams are dropped, in runs of `burst`, as a
+    congested or radio link would; `delay` seconds are added to each
+    forwarded one. Stop it with stop().
+    """
+
+    def __init__(self, listen_port, forward, loss=0.0, burst=1, delay=0.0, host='127.0.0.1', seed=None):
+        self.forward = forward
+        self.loss = loss
+        self.burst = max(1, burst)
+        self.delay = delay
+        self.forwarded = 0
+        self.dropped = 0
+        self._random = random.Random(seed)
+        self._to_drop = 0
+        self._running = True
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+        self.sock.bind((host, listen_port))
+        self.port = self.sock.getsockname()[1]
+        self.out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.out.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _lose(self):
+        if self._to_drop:
+            self._to_drop -= 1
+            return True
+        if self._random.random() < self.loss / self.burst:
+            self._to_drop = self.burst - 1
+            return True
+        return False
+
+    def _run(self):
+        buffer = bytearray(65536)
+        while self._running:
+            try:
+                n = self.sock.recv_into(buffer)
+            except OSError:
+                break
+            if n == 0 and not self._running:
+                break
+            if self._lose():
+                self.dropped += 1
+                continue
+            if self.delay:
+                time.sleep(self.delay)
+            try:
+                self.out.sendto(memoryview(buffer)[:n], self.forward)
+            except OSError:
+                continue
+            self.forwarded += 1
+
+    def stop(self):
+        self._running = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._thread.join(timeout=1.0)
+        self.sock.close()
+        self.out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forward UDP video datagrams with injected loss")
+    parser.add_argument('--listen', type=int, default=DEFAULT_UDP_PORT, help="local port the sender sends to")
+    parser.add_argument('--forward', required=True, help="viewer as HOST:PORT")
+    parser.add_argument('--loss', type=float, default=0.05, help="fraction of datagrams to drop")
+    parser.add_argument('--burst', type=int, default=1, help="datagrams lost in a row")
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds added to every datagram")
+    args = parser.parse_args()
+
+    shim = LossShim(args.listen, parse_address(args.forward, DEFAULT_UDP_PORT), args.loss, args.burst, args.delay)
+    print(f"Forwarding 127.0.0.1:{shim.port} to {args.forward}, losing {args.loss:.1%} in runs of {args.burst}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"forwarded {shim.forwarded}, dropped {shim.dropped}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shim.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Live lens undistortion with cached remap tables.
+
+cv2.undistort builds the whole distortion mapping for every frame. Here the
+mapping is built once with initUndistortRectifyMap for each (frame size,
+calibration, alpha) and every frame only goes through cv2.remap.
+"""
+import collections
+import threading
+
+import cv2
+import numpy as np
+
+CALIBRATION_FILE = 'calibration_params.npz'
+
+# Values behind the calibration spin boxes: name, minimum, maximum, decimals
+CALIBRATION_FIELDS = (
+    ('fx', 0, 100000, 2),
+    ('fy', 0, 100000, 2),
+    ('cx', 0, 100000, 2),
+    ('cy', 0, 100000, 2),
+    ('k1', -1000, 1000, 6),
+    ('k2', -1000, 1000, 6),
+    ('p1', -1000, 1000, 6),
+    ('p2', -1000, 1000, 6),
+    ('k3', -1000, 1000, 6),
+    ('alpha', 0, 1, 2),
+)
+
+
+def build_maps(camera_matrix, dist_coeffs, image_size, size, alpha, fixed_point=True):
+    """Build (map1, map2, roi) to undistort frames of `size`.
+
+    camera_matrix belongs to image_size and is rescaled to size first.
+    """
+    camera_matrix = camera_matrix.copy()
+    if size != image_size:
+        camera_matrix[0] *= size[0] / image_size[0]
+        camera_matrix[1] *= size[1] / image_size[1]
+    new_matrix, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, size, alpha, size)
+    map_type = cv2.CV_16SC2 if fixed_point else cv2.CV_32FC1
+    map1, map2 = cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, None, new_matrix, size, map_type)
+    return map1, map2, roi
+
+
+class Undistorter:
+    """Removes lens distortion from frames of any size.
+
+    The camera matrix belongs to image_size (the resolution the camera was
+    calibrated at) and is rescaled for frames of other sizes, such as the
+    reduced-resolution decodes of the receiver. When image_size is unknown
+    the first frame's size is taken as the calibration size.
+
+    Maps are fixed-point (CV_16SC2 plus an interpolation table) unless
+    fixed_point is False; they are a third of the size of float maps and
+    remap faster. The last max_maps map sets are kept, so switching between
+    a few frame sizes does not rebuild them. apply() may be called from
+    several threads.
+
+    alpha is passed to getOptimalNewCameraMatrix: 0 keeps only valid pixels,
+    1 keeps the whole source image. With crop, the result is cut to the
+    valid region as video.py did.
+
+    map_builder replaces build_maps, for example to load maps from disk.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, image_size=None, alpha=1.0, crop=True,
+                 fixed_point=True, max_maps=4, map_builder=build_maps):
+        self.image_size = image_size
+        self.crop = crop
+        self.fixed_point = fixed_point
+        self.max_maps = max_maps
+        self.map_builder = map_builder
+        self.maps_built = 0
+
+        self._lock = threading.Lock()
+        self._maps = collections.OrderedDict()
+        self._version = 0
+        self.set_params(camera_matrix, dist_coeffs, alpha)
+
+    @classmethod
+    def load(cls, path=CALIBRATION_FILE, **kwargs):
+        """Create an Undistorter from a calibration saved by video.py."""
+        with np.load(path) as data:
+            image_size = None
+            if 'image_size' in data:
+                image_size = tuple(int(v) for v in data['image_size'])
+            return cls(data['camera_matrix'], data['dist_coeffs'], image_size, **kwargs)
+
+    def set_params(self, camera_matrix, dist_coeffs, alpha=None):
+        """Replace the calibration; maps are rebuilt on the next frame."""
+        with self._lock:
+            self.camera_matrix = np.array(camera_matrix, dtype=np.float64).reshape(3, 3)
+            self.dist_coeffs = np.array(dist_coeffs, dtype=np.float64).ravel()
+            if alpha is not None:
+                self.alpha = float(alpha)
+            self._version += 1
+
+    def values(self):
+        """The calibration as a list ordered like CALIBRATION_FIELDS."""
+        k = self.camera_matrix
+        dist = np.zeros(5)
+        count = min(len(self.dist_coeffs), 5)
+        dist[:count] = self.dist_coeffs[:count]
+        return [k[0, 0], k[1, 1], k[0, 2], k[1, 2], *dist.tolist(), self.alpha]
+
+    def set_values(self, values):
+        """Inverse of values(); higher-order distortion terms are kept."""
+        fx, fy, cx, cy, k1, k2, p1, p2, k3, alpha = values
+        camera_matrix = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float64)
+        dist = self.dist_coeffs.copy()
+        if len(dist) < 5:
+            dist = np.concatenate([dist, np.zeros(5 - len(dist))])
+        dist[:5] = (k1, k2, p1, p2, k3)
+        self.set_params(camera_matrix, dist, alpha)
+
+    def _maps_for(self, size):
+        with self._lock:
+            if self.image_size is None:
+                self.image_size = size
+            key = (size, self._version, self.alpha)
+            maps = self._maps.get(key)
+            if maps is not None:
+                self._maps.move_to_end(key)
+                return maps
+            maps = self._maps[key] = self.map_builder(
+                self.camera_matrix, self.dist_coeffs, self.image_size, size, self.alpha, self.fixed_point)
+            if len(self._maps) > self.max_maps:
+                self._maps.popitem(last=False)
+            self.maps_built += 1
+            return maps
+
+    def apply(self, frame):
+        h, w = frame.shape[:2]
+        map1, map2, roi = self._maps_for((w, h))
+        undistorted = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+        x, y, roi_w, roi_h = roi
+        if self.crop and roi_w > 0 and roi_h > 0:
+            undistorted = undistorted[y:y + roi_h, x:x + roi_w]
+        return undistorted
@@ -1,20 +1,48 @@
-import numpy as np
+import argparse
+import socket
+
 import cv2
 
+from calibration_capture import ChessboardDetector, KeyframeSelector, calibrate
+from calibration_store import CalibrationStore
+
 # Задаем размер шахматной доски (количество внутренних углов)
 chessboard_size = (9, 6)
 frame_size = (640, 480)
 
-# Подготовка объектных точек, например (0,0,0), (1,0,0), (2,0,0) ..., (8,5,0)
-objp = np.zeros((chessboard_size[0] * chessboard_size[1], 3), np.float32)
-objp[:, :2] = np.mgrid[0:chessboard_size[0], 0:chessboard_size[1]].T.reshape(-1, 2)
 
-# Массивы для хранения объектных точек и точек на изображении
-objpoints = []  # 3d точки в реальном мире
-imgpoints = []  # 2d точки на изображении
+def local_address():
+    """Адрес этой машины в локальной сети, который вводят в клиенте."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # UDP connect только выбирает маршрут, пакеты не отправляются
+        sock.connect(('10.255.255.255', 1))
+        return sock.getsockname()[0]
+    except OSError:
+        return "localhost"
+    finally:
+        sock.close()
+
+
+# Под этим именем калибровка сохраняется в хранилище; клиент ищет её по адресу
+# сервера, введённому в поле подключения ("host:port" или "host"), поэтому
+# имя должно совпадать с тем, что там вводят
+parser = argparse.ArgumentParser(description="Калибровка камеры по шахматной доске")
+parser.add_argument('camera_id', nargs='?', default=None,
+                    help="адрес сервера этой камеры, как его вводят в клиенте (по умолчанию адрес этой машины)")
+parser.add_argument('--camera', type=int, default=1, help="индекс камеры для cv2.VideoCapture")
+args = parser.parse_args()
+camera_id = args.camera_id or local_address()
+store = CalibrationStore()
+print(f"Калибровка будет сохранена для адреса {camera_id}")
+
+# Поиск доски идёт в отдельном потоке на уменьшенном кадре, а для калибровки
+# сохраняются только кадры, заметно отличающиеся положением доски
+detector = ChessboardDetector(chessboard_size, KeyframeSelector(max_keyframes=40))
+detector.start()
 
 # Захват видеопотока с камеры
-cap = cv2.VideoCapture(1)  # 0 - индекс камеры, может быть изменен на другой, если подключено несколько камер
+cap = cv2.VideoCapture(args.camera)
 
 # Установка параметров камеры для увеличения фреймрейта и других настроек
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, frame_size[0])
@@ -28,19 +56,16 @@ while True:
         print("Не удалось захватить изображение с камеры.")
         break
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    # Поиск углов шахматной доски
-    ret, corners = cv2.findChessboardCorners(gray, chessboard_size, None)
-
-    # Если углы найдены, добавляем объектные точки и точки на изображении
-    if ret:
-        objpoints.append(objp)
-        imgpoints.append(corners)
+    detector.submit(img)
 
-        # Отрисовка и отображение углов
-        cv2.drawChessboardCorners(img, chessboard_size, corners, ret)
-        cv2.imshow('Chessboard', img)
+    # Отрисовка последних найденных углов поверх копии кадра
+    preview = img.copy()
+    corners = detector.last_corners
+    if corners is not None:
+        cv2.drawChessboardCorners(preview, chessboard_size, corners, True)
+    cv2.putText(preview, f"Keyframes: {len(detector.selector)}", (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    cv2.imshow('Chessboard', preview)
 
     # Выход по нажатию клавиши 'q'
     if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -49,20 +74,32 @@ while True:
 # Освобождение ресурсов
 cap.release()
 cv2.destroyAllWindows()
+detector.stop()
+detector.join()
+keyframes = detector.keyframes
 
 # Калибровка камеры
-if len(objpoints) > 0:
-    ret, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, frame_size, None, None)
+if len(keyframes) > 0:
+    # Камера может не поддерживать запрошенное разрешение, поэтому калибруем
+    # по размеру кадров, на которых детектор действительно нашёл доску
+    image_size = detector.image_size
+    rms, camera_matrix, dist_coeffs, seconds = calibrate(keyframes, chessboard_size, image_size)
+    print(f"Калибровка по {len(keyframes)} кадрам из {detector.selector.views_seen} "
+          f"заняла {seconds:.2f} с, ошибка репроекции {rms:.3f} px")
 
     # Сохранение параметров калибровки
-    np.savez('calibration_params.npz', camera_matrix=camera_matrix, dist_coeffs=dist_coeffs, rvecs=rvecs, tvecs=tvecs)
+    store.save(camera_id, image_size, camera_matrix, dist_coeffs, rms)
+    print(f"Калибровка камеры {camera_id} сохранена в {store.directory}/; "
+          f"клиент найдёт её при подключении к {camera_id}")
 
     # Пример использования параметров калибровки для исправления искажений
-    cap = cv2.VideoCapture(1)  # Снова открываем видеопоток для демонстрации исправленного изображения
+    cap = cv2.VideoCapture(args.camera)  # Снова открываем видеопоток для демонстрации исправленного изображения
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, frame_size[0])
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_size[1])
     cap.set(cv2.CAP_PROP_FPS, 30)  # Установка желаемого фреймрейта
-    
+
+    # Карты искажений строятся один раз и сохраняются рядом с калибровкой
+    undistorter = store.undistorter(camera_id, image_size, alpha=1)
 
     while True:
         ret, img = cap.read()
@@ -70,15 +107,8 @@ if len(objpoints) > 0:
             print("Не удалось захватить изображение с камеры.")
             break
 
-        h, w = img.shape[:2]
-        new_camera_matrix, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, (w, h), 1, (w, h))
-
-        # Исправление искажений
-        dst = cv2.undistort(img, camera_matrix, dist_coeffs, None, new_camera_matrix)
-
-        # Обрезка изображения
-        x, y, w, h = roi
-        dst = dst[y:y+h, x:x+w]
+        # Исправление искажений и обрезка изображения
+        dst = undistorter.apply(img)
 
         # Отображение исправленного изображения
         cv2.imshow('Undistorted Image', dst)